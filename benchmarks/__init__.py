@@ -0,0 +1,2 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
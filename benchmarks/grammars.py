@@ -0,0 +1,333 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
+
+"""
+Grammars used by the benchmarks, with generators of synthetic input of a given size
+"""
+
+
+from parx import lexer
+from parx import lexer_rules as lr
+from parx import parser
+from parx import parser_rules as pr
+
+import random
+
+
+class Grammar(object):
+    """
+    Lexer, root parser rule and input generator of a benchmark
+    """
+    def __init__(self, name, lexer_, root_rule, generate):
+        """
+        Constructor
+
+        Arguments:
+            name      - name of the grammar, as used on the command line and in the reports
+            lexer_    - lexer.Lexer object
+            root_rule - root parser rule
+            generate  - function (size, rng) -> text, where size is the approximate number of tokens and rng is a
+                        random.Random object
+
+        Raises:
+            None
+        """
+        super().__init__()
+        self.name = name
+        self.lexer = lexer_
+        self.root_rule = root_rule
+        self._generate = generate
+
+    def generate(self, size, seed=0):
+        """
+        Generate the input
+
+        The result depends only on the arguments, so that the runs are comparable
+
+        Arguments:
+            size - approximate number of tokens
+            seed - seed of the random number generator
+
+        Returns:
+            the text
+        """
+        return self._generate(size, random.Random(seed))
+
+
+class NumberToken(lexer.SimpleToken):
+    pass
+
+
+class NameToken(lexer.SimpleToken):
+    pass
+
+
+class StringToken(lexer.SimpleToken):
+    pass
+
+
+class KeywordToken(lexer.SimpleToken):
+    pass
+
+
+class PunctuationToken(lexer.SimpleToken):
+    pass
+
+
+class ValueNode(parser.Node):
+    pass
+
+
+class ListNode(parser.Node):
+    pass
+
+
+class PairNode(parser.Node):
+    pass
+
+
+class OperationNode(parser.Node):
+    pass
+
+
+def _value(token_class):
+    """
+    Rule matching any token of a class
+
+    Internal function
+    """
+    return pr.TokenSequence([lr.IgnoreValue(token_class())], NodeType=ValueNode)
+
+
+def _punctuation(string):
+    """
+    Rule matching a punctuation token
+
+    Internal function
+    """
+    return pr.TokenSequence([PunctuationToken(string)], NodeType=ValueNode)
+
+
+# Words which are keywords in some of the grammars
+_KEYWORDS = {'true', 'false', 'null'}
+
+
+def _words(rng, count):
+    """
+    Random identifiers, except for the keywords
+
+    Internal function
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyz_'
+    words = []
+    while len(words) < count:
+        word = ''.join(rng.choice(letters) for _ in range(rng.randint(1, 8)))
+        if word not in _KEYWORDS:
+            words.append(word)
+    return words
+
+
+def _arithmetic():
+    """
+    Arithmetic expressions with variables and parentheses, parsed by precedence climbing
+
+    Internal function
+    """
+    lexer_ = lexer.Lexer()
+    lexer_.add(lr.Regex(r'[ \t\n\r]+'), ignore=True)
+    lexer_.add(lr.Attach(NumberToken,      lr.Regex(r'[0-9]+')))
+    lexer_.add(lr.Attach(NameToken,        lr.Regex(r'[a-zA-Z_][a-zA-Z0-9_]*')))
+    lexer_.add(lr.Attach(PunctuationToken, lr.StringSet(['+', '-', '*', '/', '%', '(', ')'])))
+
+    operand = pr.AnyOf([], NodeType=None)
+    expression = pr.Precedence(operand, [
+        pr.Operator(PunctuationToken('+'), 10, OperationNode),
+        pr.Operator(PunctuationToken('-'), 10, OperationNode),
+        pr.Operator(PunctuationToken('*'), 20, OperationNode),
+        pr.Operator(PunctuationToken('/'), 20, OperationNode),
+        pr.Operator(PunctuationToken('%'), 20, OperationNode),
+        pr.Operator(PunctuationToken('-'), 30, OperationNode, kind=pr.PREFIX),
+    ])
+    operand.rules += [
+        _value(NumberToken),
+        _value(NameToken),
+        pr.Sequence([_punctuation('('), expression, _punctuation(')')], NodeType=ListNode),
+    ]
+
+    def generate(size, rng):
+        names = _words(rng, 64)
+        parts = []
+        count = 0
+        depth = 0
+        while True:
+            if count < size and depth < 8 and rng.random() < 0.15:
+                parts.append('(')
+                depth += 1
+                count += 1
+                continue
+            parts.append(str(rng.randint(0, 100000)) if rng.random() < 0.5 else rng.choice(names))
+            count += 1
+            while depth > 0 and (count >= size or rng.random() < 0.3):
+                parts.append(')')
+                depth -= 1
+                count += 1
+            if count >= size:
+                break
+            parts.append(rng.choice('+-*/%'))
+            count += 1
+            parts.append('\n' if rng.random() < 0.05 else ' ')
+        return ''.join(parts)
+
+    return Grammar('arithmetic', lexer_, expression, generate)
+
+
+def _greetings():
+    """
+    Lists of greetings ("Hello world Hello foo ...")
+
+    Internal function
+    """
+    lexer_ = lexer.Lexer()
+    lexer_.add(lr.Regex(r'[ \t\n\r]+'), ignore=True)
+    lexer_.add(lr.Attach(NameToken, lr.Regex(r'[a-zA-Z0-9_-]+')))
+
+    hello = pr.TokenSequence([NameToken('Hello'), lr.IgnoreValue(NameToken())], NodeType=PairNode)
+    greetings = pr.OneOrMore(hello, NodeType=ListNode)
+
+    def generate(size, rng):
+        names = _words(rng, 64)
+        return ' '.join('Hello ' + rng.choice(names) for _ in range(max(1, size // 2)))
+
+    return Grammar('greetings', lexer_, greetings, generate)
+
+
+def _json():
+    """
+    JSON documents
+
+    Internal function
+    """
+    lexer_ = lexer.Lexer()
+    lexer_.add(lr.Regex(r'[ \t\n\r]+'), ignore=True)
+    lexer_.add(lr.Attach(NumberToken,      lr.Regex(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?')))
+    lexer_.add(lr.Attach(StringToken,      lr.Regex(r'"(?:[^"\\]|\\.)*"')))
+    lexer_.add(lr.Attach(KeywordToken,     lr.StringSet(['true', 'false', 'null'])))
+    lexer_.add(lr.Attach(PunctuationToken, lr.StringSet(['{', '}', '[', ']', ':', ','])))
+
+    value = pr.AnyOf([], NodeType=None)
+    comma = _punctuation(',')
+    pair = pr.Sequence([_value(StringToken), _punctuation(':'), value], NodeType=PairNode)
+    pairs = pr.Sequence([pair, pr.Optional(pr.OneOrMore(pr.Sequence([comma, pair], NodeType=PairNode),
+                                                       NodeType=ListNode))], NodeType=ListNode)
+    items = pr.Sequence([value, pr.Optional(pr.OneOrMore(pr.Sequence([comma, value], NodeType=ListNode),
+                                                         NodeType=ListNode))], NodeType=ListNode)
+    value.rules += [
+        _value(StringToken),
+        _value(NumberToken),
+        _value(KeywordToken),
+        pr.Sequence([_punctuation('{'), pr.Optional(pairs), _punctuation('}')], NodeType=ListNode),
+        pr.Sequence([_punctuation('['), pr.Optional(items), _punctuation(']')], NodeType=ListNode),
+    ]
+
+    def generate(size, rng):
+        keys = _words(rng, 32)
+        parts = []
+        budget = [size]
+
+        def scalar():
+            choice = rng.random()
+            if choice < 0.4:
+                parts.append('"{}"'.format(rng.choice(keys)))
+            elif choice < 0.8:
+                parts.append(str(rng.randint(-1000, 1000000)) if rng.random() < 0.7 else str(rng.random()))
+            else:
+                parts.append(rng.choice(['true', 'false', 'null']))
+            budget[0] -= 1
+
+        def compound(depth):
+            is_object = rng.random() < 0.6
+            parts.append('{' if is_object else '[')
+            budget[0] -= 1
+            count = rng.randint(1, 8)
+            for index in range(count):
+                if budget[0] <= 0 and index > 0:
+                    break
+                if index > 0:
+                    parts.append(', ')
+                    budget[0] -= 1
+                if is_object:
+                    parts.append('"{}": '.format(rng.choice(keys)))
+                    budget[0] -= 2
+                if depth < 6 and budget[0] > 0 and rng.random() < 0.3:
+                    compound(depth + 1)
+                else:
+                    scalar()
+            parts.append('}' if is_object else ']')
+            budget[0] -= 1
+
+        parts.append('[')
+        while True:
+            compound(1)
+            if budget[0] <= 0:
+                break
+            parts.append(',\n')
+            budget[0] -= 1
+        parts.append(']')
+        return ''.join(parts)
+
+    return Grammar('json', lexer_, value, generate)
+
+
+def _config():
+    """
+    INI-like configuration files with sections, "key = value" lines and comments
+
+    Internal function
+    """
+    lexer_ = lexer.Lexer()
+    lexer_.add(lr.Regex(r'[ \t\n\r]+'), ignore=True)
+    lexer_.add(lr.Regex(r'#[^\n]*'), ignore=True)
+    lexer_.add(lr.Attach(NumberToken,      lr.Regex(r'[0-9]+(?:\.[0-9]+)?')))
+    lexer_.add(lr.Attach(NameToken,        lr.Regex(r'[a-zA-Z_][a-zA-Z0-9_.]*')))
+    lexer_.add(lr.Attach(StringToken,      lr.Regex(r'"[^"\n]*"')))
+    lexer_.add(lr.Attach(KeywordToken,     lr.StringSet(['true', 'false'])), priority=1)
+    lexer_.add(lr.Attach(PunctuationToken, lr.StringSet(['[', ']', '='])))
+
+    setting = pr.Sequence([
+        _value(NameToken),
+        _punctuation('='),
+        pr.AnyOf([_value(NumberToken), _value(StringToken), _value(KeywordToken), _value(NameToken)]),
+    ], NodeType=PairNode)
+    header = pr.Sequence([_punctuation('['), _value(NameToken), _punctuation(']')], NodeType=ValueNode)
+    section = pr.Sequence([header, pr.Optional(pr.OneOrMore(setting, NodeType=ListNode))], NodeType=PairNode)
+    config = pr.OneOrMore(section, NodeType=ListNode)
+
+    def generate(size, rng):
+        names = _words(rng, 128)
+        lines = []
+        count = 0
+        while count < size:
+            lines.append('[{}]'.format('.'.join(rng.choice(names) for _ in range(rng.randint(1, 3)))))
+            count += 3
+            for _ in range(rng.randint(1, 12)):
+                choice = rng.random()
+                if choice < 0.3:
+                    value = str(rng.randint(0, 65535))
+                elif choice < 0.6:
+                    value = '"{}"'.format(' '.join(rng.choice(names) for _ in range(rng.randint(1, 4))))
+                elif choice < 0.8:
+                    value = rng.choice(['true', 'false'])
+                else:
+                    value = rng.choice(names)
+                lines.append('{} = {}'.format(rng.choice(names), value))
+                count += 3
+                if rng.random() < 0.1:
+                    lines.append('# {}'.format(' '.join(_words(rng, 5))))
+            lines.append('')
+        return '\n'.join(lines)
+
+    return Grammar('config', lexer_, config, generate)
+
+
+# Grammars by name
+GRAMMARS = {grammar.name: grammar for grammar in [_arithmetic(), _greetings(), _json(), _config()]}
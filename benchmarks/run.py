@@ -0,0 +1,229 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
+
+"""
+Lexer and parser benchmarks on synthetic input of several sizes
+
+Usage: python -m benchmarks [--grammars NAME ...] [--sizes N ...] [--repeat N] [--engine ENGINE] [--json PATH]
+"""
+
+
+from parx import parser
+from parx import table_parser
+
+from . import grammars
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# Parser factories by the name of the engine
+ENGINES = {
+    'parser':  lambda: parser.Parser(),
+    'packrat': lambda: parser.Parser(memoize=True),
+    'table':   lambda: table_parser.TableParser(),
+}
+
+
+def count_nodes(node):
+    """
+    Count the nodes of an AST
+
+    Arguments:
+        node - the root node
+
+    Returns:
+        number of parser.Node objects in the tree
+    """
+    count = 0
+    stack = [node]
+    while len(stack) > 0:
+        value = stack.pop()
+        if isinstance(value, parser.Node):
+            count += 1
+            stack.append(value.value)
+        elif isinstance(value, (list, tuple, parser.TokenRange)):
+            stack.extend(value)
+    return count
+
+
+def _best_time(function, repeat):
+    """
+    Call a function several times
+
+    Internal function
+
+    Returns:
+        (seconds, result) tuple: the time of the fastest call and the result of the last one
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_case(grammar, size, *, repeat=3, engine='parser', seed=0):
+    """
+    Benchmark tokenization and parsing of a generated input
+
+    Arguments:
+        grammar - grammars.Grammar object
+        size    - approximate number of tokens
+        repeat  - number of timed runs; the fastest one is reported
+        engine  - name of the parser engine, see ENGINES
+        seed    - seed of the input generator
+
+    Returns:
+        dict with the results: sizes of the input, best times, throughput and the peak memory of a single
+        tokenization and parsing (measured by tracemalloc in a separate untimed run)
+
+    Raises:
+        see lexer.Lexer.tokenize and parser.Parser.parse
+    """
+    text = grammar.generate(size, seed)
+    parser_ = ENGINES[engine]()
+    parser_.set_root_rule(grammar.root_rule)
+
+    lex_seconds, tokens = _best_time(lambda: list(grammar.lexer.tokenize(text)), repeat)
+    parse_seconds, node = _best_time(lambda: parser_.parse(tokens), repeat)
+    nodes = count_nodes(node)
+
+    tracemalloc.start()
+    try:
+        parser_.parse(list(grammar.lexer.tokenize(text)))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'grammar': grammar.name,
+        'engine': engine,
+        'size': size,
+        'characters': len(text),
+        'tokens': len(tokens),
+        'nodes': nodes,
+        'lex_seconds': lex_seconds,
+        'parse_seconds': parse_seconds,
+        'tokens_per_second': len(tokens) / lex_seconds if lex_seconds > 0 else None,
+        'nodes_per_second': nodes / parse_seconds if parse_seconds > 0 else None,
+        'peak_bytes': peak,
+    }
+
+
+def scaling_exponent(results, key):
+    """
+    Estimate how a time grows with the size of the input
+
+    Fits seconds = c * tokens ** k by least squares on the logarithms
+
+    Arguments:
+        results - results of run_case() for the same grammar and engine
+        key     - 'lex_seconds' or 'parse_seconds'
+
+    Returns:
+        k (1 means linear time)  OR  None if there are fewer than two distinct sizes
+    """
+    points = [
+        (math.log(result['tokens']), math.log(result[key]))
+        for result in results if result['tokens'] > 0 and result[key] > 0
+    ]
+    if len({x for x, y in points}) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    variance = sum((x - mean_x) ** 2 for x, y in points)
+    return covariance / variance
+
+
+def run(names, sizes, *, repeat=3, engine='parser', seed=0, report=None):
+    """
+    Run the benchmarks
+
+    Arguments:
+        names  - names of the grammars, see grammars.GRAMMARS
+        sizes  - input sizes (approximate numbers of tokens)
+        repeat - see run_case
+        engine - see run_case
+        seed   - see run_case
+        report - function called with the result of each case as soon as it is ready, or None
+
+    Returns:
+        dict with the environment, the results of the cases and the scaling exponents of each grammar
+    """
+    results = []
+    scaling = {}
+    for name in names:
+        cases = []
+        for size in sizes:
+            result = run_case(grammars.GRAMMARS[name], size, repeat=repeat, engine=engine, seed=seed)
+            if report is not None:
+                report(result)
+            cases.append(result)
+        scaling[name] = {
+            'lex': scaling_exponent(cases, 'lex_seconds'),
+            'parse': scaling_exponent(cases, 'parse_seconds'),
+        }
+        results.extend(cases)
+    return {
+        'python': platform.python_implementation() + ' ' + platform.python_version(),
+        'platform': platform.platform(),
+        'engine': engine,
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+        'scaling': scaling,
+    }
+
+
+def _print_result(result):
+    """
+    Print a line of the human-readable report
+
+    Internal function
+    """
+    print('{:<11} {:>8} tokens {:>9.0f} tokens/s {:>9.0f} nodes/s {:>8.1f} MiB peak'.format(
+        result['grammar'],
+        result['tokens'],
+        result['tokens_per_second'] or 0,
+        result['nodes_per_second'] or 0,
+        result['peak_bytes'] / 2**20,
+    ), file=sys.stderr)
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    names = sorted(grammars.GRAMMARS)
+    arguments.add_argument('--grammars', nargs='+', choices=names, default=names, help='grammars to benchmark')
+    arguments.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                           help='approximate numbers of tokens of the inputs')
+    arguments.add_argument('--repeat', type=int, default=3, help='number of timed runs (the best one is reported)')
+    arguments.add_argument('--engine', choices=sorted(ENGINES), default='parser', help='parser to use')
+    arguments.add_argument('--seed', type=int, default=0, help='seed of the input generators')
+    arguments.add_argument('--json', metavar='PATH', help='write the results as JSON to this file ("-" for stdout)')
+    options = arguments.parse_args(argv)
+
+    summary = run(options.grammars, options.sizes, repeat=options.repeat, engine=options.engine,
+                  seed=options.seed, report=_print_result)
+    for name, exponents in summary['scaling'].items():
+        if exponents['lex'] is not None:
+            print('{:<11} scaling: lex ~ n^{:.2f}, parse ~ n^{:.2f}'.format(
+                name, exponents['lex'], exponents['parse'],
+            ), file=sys.stderr)
+
+    if options.json == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    elif options.json is not None:
+        with open(options.json, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,119 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
+
+"""
+Memory and construction time of slotted tokens and nodes compared to the same classes with __dict__
+
+Usage: python -m benchmarks.slots [--count N] [--repeat N]
+"""
+
+
+from parx import lexer
+from parx import parser
+from parx import posinfo
+
+import argparse
+import time
+import tracemalloc
+
+
+class _DictToken(object):
+    """
+    SimpleToken without __slots__
+
+    Internal class
+    """
+    def __init__(self, content=None, pi=None):
+        self._posinfo = pi
+        self.content = str(content)
+
+
+class _DictPosinfo(object):
+    """
+    Posinfo without __slots__
+
+    Internal class
+    """
+    def __init__(self, row, col):
+        self.row = row
+        self.col = col
+
+
+class _DictNode(object):
+    """
+    Node without __slots__
+
+    Internal class
+    """
+    def __init__(self, value=None, pi=None):
+        self.value = value
+        self._posinfo = pi
+
+
+class NameToken(lexer.SimpleToken):
+    __slots__ = ()
+
+
+class NameNode(parser.Node):
+    __slots__ = ()
+
+
+def _build(token_class, posinfo_class, node_class, count):
+    """
+    Build a token stream of the given size with a node per token, as the lexer and the parser would
+
+    Internal function
+    """
+    nodes = []
+    for index in range(count):
+        token = token_class('name', posinfo_class(index // 80 + 1, index % 80 + 1))
+        nodes.append(node_class(token, pi=token._posinfo))
+    return nodes
+
+
+def _measure(token_class, posinfo_class, node_class, count, repeat):
+    """
+    Measure the best construction time and the peak memory of _build()
+
+    Internal function
+
+    Returns:
+        (seconds, bytes) tuple
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _build(token_class, posinfo_class, node_class, count)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        nodes = _build(token_class, posinfo_class, node_class, count)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del nodes
+    return best, peak
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arguments.add_argument('--count', type=int, default=1000000, help='number of tokens')
+    arguments.add_argument('--repeat', type=int, default=3, help='number of timed runs (the best one is shown)')
+    options = arguments.parse_args(argv)
+
+    variants = [
+        ('__dict__', _DictToken, _DictPosinfo, _DictNode),
+        ('__slots__', NameToken, posinfo.Posinfo, NameNode),
+    ]
+    print('{} tokens, a node and a Posinfo per token'.format(options.count))
+    for name, token_class, posinfo_class, node_class in variants:
+        seconds, peak = _measure(token_class, posinfo_class, node_class, options.count, options.repeat)
+        print('{:<10} {:8.3f} s {:10.1f} MiB {:8.1f} bytes/token'.format(
+            name, seconds, peak / 2**20, peak / options.count,
+        ))
+
+
+if __name__ == '__main__':
+    main()
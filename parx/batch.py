@@ -0,0 +1,150 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
+
+
+from . import lexer
+from . import parser
+
+import concurrent.futures
+import os
+
+
+class Grammar(object):
+    """
+    Lexer and root parser rule bundled together, so that they can be sent to other processes
+
+    The lexer rules, the parser rules and the token and node classes they use must be picklable (e.g. classes
+    must be defined at the top level of a module)
+    """
+    def __init__(self, lexer_, root_rule, **parser_options):
+        """
+        Constructor
+
+        Arguments:
+            lexer_         - lexer.Lexer object
+            root_rule      - root parser rule (an instance of parser.Rule)
+            parser_options - keyword arguments for parser.Parser.__init__
+
+        Raises:
+            None
+        """
+        super().__init__()
+        self.lexer = lexer_
+        self.root_rule = root_rule
+        self.parser_options = parser_options
+        self._parser = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # The parser is recreated by each process
+        state['_parser'] = None
+        return state
+
+    def parse(self, text):
+        """
+        Tokenize and parse a text
+
+        Arguments:
+            text - source code
+
+        Returns:
+            the root node of the AST
+
+        Raises:
+            see lexer.Lexer.tokenize and parser.Parser.parse
+        """
+        if self._parser is None:
+            self._parser = parser.Parser(**self.parser_options)
+            self._parser.set_root_rule(self.root_rule)
+        return self._parser.parse(self.lexer.tokenize(text))
+
+
+class Result(object):
+    """
+    Result of parsing of a single source by parse_many()
+    """
+    def __init__(self, source, node, error):
+        """
+        Constructor
+
+        Arguments:
+            source - the source, as passed to parse_many()
+            node   - the root node of the AST, or None if the parsing failed
+            error  - the exception raised by the lexer or the parser (a lexer.LexerError or parser.ParserError
+                     object), or None if the parsing succeeded
+        """
+        self.source = source
+        self.node = node
+        self.error = error
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, {!r})'.format(self.__class__.__name__, self.source, self.node, self.error)
+
+
+# Grammar of a worker process of parse_many, see _init_worker
+_worker_grammar = None
+
+
+def _init_worker(grammar):
+    """
+    Initialize a worker process of parse_many
+
+    Internal function
+    """
+    global _worker_grammar
+    _worker_grammar = grammar
+
+
+def _parse_source(task):
+    """
+    Parse a single source in a worker process of parse_many
+
+    Internal function
+
+    Arguments:
+        task - (source, encoding) tuple
+
+    Returns:
+        (node, error) tuple
+    """
+    source, encoding = task
+    if isinstance(source, os.PathLike):
+        with open(source, encoding=encoding) as f:
+            text = f.read()
+    else:
+        text = source
+    try:
+        return _worker_grammar.parse(text), None
+    except (lexer.LexerError, parser.ParserError) as error:
+        return None, error
+
+
+def parse_many(grammar, sources, *, workers=None, chunksize=16, encoding='utf-8'):
+    """
+    Parse many sources using a pool of worker processes
+
+    The grammar is sent to each worker once, and the sources are sent in chunks, so that the overhead per source
+    is small even if the sources are small
+
+    Arguments:
+        grammar   - Grammar object
+        sources   - iterable of sources: paths (os.PathLike objects, e.g. pathlib.Path) of files to read in the
+                    workers, or strings to parse as is
+        workers   - number of worker processes. None means the number of processors
+        chunksize - number of sources sent to a worker at once
+        encoding  - encoding of the files
+
+    Returns:
+        list of Result objects, in the order of the sources. Lexer and parser errors are reported in the results
+
+    Raises:
+        OSError if some file cannot be read
+    """
+    sources = list(sources)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(grammar,),
+    ) as executor:
+        results = executor.map(_parse_source, [(source, encoding) for source in sources], chunksize=chunksize)
+        return [Result(source, node, error) for source, (node, error) in zip(sources, results)]
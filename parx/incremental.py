@@ -0,0 +1,686 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
+
+
+from . import lexer
+from . import parser
+from . import parser_rules
+from . import posinfo
+
+import bisect
+
+
+class _Offsets(object):
+    """
+    Sorted offsets in a sequence which is edited (the text or the token list of a Document)
+
+    Internal class. The offsets before the gap (an index in self.values) are stored as they are, and the offsets
+    after it are stored relative to the end of the sequence. An edit at the gap does not change the distance from
+    the end of the sequence to the offsets after it, so they do not have to be updated. Moving the gap takes time
+    proportional to the number of offsets it is moved over, so a series of edits close to each other is fast
+    """
+    def __init__(self):
+        """
+        Constructor
+
+        Arguments:
+            None
+
+        Raises:
+            None
+        """
+        super().__init__()
+        self.values = []
+        self.gap = 0
+
+    def get(self, index, size):
+        """
+        Return an offset
+
+        Arguments:
+            index - index of the offset
+            size  - size of the sequence
+
+        Returns:
+            the offset
+        """
+        value = self.values[index]
+        return value if index < self.gap else value + size
+
+    def bisect_left(self, value, size):
+        """
+        Return the index of the first offset greater than or equal to the value
+
+        Arguments:
+            value - the value
+            size  - size of the sequence
+
+        Returns:
+            the index
+        """
+        values = self.values
+        gap = self.gap
+        if gap > 0 and values[gap - 1] >= value:
+            return bisect.bisect_left(values, value, 0, gap)
+        return bisect.bisect_left(values, value - size, gap)
+
+    def bisect_right(self, value, size):
+        """
+        Return the index of the first offset greater than the value
+
+        Arguments:
+            value - the value
+            size  - size of the sequence
+
+        Returns:
+            the index
+        """
+        values = self.values
+        gap = self.gap
+        if gap > 0 and values[gap - 1] > value:
+            return bisect.bisect_right(values, value, 0, gap)
+        return bisect.bisect_right(values, value - size, gap)
+
+    def move_gap(self, index, size):
+        """
+        Move the gap
+
+        Arguments:
+            index - new index of the gap
+            size  - size of the sequence
+
+        Returns:
+            None
+        """
+        values = self.values
+        if index < self.gap:
+            values[index:self.gap] = map((-size).__add__, values[index:self.gap])
+        else:
+            values[self.gap:index] = map(size.__add__, values[self.gap:index])
+        self.gap = index
+
+    def replace(self, first, end, values, size):
+        """
+        Replace the offsets of an edited part of the sequence
+
+        The offsets after the part stay in place, so the gap is moved to the end of the part and then right
+        after the new offsets
+
+        Arguments:
+            first  - index of the first replaced offset
+            end    - index past the last replaced offset
+            values - new offsets, counted in the edited sequence
+            size   - size of the sequence before the edit
+
+        Returns:
+            None
+        """
+        self.move_gap(end, size)
+        self.values[first:end] = values
+        self.gap = first + len(values)
+
+
+class _Text(object):
+    """
+    State of the text of a Document shared by the positions of its tokens
+
+    Internal class
+    """
+
+    __slots__ = ('lines', 'size', 'version')
+
+    def __init__(self, lines, size):
+        """
+        Constructor
+
+        Arguments:
+            lines - posinfo.LineIndex object for the text
+            size  - length of the text
+
+        Raises:
+            None
+        """
+        self.lines = lines
+        self.size = size
+        # Incremented by each edit, which invalidates the rows and columns computed before it
+        self.version = 0
+
+
+class _Span(posinfo.Span):
+    """
+    Position of a token of a Document
+
+    Internal class. Like the offsets of the document (see _Offsets), the offsets of the tokens after the gap are
+    stored relative to the end of the text, so the edits before them do not update them. Row and column are
+    computed again when requested after an edit
+    """
+
+    __slots__ = ('_text', '_start', '_end', '_relative', '_version')
+
+    def __init__(self, text, start, end):
+        """
+        Constructor
+
+        Arguments:
+            text  - _Text object of the document
+            start - offset of the first character
+            end   - offset past the last character
+
+        Raises:
+            None
+        """
+        self._text = text
+        self._version = text.version
+        super().__init__(text.lines, start, end)
+
+    @property
+    def start(self):
+        return self._start + self._text.size if self._relative else self._start
+
+    @start.setter
+    def start(self, value):
+        self._start = value
+        self._relative = False
+
+    @property
+    def end(self):
+        return self._end + self._text.size if self._relative else self._end
+
+    @end.setter
+    def end(self, value):
+        self._end = value
+        self._relative = False
+
+    def position(self):
+        """
+        see posinfo.Span.position
+        """
+        text = self._text
+        if self._position is None or self._version != text.version:
+            self._position = text.lines.position(self.start)
+            self._version = text.version
+        return self._position
+
+    def __reduce__(self):
+        # Pickled positions do not follow the edits
+        return posinfo.Span, (None, self.start, self.end, self.position())
+
+
+class _TrackedTokens(object):
+    """
+    Token list recording the largest offset accessed by the rules
+
+    Internal class
+    """
+    def __init__(self, tokens, memo):
+        """
+        Constructor
+
+        Arguments:
+            tokens - list of tokens. It is not copied
+            memo   - _ReachMemo object
+        """
+        super().__init__()
+        self.tokens = tokens
+        self.memo = memo
+        self.reach = -1
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            last = (len(self.tokens) if index.stop is None else index.stop) - 1
+        else:
+            last = index
+        if last > self.reach:
+            self.reach = last
+        return self.tokens[index]
+
+
+class _ReachMemo(parser.Memo):
+    """
+    Packrat cache recording the largest offset each result depends on
+
+    Internal class. A result can be reused after an edit if no token up to this offset changed
+    """
+    def __init__(self):
+        super().__init__()
+        # offset -> {rule -> largest offset accessed while matching the rule}
+        self.reach = {}
+
+    def match(self, rule, tokens, offset):
+        """
+        see parser.Memo.match
+        """
+        outer = tokens.reach
+        tokens.reach = -1
+        try:
+            return super().match(rule, tokens, offset)
+        finally:
+            reaches = self.reach.setdefault(offset, {})
+            # If the result was taken from the cache, no tokens were accessed
+            reach = max(tokens.reach, reaches.get(rule, -1))
+            reaches[rule] = reach
+            tokens.reach = max(outer, reach)
+
+
+class Document(object):
+    """
+    Source code which is tokenized and parsed again after each edit, reusing as much of the previous work as
+    possible
+
+    After an edit, tokenization restarts at the first token which may be affected by the edit and stops as soon
+    as the new tokens line up with the old ones again; the following tokens are reused.
+
+    If the root rule is a OneOrMore (e.g. a list of statements or definitions), the matches of its sub-rule (the
+    items) are kept, each with the packrat cache of its matching. After an edit, the items which read the changed
+    tokens are matched again, taking the results which do not depend on these tokens from their caches, until
+    a new item ends where an old one started; the following items are reused. Other root rules are matched again
+    as a single item.
+
+    Offsets after the last edit are stored relative to the end of the text (and of the token list), so an edit
+    does not update the tokens and the items after it, and rows and columns of the tokens are computed when
+    requested. So the time of an edit depends on the size of the items around it and on the distance from the
+    previous edit rather than on the size of the document, except for copying the text and the lists of the
+    tokens and of the items, and for shifting the line starts (see posinfo.LineIndex.edit)
+
+    Rules are assumed to examine only the tokens at and after the offset they are matched at, and lexer rules
+    to examine at most one character past their matches
+    """
+    def __init__(self, lexer_, parser_, text):
+        """
+        Constructor
+
+        Tokenizes and parses the text
+
+        Arguments:
+            lexer_  - lexer.Lexer object
+            parser_ - parser.Parser object. Its root rule must be set
+            text    - source code (a string)
+
+        Raises:
+            see lexer.Lexer.tokenize and parser.Parser.parse
+        """
+        super().__init__()
+        self.lexer = lexer_
+        self.parser = parser_
+        self.text = text
+        root = parser_.root_rule
+        parser.prepare(root)
+        # Rule matched by the items, and whether it is repeated
+        self._repeated = type(root) is parser_rules.OneOrMore
+        self._item_rule = root.rule if self._repeated else root
+        self._invalidate()
+        self.tree = None
+        self.tree = self._parse(*self._tokenize(0, 0, 0))
+
+    def edit(self, offset, removed, inserted):
+        """
+        Replace a piece of the source code, and tokenize and parse it again
+
+        Arguments:
+            offset   - offset of the piece
+            removed  - length of the piece
+            inserted - the text to put instead of it
+
+        Returns:
+            the new AST (also available as self.tree). The nodes which did not change are shared with the
+            previous AST, and the tokens are shared by all of them: their positions change after the edits
+
+        Raises:
+            see lexer.Lexer.tokenize and parser.Parser.parse. The document is left in the edited state (with
+            self.tree set to None); if the tokenization failed, the next edit tokenizes it from scratch
+
+        Complexity:
+            tokenizing and matching the items around the edit, plus moving the gap from the previous edit (see
+            the class description)
+        """
+        self.text = self.text[:offset] + inserted + self.text[offset + removed:]
+        self.lines.edit(self.text, offset, removed, inserted)
+        self.tree = None
+        try:
+            changed = self._tokenize(offset, removed, len(inserted) - removed)
+        except lexer.LexerError:
+            self._invalidate()
+            raise
+        self.tree = self._parse(*changed)
+        return self.tree
+
+    def _invalidate(self):
+        """
+        Forget the tokens and the items, so that they are built from scratch
+
+        Internal method
+        """
+        self.lines = posinfo.LineIndex(self.text)
+        self._text = _Text(self.lines, len(self.text))
+        # All lexemes, including the ignored ones
+        self._starts = _Offsets()
+        self._ends = _Offsets()
+        # Tokens which are not ignored, and their start offsets
+        self.tokens = []
+        self._token_starts = _Offsets()
+        self._forget_items()
+
+    def _forget_items(self):
+        """
+        Forget the items, so that they are matched from scratch
+
+        Internal method
+        """
+        # Token offsets of the items, and their lengths, reaches (relative to the starts), nodes and caches
+        self._item_starts = _Offsets()
+        self._item_lengths = []
+        self._item_reaches = []
+        self._item_nodes = []
+        self._item_caches = []
+        # Reach of the failed matching after the items, relative to their end. None means that nothing was matched
+        self._tail_reach = None
+        # Largest number of tokens an item read past its end
+        self._lookahead = 0
+        self.memo = _ReachMemo()
+
+    def _tokenize(self, offset, removed, delta):
+        """
+        Tokenize the edited text again
+
+        Internal method
+
+        Arguments:
+            offset  - offset of the edit
+            removed - length of the removed text
+            delta   - change of the length of the text
+
+        Returns:
+            (first, end, new_end) tuple: the tokens from `first` to `end` were replaced with the tokens from
+            `first` to `new_end`
+        """
+        size = self._text.size
+        starts = self._starts
+        ends = self._ends
+        count = len(starts.values)
+
+        # The first lexeme which may be affected: a lexeme ending right at the edit may be extended by it
+        first = ends.bisect_left(offset, size)
+        if first < count:
+            restart = starts.get(first, size)
+        else:
+            restart = ends.get(count - 1, size) if count > 0 else 0
+        restart = min(restart, offset)
+
+        new_starts = []
+        new_ends = []
+        tokens = []
+        token_starts = []
+        # Index of the first old lexeme reused as is
+        old = first
+        resynced = False
+        for start, length, token, ignore in self.lexer.scan(self.text, restart, lines=self.lines):
+            while old < count and starts.get(old, size) + delta < start:
+                old += 1
+            if old < count and starts.get(old, size) >= offset + removed and starts.get(old, size) + delta == start:
+                resynced = True
+                break
+            new_starts.append(start)
+            new_ends.append(start + length)
+            if not ignore:
+                token._posinfo = _Span(self._text, start, start + length)
+                tokens.append(token)
+                token_starts.append(start)
+        if not resynced:
+            old = count
+
+        first_token = self._token_starts.bisect_left(restart, size)
+        if old < count:
+            end_token = self._token_starts.bisect_left(starts.get(old, size), size)
+        else:
+            end_token = len(self.tokens)
+        starts.replace(first, old, new_starts, size)
+        ends.replace(first, old, new_ends, size)
+        self._move_token_gap(end_token, size)
+        self.tokens[first_token:end_token] = tokens
+        self._token_starts.replace(first_token, end_token, token_starts, size)
+        self._text.size = len(self.text)
+        self._text.version += 1
+        self.relexed = len(tokens)
+        return first_token, end_token, first_token + len(tokens)
+
+    def _move_token_gap(self, index, size):
+        """
+        Move the gap of the token offsets, together with the gap of the positions of the tokens
+
+        Internal method
+
+        Arguments:
+            index - new index of the gap
+            size  - length of the text
+        """
+        gap = self._token_starts.gap
+        for token in self.tokens[index:gap]:
+            span = token._posinfo
+            span._start -= size
+            span._end -= size
+            span._relative = True
+        for token in self.tokens[gap:index]:
+            span = token._posinfo
+            span._start += size
+            span._end += size
+            span._relative = False
+        self._token_starts.move_gap(index, size)
+
+    def _parse(self, first, end, new_end):
+        """
+        Match the items affected by replacing some tokens again
+
+        Internal method
+
+        Arguments:
+            first, end, new_end - see _tokenize()
+
+        Returns:
+            the root node
+
+        Raises:
+            see parser.Parser.parse
+        """
+        count = len(self.tokens)
+        old_count = count - (new_end - end)
+        item_starts = self._item_starts
+        items = len(item_starts.values)
+        # The items starting after the replaced tokens keep their offsets relative to the end
+        reused = item_starts.bisect_left(end, old_count)
+        item_starts.move_gap(reused, old_count)
+
+        # The first affected item: the items before it did not read the replaced tokens
+        region = item_starts.bisect_right(first, count)
+        index = region - 1
+        while index >= 0:
+            start = item_starts.get(index, count)
+            if start + self._item_lengths[index] - 1 + self._lookahead < first:
+                break
+            if start + self._item_reaches[index] >= first:
+                region = index
+            index -= 1
+        items_end = self._items_end(items, count)
+        if region == items and self._tail_reach is not None and items_end + self._tail_reach < first:
+            # Neither the items nor the failed matching after them read the replaced tokens
+            return self._finish()
+
+        try:
+            self._match_items(region, reused, first, end, new_end, count, old_count)
+        except Exception:
+            self._forget_items()
+            raise
+        return self._finish()
+
+    def _items_end(self, items, count):
+        """
+        Return the offset past the first items
+
+        Internal method
+
+        Arguments:
+            items - number of the items
+            count - number of the tokens
+
+        Returns:
+            the offset
+        """
+        if items == 0:
+            return 0
+        return self._item_starts.get(items - 1, count) + self._item_lengths[items - 1]
+
+    def _match_items(self, region, reused, first, end, new_end, count, old_count):
+        """
+        Match the items starting with an affected one, until they line up with the old ones
+
+        Internal method
+
+        Arguments:
+            region              - index of the first affected item
+            reused              - index of the first item starting after the replaced tokens
+            first, end, new_end - see _tokenize()
+            count               - number of the tokens
+            old_count           - number of the tokens before the edit
+        """
+        item_starts = self._item_starts
+        items = len(item_starts.values)
+        memo = _ReachMemo()
+        tokens = _TrackedTokens(self.tokens, memo)
+        offset = self._items_end(region, count)
+        starts = []
+        lengths = []
+        reaches = []
+        nodes = []
+        # Index of the next old item: its cache is added to the memo before the matching reaches it
+        old = region
+        seeded = region
+        while True:
+            while old < items and (old < reused or item_starts.get(old, count) < offset):
+                old += 1
+            if old < items and item_starts.get(old, count) == offset and offset >= new_end:
+                # The items line up with the old ones again
+                break
+            while seeded <= old and seeded < items:
+                self._seed(memo, seeded, reused, first, end, new_end - end, count, old_count)
+                seeded += 1
+            tokens.reach = -1
+            length, node = parser.match(self._item_rule, tokens, offset)
+            if length <= 0 or node is None:
+                self._tail_reach = tokens.reach - offset
+                old = items
+                break
+            starts.append(offset)
+            lengths.append(length)
+            reaches.append(tokens.reach - offset)
+            nodes.append(node)
+            self._lookahead = max(self._lookahead, tokens.reach - (offset + length - 1))
+            offset += length
+            if not self._repeated:
+                self._tail_reach = -1
+                old = items
+                break
+
+        caches = self._split_cache(memo, starts, lengths, reaches)
+        item_starts.replace(region, old, starts, count)
+        self._item_lengths[region:old] = lengths
+        self._item_reaches[region:old] = reaches
+        self._item_nodes[region:old] = nodes
+        self._item_caches[region:old] = caches
+        self.memo = memo
+
+    def _seed(self, memo, index, reused, first, end, delta, count, old_count):
+        """
+        Add the results from the cache of an old item which do not depend on the replaced tokens to the memo
+
+        Internal method
+
+        Arguments:
+            memo       - _ReachMemo object
+            index      - index of the item
+            reused     - see _match_items()
+            first, end - see _tokenize()
+            delta      - change of the number of the tokens
+            count      - number of the tokens
+            old_count  - number of the tokens before the edit
+        """
+        table, reach = self._item_caches[index]
+        if index >= reused:
+            # After the replaced tokens: all the results are kept
+            start = self._item_starts.get(index, count)
+            for offset, entries in table.items():
+                memo.table[start + offset] = dict(entries)
+                memo.reach[start + offset] = {rule: value + start for rule, value in reach[offset].items()}
+            return
+        start = self._item_starts.get(index, old_count)
+        for offset, entries in table.items():
+            reaches = reach[offset]
+            if start + offset >= end:
+                memo.table[start + offset + delta] = dict(entries)
+                memo.reach[start + offset + delta] = {
+                    rule: value + start + delta for rule, value in reaches.items()
+                }
+                continue
+            kept = {rule: result for rule, result in entries.items() if start + reaches[rule] < first}
+            if len(kept) > 0:
+                memo.table[start + offset] = kept
+                memo.reach[start + offset] = {rule: start + reaches[rule] for rule in kept}
+
+    def _split_cache(self, memo, starts, lengths, reaches):
+        """
+        Distribute the results of the memo among the matched items
+
+        Internal method. The results reaching past the reach of their item are dropped: they are not checked
+        when the tokens after the item change
+
+        Arguments:
+            memo    - _ReachMemo object
+            starts  - offsets of the items
+            lengths - their lengths
+            reaches - their reaches, relative to the starts
+
+        Returns:
+            list of (table, reach) tuples with offsets relative to the starts of the items, see _ReachMemo
+        """
+        caches = [({}, {}) for _ in starts]
+        for offset, entries in memo.table.items():
+            index = bisect.bisect_right(starts, offset) - 1
+            if index < 0 or offset >= starts[index] + lengths[index]:
+                continue
+            start = starts[index]
+            limit = start + reaches[index]
+            reaches_at = memo.reach.get(offset, {})
+            kept = {
+                rule: result for rule, result in entries.items()
+                if type(result) is not parser._Seed and reaches_at.get(rule, limit + 1) <= limit
+            }
+            if len(kept) > 0:
+                table, reach = caches[index]
+                table[offset - start] = kept
+                reach[offset - start] = {rule: reaches_at[rule] - start for rule in kept}
+        return caches
+
+    def _finish(self):
+        """
+        Build the root node from the items
+
+        Internal method
+
+        Returns:
+            the root node
+
+        Raises:
+            parser.IncompleteError if the items do not cover all the tokens
+        """
+        nodes = self._item_nodes
+        if len(nodes) == 0:
+            node = None
+        elif self._repeated:
+            node = self.parser.root_rule.NodeType(list(nodes), pi=nodes[0]._posinfo)
+        else:
+            node = nodes[0]
+        length = self._items_end(len(nodes), len(self.tokens))
+        if length < len(self.tokens):
+            raise parser.IncompleteError(self.tokens[length])
+        return node
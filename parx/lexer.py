@@ -4,8 +4,67 @@
 
 from . import posinfo
 
+from array import array
+import codecs
+import concurrent.futures
+import mmap
+import os
 import re
-import copy
+import time
+import weakref
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    # Python < 3.11
+    import sre_parse, sre_constants
+
+
+# Categories of regular expressions matching any non-ASCII byte
+_NEGATED_CATEGORIES = {
+    sre_constants.CATEGORY_NOT_DIGIT,
+    sre_constants.CATEGORY_NOT_SPACE,
+    sre_constants.CATEGORY_NOT_WORD,
+    sre_constants.CATEGORY_NOT_LINEBREAK,
+}
+
+
+def _matches_non_ascii(items):
+    """
+    Check whether the parsed regular expression can match a non-ASCII byte
+
+    Internal function. Over input in a multibyte encoding such expressions may match a part of a character
+
+    Arguments:
+        items - sequence of (opcode, argument) tuples produced by sre_parse
+
+    Returns:
+        bool
+    """
+    for op, av in items:
+        if op is sre_constants.ANY or op is sre_constants.NOT_LITERAL:
+            return True
+        elif op is sre_constants.LITERAL:
+            if av >= 0x80:
+                return True
+        elif op is sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op is sre_constants.NEGATE:
+                    return True
+                elif item_op is sre_constants.LITERAL and item_av >= 0x80:
+                    return True
+                elif item_op is sre_constants.RANGE and item_av[1] >= 0x80:
+                    return True
+                elif item_op is sre_constants.CATEGORY and item_av in _NEGATED_CATEGORIES:
+                    return True
+        elif isinstance(av, (tuple, list)):
+            # Nested expressions: groups, repetitions, alternatives, assertions
+            for value in av:
+                values = value if isinstance(value, list) else [value]
+                for nested in values:
+                    if isinstance(nested, sre_parse.SubPattern) and _matches_non_ascii(nested):
+                        return True
+    return False
 
 
 class LexerError(Exception):
@@ -32,6 +91,10 @@ class NoMatchingTokenError(LexerError):
         self.data   = data
         self.offset = offset
 
+    def __reduce__(self):
+        # Exceptions are pickled with their args by default, which are not set by the constructor
+        return self.__class__, (self.data, self.offset)
+
 
 class AmbiguousTokenError(LexerError):
     """
@@ -50,6 +113,10 @@ class AmbiguousTokenError(LexerError):
         self.data   = data
         self.offset = offset
 
+    def __reduce__(self):
+        # Exceptions are pickled with their args by default, which are not set by the constructor
+        return self.__class__, (self.data, self.offset)
+
 
 class Rule(object):
     """
@@ -112,7 +179,8 @@ class Rule(object):
             data   - string input
             offset - offset in `data`
             length - value returned from self.get_length(), guaranted to be positive
-            pi     - Posinfo object representing the position of the token in the source file
+            pi     - object representing the position of the token in the source file. Lexer passes immutable
+                     posinfo.Span objects, so the token may keep a reference to it without copying
 
         Returns:
             the matching Token object. This method in derived classes should not return None
@@ -124,7 +192,108 @@ class Rule(object):
             The same as self.TokenType.__init__ raises, but this method in derived classes can raise
             other exceptions
         """
-        return self.get_token_type()(data[offset : offset+length], pi=copy.deepcopy(pi))
+        return self.get_token_type()(data[offset : offset+length], pi=pi)
+
+    def get_pattern(self):
+        """
+        Return a regular expression equivalent to this rule
+
+        The expression must match exactly the same strings as self.get_length() does, i.e. for any
+        input `re.compile(pattern).match(data, offset)` should span self.get_length(data, offset) characters.
+        It is used by compiled lexers (see Lexer.__init__) to fuse several rules into a single regular
+        expression. The expression must not contain named groups or backreferences
+
+        Override this method if your rule can be expressed as a regular expression
+
+        Arguments:
+            None
+
+        Returns:
+            the expression (string)  OR  None if the rule cannot be expressed as a regular expression
+
+        Raises:
+            None, and this method in the derived classes should not raise any exceptions
+        """
+        return None
+
+    def get_encoded_pattern(self, encoding):
+        """
+        Return a regular expression matching the encoded forms of the strings this rule matches
+
+        It is used to match the rule against encoded input without decoding it (see Lexer.tokenize).
+        The default version encodes the expression returned by self.get_pattern() if it consists of ASCII
+        characters only. Expressions with other characters cannot be converted that simply: for example,
+        a multibyte character in a character class would be split into separate bytes. Note that in
+        expressions over bytes character classes such as \\w only match ASCII characters.
+        For multibyte encodings (e.g. 'utf-8') expressions which can match a non-ASCII byte, such as '.',
+        '[^ ]' or '\\W', are rejected too, since they could match a part of a character
+
+        Arguments:
+            encoding - ASCII-compatible encoding of the input
+
+        Returns:
+            the expression (bytes)  OR  None if the rule cannot be matched against encoded input
+
+        Raises:
+            None, and this method in the derived classes should not raise any exceptions
+        """
+        pattern = self.get_pattern()
+        if isinstance(pattern, bytes):
+            # The rule already matches bytes
+            return pattern
+        if pattern is None or not pattern.isascii():
+            return None
+        if codecs.lookup(encoding).name not in posinfo.LineIndex.SINGLE_BYTE_ENCODINGS:
+            try:
+                if _matches_non_ascii(sre_parse.parse(pattern)):
+                    return None
+            except re.error:
+                return None
+        return pattern.encode('ascii')
+
+    def get_first_chars(self):
+        """
+        Return the set of characters a match of this rule can start with
+
+        Lexer uses this set to try only the rules which can possibly match at the current position.
+        The set may contain extra characters, but it must not miss any
+
+        Override this method if the set can be computed for your rule
+
+        Arguments:
+            None
+
+        Returns:
+            frozenset of characters  OR  None if the set cannot be computed (the rule will be tried everywhere)
+
+        Raises:
+            None, and this method in the derived classes should not raise any exceptions
+        """
+        return None
+
+    def get_token_kind(self, data, offset, length):
+        """
+        Return the kind code of the token self.make_token() would return, if the token can be re-created from it
+
+        Used by Lexer.tokenize_array to store tokens without creating them. A kind code may be returned only if
+        the token is equal to `token_kinds[kind](data[offset : offset + length], pi=pi)`
+
+        Default version returns the kind of self.get_token_type() unless self.make_token() is overridden
+
+        Arguments:
+            data   - string input
+            offset - offset in `data`
+            length - value returned from self.get_length(), guaranted to be positive
+
+        Returns:
+            kind code (see Token._kind_code)  OR  None if the token has to be created by self.make_token()
+
+        Raises:
+            None
+        """
+        if type(self).make_token is not Rule.make_token:
+            return None
+        return self.get_token_type()._kind_code
 
     def get_token_type(self):
         """
@@ -145,16 +314,66 @@ class Rule(object):
         return SimpleToken
 
 
+# Token classes by their kind codes, see Token._kind_code. The classes are referenced weakly, so that classes
+# created dynamically can be garbage collected; their codes are reused then
+token_kinds = weakref.WeakValueDictionary()
+
+# Codes of the collected classes, and the number of codes ever assigned
+_free_kind_codes = []
+_kind_code_count = 0
+
+
+def _register_kind(cls):
+    """
+    Assign a kind code to a token class
+
+    Internal function
+
+    Arguments:
+        cls - the class
+
+    Returns:
+        the code
+    """
+    global _kind_code_count
+    if len(_free_kind_codes) > 0:
+        code = _free_kind_codes.pop()
+    else:
+        code = _kind_code_count
+        _kind_code_count += 1
+    token_kinds[code] = cls
+    weakref.finalize(cls, _free_kind_codes.append, code).atexit = False
+    return code
+
+
 class Token(object):
     """
     A class representing an abstract token
+
+    Token classes of this library declare __slots__, so their objects have no __dict__ and take less memory.
+    Subclasses get a __dict__ as usual unless they declare __slots__ too (e.g. `__slots__ = ()` if they add no
+    attributes)
     """
+
+    __slots__ = ('_posinfo',)
+
+    # Small integer identifying the class of the token. Each subclass gets its own code when it is defined, so
+    # comparing kinds is the same as comparing classes, and the codes may index tables (see token_kinds).
+    # The codes depend on the order in which the classes are defined, so they must not be sent to other processes.
+    # Codes of garbage collected classes are given to new ones, so the codes stay small
+    _kind_code = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._kind_code = _register_kind(cls)
+
     def __init__(self, pi=None):
         """
         Constructor
 
         Arguments:
-            pi - posinfo.Posinfo object describing the position of this token in the source file
+            pi - object describing the position of this token in the source file (posinfo.Posinfo,
+                 posinfo.Position or posinfo.Span)
 
         Raises:
             None
@@ -192,6 +411,9 @@ class Token(object):
         return not (self == other)
 
 
+_register_kind(Token)
+
+
 class SimpleToken(Token):
     """
     Simple token holding only the string passed as an argument to __init__ method
@@ -201,25 +423,36 @@ class SimpleToken(Token):
         class MyToken(SimpleToken):
             pass
 
+    Add `__slots__ = ()` to such classes to keep their objects as small as SimpleToken objects (see Token)
+
     Arguments:
         (see Token.__init__)
         content - a string forming the token
     """
+
+    __slots__ = ('content',)
+
     def __init__(self, content=None, pi=None):
         """
         Constructor
 
         Arguments:
-            content - string to hold
-            pi      - posinfo.Posinfo object representing the position of this token in the source file
+            content - string to hold. Bytes are held as is
+            pi      - object representing the position of this token in the source file (see Token.__init__)
 
         Raises:
             None
         """
         super().__init__(pi)
-        self.content = str(content)
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            # Token read from bytes input by a bytes rule
+            self.content = bytes(content)
+        else:
+            self.content = str(content)
         
     def __str__(self):
+        if isinstance(self.content, bytes):
+            return self.content.decode('ascii', 'backslashreplace')
         return self.content
 
     def __eq__(self, other):
@@ -229,18 +462,670 @@ class SimpleToken(Token):
         return super().is_identical(other) and self.content == other.content
 
 
+class _FusedRules(object):
+    """
+    Several lexer rules fused into a single regular expression
+
+    Internal class. Each rule is wrapped into an optional lookahead with its own capturing group, so that a single
+    call to re.match() finds the longest match of every rule at the given offset. Rules which cannot be expressed
+    as a regular expression (see Rule.get_pattern) are left as is and have to be tried one by one
+    """
+
+    def __init__(self, specs):
+        """
+        Constructor
+
+        Arguments:
+            specs - token specifications (see Lexer.add)
+
+        Raises:
+            None
+        """
+        fusable = []
+        self.unfused = []
+        for spec in specs:
+            pattern = spec['rule'].get_pattern()
+            if pattern is None:
+                self.unfused.append(spec)
+            else:
+                fusable.append((spec, pattern))
+
+        self.groups = []
+        self.regex = self._compile(fusable)
+        if self.regex is None:
+            # Some of the patterns don't get along with the others. Find them and match them one by one
+            valid = []
+            for spec, pattern in fusable:
+                if self._compile([(spec, pattern)]) is None:
+                    self.unfused.append(spec)
+                else:
+                    valid.append((spec, pattern))
+            fusable = valid
+            self.regex = self._compile(fusable)
+            if self.regex is None:
+                self.unfused = list(specs)
+                return
+        self.groups = [
+            (self.regex.groupindex['_parx{}'.format(i)], spec['priority'], spec)
+            for i, (spec, pattern) in enumerate(fusable)
+        ]
+
+    @staticmethod
+    def _compile(fusable):
+        """
+        Compile the fused regular expression
+
+        Arguments:
+            fusable - list of (spec, pattern) tuples
+
+        Returns:
+            compiled expression  OR  None if it cannot be compiled
+        """
+        if len(fusable) == 0:
+            return None
+        try:
+            if isinstance(fusable[0][1], bytes):
+                parts = [b'(?:(?=(?P<_parx%d>%s)))?' % (i, pattern) for i, (spec, pattern) in enumerate(fusable)]
+                return re.compile(b''.join(parts))
+            else:
+                parts = ['(?:(?=(?P<_parx%d>%s)))?' % (i, pattern) for i, (spec, pattern) in enumerate(fusable)]
+                return re.compile(''.join(parts))
+        except (re.error, TypeError):
+            return None
+
+    def find_matches(self, data, offset):
+        """
+        Find matches of the fused rules
+
+        Arguments:
+            data   - string input
+            offset - offset in `data`
+
+        Returns:
+            list of (length, priority, spec) tuples, one for each matching fused rule
+        """
+        if self.regex is None:
+            return []
+        # Every part of the expression is optional, so the match always succeeds
+        spans = self.regex.match(data, offset).regs
+        matches = []
+        for group, priority, spec in self.groups:
+            start, end = spans[group]
+            if end > start:
+                matches.append((end - start, priority, spec))
+        return matches
+
+
+class _EncodedRule(Rule):
+    """
+    Adapter matching a rule against encoded input (bytes, mmap objects, etc.)
+
+    Internal class. The rule is matched by its regular expression (see Rule.get_encoded_pattern), and the matching
+    bytes are decoded before they are passed to the make_token() method of the original rule
+    """
+
+    def __init__(self, rule, encoding):
+        """
+        Constructor
+
+        Arguments:
+            rule     - original rule
+            encoding - encoding of the input
+
+        Raises:
+            LexerError if the rule cannot be matched against encoded input
+        """
+        super().__init__()
+        self.rule = rule
+        self.encoding = encoding
+        self.pattern = rule.get_encoded_pattern(encoding)
+        if self.pattern is None:
+            raise LexerError('Rule {!r} cannot match {}-encoded input'.format(rule, encoding))
+        self.regex = re.compile(self.pattern)
+        # Bytes rules match the input as is, and their tokens are made of bytes as without the encoding
+        self.is_bytes = isinstance(rule.get_pattern(), bytes)
+
+    def get_length(self, data, offset):
+        match = self.regex.match(data, offset)
+        if match is None:
+            return 0
+        return match.end() - offset
+
+    def make_token(self, data, offset, length, pi):
+        if self.is_bytes:
+            return self.rule.make_token(data, offset, length, pi)
+        try:
+            content = bytes(data[offset : offset + length]).decode(self.encoding)
+        except UnicodeDecodeError:
+            # The match ends in the middle of a character (possible only with custom encoded patterns)
+            return None
+        return self.rule.make_token(content, 0, len(content), pi)
+
+    def get_pattern(self):
+        return self.pattern
+
+    def get_first_chars(self):
+        first_chars = self.rule.get_first_chars()
+        if first_chars is None:
+            return None
+        first_bytes = set()
+        for char in first_chars:
+            if type(char) is int:
+                # First bytes of a bytes rule
+                first_bytes.add(char)
+                continue
+            try:
+                first_bytes.add(char.encode(self.encoding)[0])
+            except UnicodeEncodeError:
+                # The character cannot occur in the input at all
+                pass
+        return frozenset(first_bytes)
+
+
+class TokenArray(object):
+    """
+    Compact columnar store of tokens
+
+    Tokens are stored as their kind codes (see Token._kind_code) and offsets in the source, in arrays, which takes 18
+    bytes per token. Token objects are created on demand when the array is indexed, so they are equal but not
+    identical to each other. Tokens which cannot be re-created from their kinds and contents (see
+    Rule.get_token_kind) are stored as objects
+
+    Rules may also examine the kinds and contents of the tokens without creating them (see kinds and content())
+    """
+    def __init__(self, source, lines=None):
+        """
+        Constructor
+
+        Arguments:
+            source - the input the tokens were read from
+            lines  - posinfo.LineIndex object for the source. None means create one
+
+        Raises:
+            None
+        """
+        super().__init__()
+        self.source = source
+        self.lines = posinfo.LineIndex(source) if lines is None else lines
+        self.kinds = array('H')
+        self.starts = array('q')
+        self.ends = array('q')
+        # index -> token, for the tokens stored as objects
+        self.objects = {}
+        # kind code -> token class, for the kinds present. Keeps the classes alive, so that the codes stay valid
+        self.classes = {}
+        # Packrat cache, see parser.Parser.__init__
+        self.memo = None
+
+    def append(self, kind, start, end, token=None):
+        """
+        Add a token
+
+        Arguments:
+            kind  - kind code of the token
+            start - offset of the token in the source
+            end   - offset past the end of the token
+            token - the token object, if it cannot be re-created from the kind and the content
+
+        Returns:
+            None
+
+        Raises:
+            OverflowError if the kind code does not fit into 16 bits (more than 65536 token classes exist)
+        """
+        if kind not in self.classes:
+            if kind > 0xFFFF:
+                raise OverflowError('Kind code {} does not fit into a TokenArray: too many token classes'.format(kind))
+            self.classes[kind] = token_kinds[kind]
+        if token is not None:
+            self.objects[len(self.kinds)] = token
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def with_memo(self, memo):
+        """
+        Return an array sharing the tokens with this one and carrying the packrat cache
+
+        The views in the nodes refer to this array (the `base` attribute of the result) rather than to the result,
+        so that the nodes do not keep the cache alive
+
+        Arguments:
+            memo - parser.Memo object
+
+        Returns:
+            TokenArray object
+        """
+        other = TokenArray.__new__(TokenArray)
+        other.__dict__.update(self.__dict__)
+        other.memo = memo
+        other.base = self
+        return other
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # Kind codes differ between processes (see Token._kind_code), so the classes are pickled instead: the codes
+        # are replaced with indices in the list of the classes present
+        codes = sorted(self.classes)
+        indices = {code: index for index, code in enumerate(codes)}
+        state['kinds'] = ([self.classes[code] for code in codes], array('H', [indices[code] for code in self.kinds]))
+        del state['classes']
+        return state
+
+    def __setstate__(self, state):
+        classes, indices = state['kinds']
+        codes = [cls._kind_code for cls in classes]
+        state['kinds'] = array('H', [codes[index] for index in indices])
+        state['classes'] = {cls._kind_code: cls for cls in classes}
+        self.__dict__.update(state)
+
+    def content(self, index):
+        """
+        Return the content of a token without creating it
+
+        Arguments:
+            index - index of the token
+
+        Returns:
+            the content (see SimpleToken)
+
+        Raises:
+            IndexError if the index is out of range
+        """
+        token = self.objects.get(index)
+        if token is not None:
+            return token.content
+        return self.source[self.starts[index] : self.ends[index]]
+
+    def span(self, index):
+        """
+        Return the position of a token without creating it
+
+        Arguments:
+            index - index of the token
+
+        Returns:
+            posinfo.Span object
+
+        Raises:
+            IndexError if the index is out of range
+        """
+        return posinfo.Span(self.lines, self.starts[index], self.ends[index])
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        token = self.objects.get(index)
+        if token is not None:
+            return token
+        start = self.starts[index]
+        end = self.ends[index]
+        return self.classes[self.kinds[index]](self.source[start : end], pi=posinfo.Span(self.lines, start, end))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+# State of a worker process of Lexer.tokenize_parallel: (lexer, rule table, {id(spec) -> index of spec})
+_worker_state = None
+
+
+def _init_worker(lexer, encoding):
+    """
+    Initialize a worker process of Lexer.tokenize_parallel
+
+    Internal function
+
+    Arguments:
+        lexer    - the Lexer object
+        encoding - encoding of the input, see Lexer.tokenize
+    """
+    global _worker_state
+    # Statistics collected by the copy of the lexer would be lost
+    lexer.profile = None
+    table = lexer._table if encoding is None else lexer._get_encoded_table(encoding)
+    _worker_state = (lexer, table, {id(spec): index for index, spec in enumerate(table.specs)})
+
+
+def _tokenize_segment(segment):
+    """
+    Tokenize a segment of the input in a worker process of Lexer.tokenize_parallel
+
+    Internal function. Only the rules and the offsets of the tokens are sent back, the tokens are constructed by
+    the parent process
+
+    Arguments:
+        segment - the segment
+
+    Returns:
+        tuple: (
+            array of the indices of the specs of the tokens which are not ignored,
+            array of the offsets of these tokens in the segment,
+            array of their lengths,
+            None, or (error class, offset in the segment) if the tokenization failed
+        )
+    """
+    lexer, table, indices = _worker_state
+    specs = array('l')
+    offsets = array('q')
+    lengths = array('q')
+    offset = 0
+    try:
+        while offset < len(segment):
+            length, token = lexer._next_token(table, segment, offset, None)
+            if not token['spec']['ignore']:
+                specs.append(indices[id(token['spec'])])
+                offsets.append(offset)
+                lengths.append(length)
+            offset += length
+    except (NoMatchingTokenError, AmbiguousTokenError) as error:
+        return specs, offsets, lengths, (type(error), offset)
+    return specs, offsets, lengths, None
+
+
+class RuleStats(object):
+    """
+    Statistics of a token specification collected while profiling (see Lexer.enable_profiling)
+
+    Attributes:
+        index             - position of the token specification in Lexer.token_specs
+        spec              - the token specification (see Lexer.add)
+        attempts          - number of calls of Rule.get_length
+        matches           - number of these calls which found a match
+        get_length_time   - total time spent in Rule.get_length, in seconds
+        make_token_time   - total time spent in Rule.make_token, in seconds
+        wins              - number of tokens produced by the rule
+        rejected          - number of matches for which Rule.make_token returned None
+        lost_to_length    - number of matches discarded because another rule found a longer match
+        lost_to_priority  - number of matches discarded because another rule with the same length of the match
+                            had a higher priority
+    """
+    def __init__(self, index, spec):
+        """
+        Constructor
+
+        Arguments:
+            index - position of the token specification in Lexer.token_specs
+            spec  - the token specification
+
+        Raises:
+            None
+        """
+        self.index = index
+        self.spec = spec
+        self.attempts = 0
+        self.matches = 0
+        self.get_length_time = 0.0
+        self.make_token_time = 0.0
+        self.wins = 0
+        self.rejected = 0
+        self.lost_to_length = 0
+        self.lost_to_priority = 0
+
+    @property
+    def rule(self):
+        return self.spec['rule']
+
+    @property
+    def total_time(self):
+        return self.get_length_time + self.make_token_time
+
+    def __repr__(self):
+        return '{}({}, {!r}, attempts={}, matches={}, wins={}, time={:.6f})'.format(
+            self.__class__.__name__, self.index, self.rule, self.attempts, self.matches, self.wins, self.total_time,
+        )
+
+
+class LexerProfile(object):
+    """
+    Per-rule statistics of a lexer, see Lexer.enable_profiling
+
+    Iterating over the profile yields RuleStats objects in the order in which the rules were added to the lexer
+    """
+    def __init__(self, lexer):
+        """
+        Constructor
+
+        Arguments:
+            lexer - the Lexer object
+
+        Raises:
+            None
+        """
+        super().__init__()
+        self._lexer = lexer
+        self.rules = []
+        # Number of tokens (including the ignored ones) and errors
+        self.tokens = 0
+        self.errors = 0
+        # id(table) -> (table, {id(spec) -> RuleStats}), see _get_stats
+        self._tables = {}
+
+    def reset(self):
+        """
+        Clear the statistics
+
+        Arguments:
+            None
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.rules = []
+        self.tokens = 0
+        self.errors = 0
+        self._tables = {}
+
+    def _get_stats(self, table):
+        """
+        Get the statistics of the specs of a rule table
+
+        Internal method. Specs of the tables for encoded input (see Lexer._get_encoded_table) are copies of the
+        specs of the lexer, so they are matched by their positions
+
+        Arguments:
+            table - _RuleTable object
+
+        Returns:
+            dict mapping id(spec) to RuleStats objects
+        """
+        specs = self._lexer.token_specs
+        while len(self.rules) < len(specs):
+            self.rules.append(RuleStats(len(self.rules), specs[len(self.rules)]))
+        entry = self._tables.get(id(table))
+        if entry is None or len(entry[1]) != len(table.specs):
+            entry = (table, {id(spec): self.rules[index] for index, spec in enumerate(table.specs)})
+            self._tables[id(table)] = entry
+        return entry[1]
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __getitem__(self, index):
+        return self.rules[index]
+
+    def sorted(self, key='total_time'):
+        """
+        Get the statistics sorted in descending order
+
+        Arguments:
+            key - name of the RuleStats attribute to sort by
+
+        Returns:
+            list of RuleStats objects
+        """
+        return sorted(self.rules, key=lambda stats: getattr(stats, key), reverse=True)
+
+    def __str__(self):
+        """
+        Table of the statistics, the most expensive rules first
+        """
+        lines = ['{:>4} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10} {:>10}  {}'.format(
+            'spec', 'attempts', 'matches', 'wins', 'length', 'priority', 'get_length', 'make_token', 'rule',
+        )]
+        for stats in self.sorted():
+            lines.append('{:>4} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10.6f} {:>10.6f}  {!r}'.format(
+                stats.index, stats.attempts, stats.matches, stats.wins, stats.lost_to_length, stats.lost_to_priority,
+                stats.get_length_time, stats.make_token_time, stats.rule,
+            ))
+        return '\n'.join(lines)
+
+
+class _RuleTable(object):
+    """
+    Token specifications prepared for matching
+
+    Internal class. Rules are indexed by the first character they can match (see Rule.get_first_chars).
+    If the table is compiled, the rules of each index entry are fused (see _FusedRules)
+    """
+
+    def __init__(self, compiled):
+        """
+        Constructor
+
+        Arguments:
+            compiled - whether to fuse the rules
+
+        Raises:
+            None
+        """
+        self.compiled = compiled
+        # All specs, in the order of addition
+        self.specs = []
+        # First character -> specs of the rules which can match starting with it.
+        # Rules with unknown first characters are in every list and in self.fallback_specs
+        self.first_char_index = {}
+        self.fallback_specs = []
+        # First character (None for self.fallback_specs) -> _FusedRules object (only for compiled tables)
+        self.fused = {}
+
+    def add(self, spec):
+        """
+        Add a token specification
+
+        Arguments:
+            spec - token specification (see Lexer.add)
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.fused = {}
+        self.specs.append(spec)
+
+        first_chars = spec['rule'].get_first_chars()
+        if first_chars is None:
+            self.fallback_specs.append(spec)
+            for specs in self.first_char_index.values():
+                specs.append(spec)
+        else:
+            for char in first_chars:
+                if char not in self.first_char_index:
+                    self.first_char_index[char] = list(self.fallback_specs)
+                self.first_char_index[char].append(spec)
+
+    def find_matches(self, data, offset):
+        """
+        Find all rules matching at the given offset
+
+        Arguments:
+            data   - input
+            offset - current offset
+
+        Returns:
+            list of (length, priority, spec) tuples, one for each matching rule
+        """
+        # Only try the rules which can start with the current character
+        char = data[offset]
+        specs = self.first_char_index.get(char)
+        if specs is None:
+            char = None
+            specs = self.fallback_specs
+
+        if self.compiled:
+            fused = self.fused.get(char)
+            if fused is None:
+                fused = self.fused[char] = _FusedRules(specs)
+            matches = fused.find_matches(data, offset)
+            specs = fused.unfused
+        else:
+            matches = []
+
+        for spec in specs:
+            length = spec['rule'].get_length(data, offset)
+            if length > 0:
+                matches.append((length, spec['priority'], spec))
+        return matches
+
+    def find_matches_profiled(self, data, offset, stats):
+        """
+        Find all rules matching at the given offset, recording the statistics of the rules
+
+        Rules are always tried one by one, even if the table is compiled, so that time of each rule is known
+
+        Arguments:
+            data   - input
+            offset - current offset
+            stats  - dict mapping id(spec) to RuleStats objects, see LexerProfile._get_stats
+
+        Returns:
+            see find_matches
+        """
+        specs = self.first_char_index.get(data[offset])
+        if specs is None:
+            specs = self.fallback_specs
+
+        clock = time.perf_counter
+        matches = []
+        for spec in specs:
+            rule_stats = stats[id(spec)]
+            start = clock()
+            length = spec['rule'].get_length(data, offset)
+            rule_stats.get_length_time += clock() - start
+            rule_stats.attempts += 1
+            if length > 0:
+                rule_stats.matches += 1
+                matches.append((length, spec['priority'], spec))
+        return matches
+
+
 class Lexer(object):
     """
     A class for converting string input into a sequnce of tokens
     """
 
-    def __init__(self):
+    def __init__(self, *, compiled=False):
         """
         Constructor
+
+        Arguments:
+            compiled - if true, all rules which can be expressed as a regular expression (see Rule.get_pattern),
+                       such as lexer_rules.String and lexer_rules.Regex, are fused into a single regular expression
+                       and tried by one call to re.match() instead of one call per rule. Longest match, priority
+                       and ignore semantics are not affected
         """
         super().__init__()
         self.token_specs = []
-        self.posinfo = None
+        self.compiled = compiled
+        self._table = _RuleTable(compiled)
+        # Encoding -> _RuleTable of the rules adapted to encoded input. Built on demand
+        self._encoded_tables = {}
+        # LexerProfile object while profiling is enabled
+        self.profile = None
 
     def add(self, rule, *, priority=0, ignore=False):
         """
@@ -258,41 +1143,366 @@ class Lexer(object):
         Raises:
             None
         """
-        self.token_specs.append({'rule': rule, 'ignore': ignore, 'priority': priority})
+        spec = {'rule': rule, 'ignore': ignore, 'priority': priority}
+        self.token_specs.append(spec)
+        self._table.add(spec)
+        self._encoded_tables = {}
 
-    def tokenize(self, data):
+    def tokenize(self, data, *, encoding=None):
         """
         Convert string input into a sequnce of tokens
 
+        Besides strings, bytes input (bytes, bytearray, mmap.mmap objects, etc.) is accepted in two modes:
+
+        - If `encoding` is None, the rules are matched against the bytes as is. They should be bytes rules
+          (e.g. lexer_rules.String(b'GET') or lexer_rules.Regex(rb'[0-9]+')), and contents of the resulting
+          SimpleToken objects are bytes
+        - Otherwise, the input is treated as encoded text, and string rules are matched directly against it
+          without decoding it as a whole: each rule is converted to a regular expression over bytes (see
+          Rule.get_encoded_pattern), and only the contents of the tokens are decoded
+
+        Memory-mapped files can be tokenized this way without reading them into memory, see also tokenize_file()
+
         Arguments:
-            data - string input
+            data     - string or bytes input
+            encoding - encoding of bytes input, or None to match bytes rules against it. Must be ASCII-compatible
+                       (e.g. 'ascii', 'utf-8' or 'latin-1')
 
         Yields:
-            Current token, if not ignored
+            Current token, if not ignored. Positions of the tokens are posinfo.Span objects: tokens store only
+            their offsets, rows and columns are computed on demand. For bytes input, offsets are counted in bytes.
+            Columns are counted in characters if the encoding is specified and in bytes otherwise
 
         Raises:
             NoMatchingTokenError if no matching token was found
             AmbiguousTokenError  if multiple tokens with same length match
+            LexerError           if some rule cannot be matched against encoded input
         """
-        self.posinfo = posinfo.Posinfo(1, 1)
+        if encoding is None:
+            table = self._table
+        else:
+            table = self._get_encoded_table(encoding)
+        lines = posinfo.LineIndex(data, encoding)
+
         offset = 0
         while offset < len(data):
             # While not EOF
-            length, token = self._next_token(data, offset)
-            self.posinfo.feed(data, offset, offset + length)
+            length, token = self._next_token(table, data, offset, lines)
             if not token['spec']['ignore']:
                 yield token['token']
             offset += length
-    
-    def _next_token(self, data, offset):
+
+    def tokenize_array(self, data):
+        """
+        Convert input into a TokenArray
+
+        Unlike tokenize(), token objects are not created for the rules which report kind codes of their tokens
+        (see Rule.get_token_kind). Encoded input is not supported
+
+        Arguments:
+            data - string or bytes input, see tokenize()
+
+        Returns:
+            TokenArray object
+
+        Raises:
+            see tokenize()
+        """
+        table = self._table
+        lines = posinfo.LineIndex(data)
+        tokens = TokenArray(data, lines)
+
+        offset = 0
+        while offset < len(data):
+            # The same as _next_token(), except that tokens are created only when needed
+            matches = table.find_matches(data, offset)
+            matches.sort(key = lambda match: match[0:2])
+            best = None
+            while len(matches) > 0:
+                length, priority, spec = matches.pop()
+                if best is not None and best[0:2] != (length, priority):
+                    break
+                rule = spec['rule']
+                kind = rule.get_token_kind(data, offset, length)
+                token_obj = None
+                if kind is None:
+                    token_obj = rule.make_token(data, offset, length, posinfo.Span(lines, offset, offset + length))
+                    if token_obj is None:
+                        continue
+                    kind = token_obj._kind_code
+                if best is not None:
+                    raise AmbiguousTokenError(data=data, offset=offset)
+                best = (length, priority, spec, kind, token_obj)
+
+            if best is None:
+                raise NoMatchingTokenError(data=data, offset=offset)
+            length, priority, spec, kind, token_obj = best
+            if not spec['ignore']:
+                tokens.append(kind, offset, offset + length, token_obj)
+            offset += length
+        return tokens
+
+    def scan(self, data, offset=0, *, lines=None):
+        """
+        Convert string input into a sequence of lexemes, including the ignored ones
+
+        Unlike tokenize(), the tokenization can start at any offset (which must be at a token boundary) and
+        stopped at any time, which allows to tokenize only a part of the input again after an edit
+
+        Arguments:
+            data   - string input
+            offset - offset to start at
+            lines  - posinfo.LineIndex object for `data` to use in positions of the tokens. None means create one
+
+        Yields:
+            (offset, length, token, ignore) tuples
+
+        Raises:
+            see tokenize()
+        """
+        if lines is None:
+            lines = posinfo.LineIndex(data)
+        while offset < len(data):
+            length, token = self._next_token(self._table, data, offset, lines)
+            yield offset, length, token['token'], token['spec']['ignore']
+            offset += length
+
+    def tokenize_parallel(self, data, split, *, encoding=None, workers=None, segment_size=1 << 20):
+        """
+        Convert a large input into a sequence of tokens using several processes
+
+        The input is cut into segments at safe boundaries: offsets at which a token always starts (e.g. newlines
+        outside of multi-line tokens). The segments are tokenized by a pool of worker processes, and the tokens
+        are stitched together in order, with their positions relative to the whole input. The lexer is sent to
+        each worker once, so its rules (and token classes) must be picklable
+
+        Arguments:
+            data         - string or bytes input, see tokenize(). Must be picklable (e.g. not an mmap.mmap object)
+            split        - regular expression (a string, bytes or compiled pattern) whose matches end at safe
+                           boundaries, or a function (data, offset) -> offset of the first safe boundary at or
+                           after the offset (or None if there is none)
+            encoding     - encoding of bytes input, see tokenize()
+            workers      - number of worker processes. None means the number of processors
+            segment_size - approximate size of a segment. Segments end at the first safe boundary after this size
+
+        Yields:
+            see tokenize()
+
+        Raises:
+            see tokenize(). Errors are raised after all tokens before the error are yielded
+        """
+        table = self._table if encoding is None else self._get_encoded_table(encoding)
+        lines = posinfo.LineIndex(data, encoding)
+        if not callable(split):
+            regex = re.compile(split)
+            def split(data, offset):
+                match = regex.search(data, offset)
+                return None if match is None else match.end()
+
+        bounds = []
+        start = 0
+        while start < len(data):
+            end = start + segment_size
+            if end < len(data):
+                end = split(data, end)
+            if end is None or end > len(data):
+                end = len(data)
+            bounds.append((start, end))
+            start = end
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self, encoding),
+        )
+        try:
+            results = executor.map(_tokenize_segment, [data[start : end] for start, end in bounds])
+            for (start, end), (specs, offsets, lengths, error) in zip(bounds, results):
+                for index, offset, length in zip(specs, offsets, lengths):
+                    offset += start
+                    pi = posinfo.Span(lines, offset, offset + length)
+                    yield table.specs[index]['rule'].make_token(data, offset, length, pi)
+                if error is not None:
+                    error_class, offset = error
+                    raise error_class(data=data, offset=start + offset)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def tokenize_file(self, path, *, encoding='utf-8'):
+        """
+        Memory-map a file and convert its contents into a sequence of tokens
+
+        The file is matched in place (see tokenize()), so its contents are never read into memory as a whole;
+        the OS pages it in as needed. The mapping is kept alive by the tokens referring to it
+
+        Arguments:
+            path     - path to the file
+            encoding - encoding of the file, or None to match bytes rules against it (see tokenize())
+
+        Yields:
+            see tokenize()
+
+        Raises:
+            see tokenize(), and OSError if the file cannot be opened or mapped
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files cannot be mapped
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        yield from self.tokenize(data, encoding=encoding)
+
+    def tokenize_stream(self, fileobj, chunk_size=65536):
+        """
+        Convert input read from a file object into a sequence of tokens
+
+        Unlike tokenize(), this method does not need the whole input to be in memory. The input is read in
+        chunks, and only the part which is not tokenized yet is kept. A match is only accepted if there is more
+        input after it, so that a token straddling chunk boundaries is matched again when the rest of it
+        is read. At least `chunk_size` characters after the current position are always available to rules,
+        which should be enough for rules looking ahead past the end of their matches. If no rule matches them,
+        the error is raised without reading the rest of the input, so tokens which only match when complete
+        (e.g. strings matched by '"[^"]*"') must not be longer than `chunk_size`
+
+        Arguments:
+            fileobj    - file object (any object with a read(size) method). Binary files are tokenized by bytes
+                         rules, see tokenize()
+            chunk_size - number of characters (or bytes) to read at once
+
+        Yields:
+            Current token, if not ignored. Positions of the tokens are posinfo.Span objects with offsets counted
+            from the start of the input and precomputed rows and columns
+
+        Raises:
+            NoMatchingTokenError if no matching token was found. Its `data` attribute holds only the buffered
+                                 part of the input, and `offset` is relative to it
+            AmbiguousTokenError  if multiple tokens with same length match
+        """
+        buffer = None
+        base = 0            # offset of buffer[0] in the input
+        offset = 0          # current offset in the buffer
+        position = posinfo.Position(1, 1)
+        eof = False
+        need_more = False
+        while True:
+            if not eof and (need_more or buffer is None or len(buffer) - offset < chunk_size):
+                chunk = fileobj.read(chunk_size)
+                if buffer is None:
+                    # The type of the buffer (str or bytes) depends on the file mode
+                    buffer = chunk[:0]
+                if len(chunk) == 0:
+                    eof = True
+                else:
+                    # Drop the consumed part of the buffer
+                    buffer = buffer[offset:] + chunk
+                    base += offset
+                    offset = 0
+                need_more = False
+                continue
+
+            if offset >= len(buffer):
+                # EOF
+                break
+
+            try:
+                length, token = self._next_token(self._table, buffer, offset, None, base, position)
+            except LexerError:
+                if eof or len(buffer) - offset >= chunk_size:
+                    # Rules have seen `chunk_size` characters, reading more would only buffer the rest of the input
+                    raise
+                # The token may be incomplete
+                need_more = True
+                continue
+
+            if offset + length == len(buffer) and not eof:
+                # The token may continue in the next chunk
+                need_more = True
+                continue
+
+            if not token['spec']['ignore']:
+                yield token['token']
+            position = position.advanced(buffer, offset, offset + length)
+            offset += length
+
+    def enable_profiling(self):
+        """
+        Start collecting statistics of the rules
+
+        While profiling is enabled, each tokenization (except for tokenize_array() and tokenize_parallel())
+        records for each token specification the number of attempts to match it and of matches, the time spent
+        in its get_length() and make_token() methods, and how often its matches were discarded in favor of
+        longer matches or matches with higher priority. This helps to find expensive rules and rules which are
+        worth reordering or merging.
+
+        Rules are matched one by one when profiling, even if the lexer is compiled, so that the time can be
+        attributed to them; this makes the tokenization slower. When profiling is disabled, the only overhead is
+        one attribute check per token
+
+        Arguments:
+            None
+
+        Returns:
+            new LexerProfile object. Also available as self.profile
+
+        Raises:
+            None
+        """
+        self.profile = LexerProfile(self)
+        return self.profile
+
+    def disable_profiling(self):
+        """
+        Stop collecting statistics of the rules
+
+        Arguments:
+            None
+
+        Returns:
+            the LexerProfile object with the collected statistics, or None if profiling was not enabled
+
+        Raises:
+            None
+        """
+        profile = self.profile
+        self.profile = None
+        return profile
+
+    def _get_encoded_table(self, encoding):
+        """
+        Get the table of the rules adapted to encoded input
+
+        Internal method
+
+        Arguments:
+            encoding - encoding of the input
+
+        Returns:
+            _RuleTable object
+
+        Raises:
+            LexerError if some rule cannot be matched against encoded input
+        """
+        table = self._encoded_tables.get(encoding)
+        if table is None:
+            table = _RuleTable(self.compiled)
+            for spec in self.token_specs:
+                table.add(dict(spec, rule=_EncodedRule(spec['rule'], encoding)))
+            self._encoded_tables[encoding] = table
+        return table
+
+    def _next_token(self, table, data, offset, lines, base=0, position=None):
         """
         Get the next token
 
         Internal method
 
         Arguments:
-            data   - string input
-            offset - current offset
+            table    - _RuleTable object to use
+            data     - input
+            offset   - current offset
+            lines    - posinfo.LineIndex object for `data`, or None if `position` is specified
+            base     - offset of data[0] in the whole input
+            position - posinfo.Position of data[offset], if already known
 
         Returns:
             tuple: (
@@ -307,46 +1517,92 @@ class Lexer(object):
             NoMatchingTokenError if no matching token was found
             AmbiguousTokenError  if multiple tokens with same length and priority match
         """
-        
-        matches = []
+        if self.profile is not None:
+            return self._next_token_profiled(table, data, offset, lines, base, position)
+
+        matches = table.find_matches(data, offset)
 
-        for spec in self.token_specs:
-            rule = spec['rule']
-            priority = spec['priority']
-            length, token_obj = rule.match(data, offset, self.posinfo)
-            if length <= 0 or token_obj is None:
+        # Choose the longest matching token (or the one with the highest priority if multiple tokens have the
+        # same length). Tokens are only constructed for the best matches, not for every matching rule.
+
+        # Sort by (length, priority) tuple. [0:2] slice corresponds to such tuple
+        matches.sort(key = lambda match: match[0:2])
+
+        best = None
+        while len(matches) > 0:
+            length, priority, spec = matches.pop()
+            if best is not None and best[0:2] != (length, priority):
+                # All the remaining matches are shorter or have lower priority
+                break
+            pi = posinfo.Span(lines, base + offset, base + offset + length, position)
+            token_obj = spec['rule'].make_token(data, offset, length, pi)
+            if token_obj is None:
+                # Rule.make_token() returning None is accepted as absence of match
                 continue
-            matches.append((length, priority, token_obj, spec))
+            if best is not None:
+                # Two longest matches have the same length and priority, the matching is ambiguous
+                raise AmbiguousTokenError(data=data, offset=offset)
+            best = (length, priority, spec, token_obj)
 
         # If nothing was found, raise NoMatchingTokenError
-        if len(matches) == 0:
+        if best is None:
             raise NoMatchingTokenError(data=data, offset=offset)
 
-        # If only one matching token was found, return it
-        if len(matches) == 1:
-            length, priority, token_obj, spec = matches[0]
-            return length, {'spec': spec, 'token': token_obj}
+        length, priority, spec, token_obj = best
+        return length, {'spec': spec, 'token': token_obj}
 
-        # If multiple matching tokens were found, choose the longest matching (or with the highest priority if
-        # multiple tokens have the same length).
+    def _next_token_profiled(self, table, data, offset, lines, base=0, position=None):
+        """
+        Get the next token, recording the statistics of the rules in self.profile
 
-        # Firstly, we sort the resulting list. It is needed to find two longest tokens (see below).
-        # It could have been done more efficiently (a) manually, iterating through the list and maintaining
-        # two maximal values or (b) using heapq module. However, first method isn't pythonic (and I believe
-        # the code I write for this lib has to be pythonic and simple) and the second method doesn't let
-        # me specify a custom key function, which is needed to sort only by length and priority.
+        Internal method
 
-        # Sort by (length, priority) tuple. [0:2] slice corresponds to such tuple
-        matches.sort(key = lambda match: match[0:2])  
+        Arguments:
+            see _next_token
 
-        # Extract two longest matches
-        first_longest  = matches[-1] 
-        second_longest = matches[-2]
+        Returns:
+            see _next_token
+
+        Raises:
+            see _next_token
+        """
+        profile = self.profile
+        stats = profile._get_stats(table)
+        matches = table.find_matches_profiled(data, offset, stats)
+        matches.sort(key = lambda match: match[0:2])
+
+        clock = time.perf_counter
+        best = None
+        index = len(matches)
+        while index > 0:
+            length, priority, spec = matches[index - 1]
+            if best is not None and best[0:2] != (length, priority):
+                break
+            index -= 1
+            rule_stats = stats[id(spec)]
+            pi = posinfo.Span(lines, base + offset, base + offset + length, position)
+            start = clock()
+            token_obj = spec['rule'].make_token(data, offset, length, pi)
+            rule_stats.make_token_time += clock() - start
+            if token_obj is None:
+                rule_stats.rejected += 1
+                continue
+            if best is not None:
+                profile.errors += 1
+                raise AmbiguousTokenError(data=data, offset=offset)
+            best = (length, priority, spec, token_obj)
 
-        # If they have the same and priority, the matching is ambiguous
-        if first_longest[0:2] == second_longest[0:2]:
-            raise AmbiguousTokenError(data=data, offset=offset)
+        if best is None:
+            profile.errors += 1
+            raise NoMatchingTokenError(data=data, offset=offset)
 
-        # Otherwise, return the longest one
-        length, priority, token_obj, spec = first_longest
+        # The remaining matches lost to the best one
+        length, priority, spec, token_obj = best
+        for other_length, other_priority, other_spec in matches[:index]:
+            if other_length < length:
+                stats[id(other_spec)].lost_to_length += 1
+            else:
+                stats[id(other_spec)].lost_to_priority += 1
+        stats[id(spec)].wins += 1
+        profile.tokens += 1
         return length, {'spec': spec, 'token': token_obj}
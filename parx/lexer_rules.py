@@ -5,6 +5,117 @@
 from . import lexer
 
 import re
+import sys
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    # Python < 3.11
+    import sre_parse, sre_constants
+
+
+# Inline flags which can be applied to a part of a regular expression, see Regex.get_pattern
+_SCOPED_FLAGS = (
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE,  'm'),
+    (re.DOTALL,     's'),
+    (re.VERBOSE,    'x'),
+    (re.ASCII,      'a'),
+)
+
+# Constructs referring to groups by their numbers or names. Such expressions can't be fused with other ones
+_GROUP_REFERENCE = re.compile(r'\\[1-9]|\\g<|\(\?P=|\(\?\(')
+
+# Global inline flags at the start of an expression. They are already reflected in the flags of the compiled
+# expression and are not allowed in the middle of another one
+_GLOBAL_FLAGS = re.compile(r'\A(?:\(\?[aiLmsux]+\))+')
+
+# Character ranges larger than that are not expanded when computing first characters of an expression
+_MAX_RANGE = 256
+
+
+def _first_chars(items):
+    """
+    Compute the set of character codes a match of the parsed regular expression can start with
+
+    Internal function
+
+    Arguments:
+        items - sequence of (opcode, argument) tuples produced by sre_parse
+
+    Returns:
+        tuple: (
+            set of character codes,
+            whether the expression can match an empty string
+        )
+        OR  None if the set cannot be computed
+    """
+    first = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            first.add(av)
+            return first, False
+        elif op is sre_constants.IN:
+            chars = _class_chars(av)
+            if chars is None:
+                return None
+            first |= chars
+            return first, False
+        elif op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, pattern = av
+            if add_flags & re.IGNORECASE:
+                return None
+            result = _first_chars(pattern)
+        elif op is sre_constants.BRANCH:
+            result = set(), False
+            for alternative in av[1]:
+                branch = _first_chars(alternative)
+                if branch is None:
+                    return None
+                result = result[0] | branch[0], result[1] or branch[1]
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_count, max_count, pattern = av
+            result = _first_chars(pattern)
+            if result is not None and min_count == 0:
+                result = result[0], True
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            # Zero-width assertions only restrict the match further
+            continue
+        else:
+            return None
+
+        if result is None:
+            return None
+        first |= result[0]
+        if not result[1]:
+            return first, False
+    return first, True
+
+
+def _class_chars(items):
+    """
+    Expand a character class of the parsed regular expression
+
+    Internal function
+
+    Arguments:
+        items - argument of the IN opcode produced by sre_parse
+
+    Returns:
+        set of character codes  OR  None if the class is negated, uses categories or is too large
+    """
+    chars = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            chars.add(av)
+        elif op is sre_constants.RANGE:
+            low, high = av
+            if high - low >= _MAX_RANGE:
+                return None
+            chars.update(range(low, high + 1))
+        else:
+            return None
+    return chars
 
 
 class String(lexer.Rule):
@@ -16,12 +127,15 @@ class String(lexer.Rule):
         Constructor
 
         Arguments:
-            string - string to match
+            string - string to match. May be bytes to tokenize bytes input (see lexer.Lexer.tokenize)
 
         Raises:
             None
         """
         super().__init__()
+        if isinstance(string, str):
+            # All tokens share the content string
+            string = sys.intern(string)
         self.string = string
 
     def get_length(self, data, offset):
@@ -34,6 +148,173 @@ class String(lexer.Rule):
         else:
             return 0
 
+    def make_token(self, data, offset, length, pi):
+        """
+        See lexer.Rule.make_token
+
+        The content of the token is the interned string rather than a slice of the input
+        """
+        return self.get_token_type()(self.string, pi=pi)
+
+    def get_token_kind(self, data, offset, length):
+        """
+        See lexer.Rule.get_token_kind
+        """
+        if type(self).make_token is not String.make_token:
+            return None
+        return self.get_token_type()._kind_code
+
+    def get_pattern(self):
+        """
+        See lexer.Rule.get_pattern
+        """
+        return re.escape(self.string)
+
+    def get_encoded_pattern(self, encoding):
+        """
+        See lexer.Rule.get_encoded_pattern
+        """
+        if isinstance(self.string, bytes):
+            return re.escape(self.string)
+        try:
+            return re.escape(self.string.encode(encoding))
+        except UnicodeEncodeError:
+            # The string cannot occur in the input
+            return b'(?!)'
+
+    def get_first_chars(self):
+        """
+        See lexer.Rule.get_first_chars
+        """
+        return frozenset(self.string[:1])
+
+
+class StringSet(lexer.Rule):
+    """
+    Lexer rule to match the longest of several exact strings
+
+    The strings are stored in a trie, so the time needed to find a match depends only on the length of the
+    match, not on the number of strings. Use it instead of many String rules when there are lots of keywords or
+    operators
+    """
+    def __init__(self, strings):
+        """
+        Constructor
+
+        Arguments:
+            strings - strings to match. Either an iterable of strings or a dict mapping each string to the token
+                      class to instantiate when this string matches (None means the default class, see
+                      get_token_type). Empty strings are ignored. Bytes may be used instead of strings
+                      to tokenize bytes input (see lexer.Lexer.tokenize)
+
+        Raises:
+            None
+        """
+        super().__init__()
+        if not isinstance(strings, dict):
+            strings = dict.fromkeys(strings)
+        strings = {
+            sys.intern(string) if isinstance(string, str) else string: token_type
+            for string, token_type in strings.items()
+        }
+        self.strings = strings
+        # string -> the same string, to give the tokens the interned strings instead of slices of the input
+        self._interned = {string: string for string in strings}
+
+        # Each node is a dict mapping the next character to the child node. The None key marks the end of a string
+        self.trie = {}
+        for string in strings:
+            if len(string) == 0:
+                continue
+            node = self.trie
+            for char in string:
+                node = node.setdefault(char, {})
+            node[None] = True
+
+    def get_length(self, data, offset):
+        """
+        See lexer.Rule.get_length
+        """
+        node = self.trie
+        length = 0
+        index = offset
+        end = len(data)
+        while index < end:
+            node = node.get(data[index])
+            if node is None:
+                break
+            index += 1
+            if None in node:
+                length = index - offset
+        return length
+
+    def make_token(self, data, offset, length, pi):
+        """
+        See lexer.Rule.make_token
+
+        The token class is chosen according to the matching string (see __init__)
+        """
+        content = data[offset : offset + length]
+        if not isinstance(content, (str, bytes)):
+            # Slice of a bytearray, etc.
+            content = bytes(content)
+        content = self._interned.get(content, content)
+        token_type = self.strings.get(content)
+        if token_type is None:
+            token_type = self.get_token_type()
+        return token_type(content, pi=pi)
+
+    def get_token_kind(self, data, offset, length):
+        """
+        See lexer.Rule.get_token_kind
+        """
+        if type(self).make_token is not StringSet.make_token:
+            return None
+        content = data[offset : offset + length]
+        if not isinstance(content, (str, bytes)):
+            content = bytes(content)
+        token_type = self.strings.get(content)
+        if token_type is None:
+            token_type = self.get_token_type()
+        return token_type._kind_code
+
+    def get_pattern(self):
+        """
+        See lexer.Rule.get_pattern
+        """
+        strings = sorted((string for string in self.strings if len(string) > 0), key=len, reverse=True)
+        if len(strings) == 0:
+            return '(?!)'
+        # Alternatives are tried from left to right, so the longest strings go first
+        if isinstance(strings[0], bytes):
+            return b'(?:' + b'|'.join(re.escape(string) for string in strings) + b')'
+        return '(?:{})'.format('|'.join(re.escape(string) for string in strings))
+
+    def get_encoded_pattern(self, encoding):
+        """
+        See lexer.Rule.get_encoded_pattern
+        """
+        encoded = []
+        for string in self.strings:
+            if isinstance(string, bytes):
+                encoded.append(string)
+                continue
+            try:
+                encoded.append(string.encode(encoding))
+            except UnicodeEncodeError:
+                # The string cannot occur in the input
+                pass
+        encoded = sorted((string for string in encoded if len(string) > 0), key=len, reverse=True)
+        if len(encoded) == 0:
+            return b'(?!)'
+        return b'(?:' + b'|'.join(re.escape(string) for string in encoded) + b')'
+
+    def get_first_chars(self):
+        """
+        See lexer.Rule.get_first_chars
+        """
+        return frozenset(char for char in self.trie if char is not None)
+
 
 class Regex(lexer.Rule):
     """
@@ -44,7 +325,8 @@ class Regex(lexer.Rule):
         Constructor
 
         Arguments:
-            regex - regular expression to match
+            regex - regular expression to match. Expressions over bytes tokenize bytes input
+                    (see lexer.Lexer.tokenize)
 
         Raises:
             None
@@ -62,6 +344,49 @@ class Regex(lexer.Rule):
         else:
             return match.end() - match.start()
 
+    def get_pattern(self):
+        """
+        See lexer.Rule.get_pattern
+
+        Flags of the expression are preserved. Expressions with named groups or backreferences cannot be fused
+        with other ones, so None is returned for them
+        """
+        pattern = self.regex.pattern
+        binary = isinstance(pattern, bytes)
+        if binary:
+            # Process expressions over bytes as strings, mapping each byte to the character with the same code
+            pattern = pattern.decode('latin-1')
+        if self.regex.groupindex or _GROUP_REFERENCE.search(pattern):
+            return None
+        if self.regex.flags & re.LOCALE:
+            return None
+        flags = ''.join(letter for flag, letter in _SCOPED_FLAGS if self.regex.flags & flag)
+        pattern = _GLOBAL_FLAGS.sub('', pattern)
+        if self.regex.flags & re.VERBOSE:
+            # A comment at the end of the expression would otherwise swallow the closing parenthesis
+            pattern += '\n'
+        pattern = '(?{}:{})'.format(flags, pattern)
+        if binary:
+            return pattern.encode('latin-1')
+        return pattern
+
+    def get_first_chars(self):
+        """
+        See lexer.Rule.get_first_chars
+
+        The set is computed from the parsed expression. Expressions using case-insensitive matching,
+        negated character classes, categories (such as \\d) or `.` at the start yield None
+        """
+        if self.regex.flags & (re.IGNORECASE | re.LOCALE):
+            return None
+        result = _first_chars(sre_parse.parse(self.regex.pattern, self.regex.flags))
+        if result is None:
+            return None
+        if isinstance(self.regex.pattern, bytes):
+            # Elements of bytes are integers
+            return frozenset(result[0])
+        return frozenset(chr(code) for code in result[0])
+
 
 class Attach(lexer.Rule):
     """
@@ -85,10 +410,54 @@ class Attach(lexer.Rule):
         super().__init__()
         self.token_class = token_class
         self.rule = rule
+        # Content shared by all tokens if the rule matches a single string, see String.make_token
+        self._string = rule.string if isinstance(rule, String) else None
+        # Interned strings if the rule matches one of several strings, see StringSet.make_token
+        self._interned = rule._interned if isinstance(rule, StringSet) else None
 
     def get_length(self, *args):
         return self.rule.get_length(*args)
 
+    def make_token(self, data, offset, length, pi):
+        """
+        See lexer.Rule.make_token
+        """
+        if self._string is not None:
+            return self.token_class(self._string, pi=pi)
+        content = data[offset : offset + length]
+        if self._interned is not None:
+            if not isinstance(content, (str, bytes)):
+                # Slice of a bytearray, etc.
+                content = bytes(content)
+            content = self._interned.get(content, content)
+        return self.token_class(content, pi=pi)
+
+    def get_token_kind(self, data, offset, length):
+        """
+        See lexer.Rule.get_token_kind
+        """
+        if type(self).make_token is not Attach.make_token:
+            return None
+        return self.token_class._kind_code
+
+    def get_pattern(self):
+        """
+        See lexer.Rule.get_pattern
+        """
+        return self.rule.get_pattern()
+
+    def get_encoded_pattern(self, encoding):
+        """
+        See lexer.Rule.get_encoded_pattern
+        """
+        return self.rule.get_encoded_pattern(encoding)
+
+    def get_first_chars(self):
+        """
+        See lexer.Rule.get_first_chars
+        """
+        return self.rule.get_first_chars()
+
     def get_token_type(self):
         """
         See lexer.Rule.get_token_type
@@ -100,6 +469,9 @@ class IgnoreValue(lexer.Token):
     """
     Token wrapper used to ignore the value of token when doing comparisons
     """
+
+    __slots__ = ('token',)
+
     def __init__(self, token):
         super().__init__(pi=token._posinfo)
         self.token = token
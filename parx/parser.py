@@ -2,8 +2,11 @@
 # This file is licensed under the MIT license. See LICENSE file
 
 
+from . import lexer
 from . import posinfo
 
+import heapq
+
 
 class ParserError(Exception):
     """
@@ -28,13 +31,43 @@ class IncompleteError(ParserError):
         """
         self.token = token
 
+    def __reduce__(self):
+        # Exceptions are pickled with their args by default, which are not set by the constructor
+        return self.__class__, (self.token,)
+
     def __str__(self):
-        return str(token)
+        return str(self.token)
 
     def __repr__(self):
         return '{}({})'.format(self.__class__.__name__, repr(self.token))
 
 
+class ReleasedTokenError(ParserError):
+    """
+    An error when a rule accesses a token of a stream which was already released
+
+    This means that the rule backtracked before an offset committed by another rule without pinning it
+    (see commit() and pin())
+    """
+    def __init__(self, offset):
+        """
+        Constructor
+
+        Arguments:
+            offset - offset of the token
+
+        Raises:
+            None
+        """
+        self.offset = offset
+
+    def __reduce__(self):
+        return self.__class__, (self.offset,)
+
+    def __str__(self):
+        return 'Token at offset {} was already released'.format(self.offset)
+
+
 class PostponeMatching(Exception):
     """
     Exception indicating that left recursion was detected and asking to postpone matching of the current
@@ -72,11 +105,704 @@ class Rule(object):
         """
         return 0, None
 
+    def iter_match(self, tokens, offset):
+        """
+        Perform matching, yielding the parts of the result as soon as they are matched
+
+        Used by Parser.iterparse for the root rule. This implementation yields the result of match() if it
+        succeeded
+
+        Arguments:
+            tokens - token sequence
+            offset - offset in that sequence
+
+        Returns:
+            generator of (length, node) tuples. Lengths are the numbers of consumed tokens, nodes are the AST nodes
+
+        Raises:
+            the same as match()
+        """
+        length, node = match(self, tokens, offset)
+        if length > 0 and node is not None:
+            yield length, node
+
+    def get_sub_rules(self):
+        """
+        Return the sub-rules of this rule
+
+        Used to traverse the grammar, see first_sets()
+
+        Arguments:
+            None
+
+        Returns:
+            list of rules
+
+        Raises:
+            None
+        """
+        return []
+
+    def get_first_tokens(self, sets):
+        """
+        Compute the FIRST set of this rule: the tokens a successful match may start with
+
+        Token patterns are identified by keys: (token class, content) tuples, where content is None if any token
+        of the class may match
+
+        Arguments:
+            sets - dict mapping the rules of the grammar to their (current approximations of) FIRST sets, in the
+                   same format as the return value of this method
+
+        Returns:
+            (keys, nullable) tuple, where keys is the set of token pattern keys and nullable tells whether the rule
+            may succeed or be skipped without consuming a token (or at the end of the input)  OR
+            None if the FIRST set is unknown, e.g. because the rule matches tokens in a custom way
+
+        Raises:
+            None
+        """
+        return None
+
+    def prepare(self, sets):
+        """
+        Prepare the rule for parsing
+
+        Called by the parser for each rule of the grammar before the first parsing
+
+        Arguments:
+            sets - FIRST sets of the rules of the grammar, see first_sets()
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        pass
+
+
+def first_sets(rule):
+    """
+    Compute the FIRST sets of the rules of a grammar
+
+    Arguments:
+        rule - the root rule of the grammar
+
+    Returns:
+        dict mapping each rule reachable from the root to its FIRST set, see Rule.get_first_tokens
+
+    Raises:
+        None
+    """
+    rules = []
+    seen = set()
+    stack = [rule]
+    while len(stack) > 0:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        rules.append(current)
+        stack.extend(current.get_sub_rules())
+
+    # Fixed point iteration: the sets only grow, so it terminates
+    sets = {current: (frozenset(), False) for current in rules}
+    changed = True
+    while changed:
+        changed = False
+        for current in rules:
+            if sets[current] is None:
+                continue
+            result = current.get_first_tokens(sets)
+            if result is not None:
+                result = frozenset(result[0]), bool(result[1])
+            if result != sets[current]:
+                sets[current] = result
+                changed = True
+    return sets
+
+
+def prepare(rule):
+    """
+    Prepare all rules of a grammar for parsing, see Rule.prepare
+
+    Arguments:
+        rule - the root rule of the grammar
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    sets = first_sets(rule)
+    for current in sets:
+        current.prepare(sets)
+
+
+def match(rule, tokens, offset):
+    """
+    Perform matching of a sub-rule
+
+    Rules should use this function instead of calling rule.match() of their sub-rules directly, so that
+    the sub-rules go through the packrat cache if it is enabled (see Parser.__init__)
+
+    Arguments:
+        rule   - sub-rule (an instance of Rule)
+        tokens - token sequence, as passed to the match() method of the calling rule
+        offset - offset in that sequence
+
+    Returns:
+        the same as rule.match()
+
+    Raises:
+        the same as rule.match()
+    """
+    memo = getattr(tokens, 'memo', None)
+    if memo is None:
+        return rule.match(tokens, offset)
+    return memo.match(rule, tokens, offset)
+
+
+def commit(tokens, offset):
+    """
+    Tell the parser that the calling rule will not backtrack before the offset
+
+    Rules call it when they know that the tokens before the offset are consumed for good, e.g. OneOrMore after each
+    iteration. The packrat cache (if enabled, see Parser.__init__) may drop the results for these tokens. Dropping
+    is always safe: if a result is needed again, it is recomputed
+
+    Arguments:
+        tokens - token sequence, as passed to the match() method of the calling rule
+        offset - offset in that sequence
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    memo = getattr(tokens, 'memo', None)
+    if memo is not None:
+        memo.commit(offset)
+    if type(tokens) is TokenStream:
+        tokens.release(offset)
+
+
+def pin(tokens, offset):
+    """
+    Tell the parser that the calling rule may backtrack to the offset
+
+    Rules which may read the tokens at some offset again after matching their sub-rules (e.g. AnyOf trying another
+    alternative) pin the offset while the sub-rules are matched, so that commits of the sub-rules (see commit())
+    do not release these tokens. Each call must be paired with a call to unpin()
+
+    Arguments:
+        tokens - token sequence, as passed to the match() method of the calling rule
+        offset - offset in that sequence
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    if type(tokens) is TokenStream:
+        tokens.pin(offset)
+
+
+def unpin(tokens, offset):
+    """
+    Remove a pin added by pin()
+
+    Arguments:
+        tokens - token sequence, as passed to the match() method of the calling rule
+        offset - offset in that sequence
+
+    Returns:
+        None
+
+    Raises:
+        None
+    """
+    if type(tokens) is TokenStream:
+        tokens.unpin(offset)
+
+
+def token_at(tokens, offset):
+    """
+    Get a token from the token sequence, checking for the end of the sequence
+
+    Rules should use this function and slicing instead of len(), so that token streams are not read to the end
+
+    Arguments:
+        tokens - token sequence, as passed to the match() method of the calling rule
+        offset - offset in that sequence
+
+    Returns:
+        the token  OR  None if the offset is at (or after) the end of the sequence
+
+    Raises:
+        ReleasedTokenError if the token was released (see TokenStream)
+    """
+    try:
+        return tokens[offset]
+    except IndexError:
+        return None
+
+
+class Memo(object):
+    """
+    Packrat cache: results of matching of rules at different offsets
+
+    Each rule is matched at most once at each offset, which makes parsing time linear in the number of tokens
+    for any grammar (at the cost of memory)
+
+    The memory can be bounded by a window: results are kept for at most `window` offsets (the oldest ones are
+    evicted first), and the results for offsets before a committed one (see commit()) are evicted as well.
+    Evicted results are recomputed if needed
+    """
+    def __init__(self, window=None):
+        """
+        Constructor
+
+        Arguments:
+            window - maximum number of offsets to keep results for. None means unbounded; commit() has no effect
+                     in this case
+        """
+        super().__init__()
+        self.window = window
+        # offset -> {rule -> (length, node)}
+        self.table = {}
+        # Heap of the offsets in the table (may contain already evicted offsets), used to evict the offsets before
+        # a committed one
+        self._offsets = []
+        # offset -> number of rules being matched at this offset
+        self._active = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def match(self, rule, tokens, offset):
+        """
+        Perform matching of a rule or take its result from the cache
+
+        Left recursion is handled by growing the seed (A. Warth et al., "Packrat Parsers Can Support Left
+        Recursion"): while a rule is being matched at some offset, recursive attempts to match it at the same
+        offset fail. If that happened and the rule matched anyway, the result is a seed: the rule is matched again
+        and again, with recursive attempts returning the previous result, while the match keeps getting longer
+
+        Arguments:
+            rule   - the rule
+            tokens - token sequence
+            offset - offset in that sequence
+
+        Returns:
+            the same as rule.match()
+
+        Raises:
+            the same as rule.match(). Exceptions are not cached
+        """
+        entries = self.table.get(offset)
+        if entries is None:
+            entries = self._add_offset(offset)
+        else:
+            result = entries.get(rule)
+            if result is not None:
+                if type(result) is _Seed:
+                    # Left recursion. The rule will be matched again at this offset to grow the seed
+                    if not result.detected:
+                        result.detected = True
+                        pin(tokens, offset)
+                    return result.result
+                self.hits += 1
+                return result
+        self.misses += 1
+
+        seed = entries[rule] = _Seed()
+        self._active[offset] = self._active.get(offset, 0) + 1
+        try:
+            result = rule.match(tokens, offset)
+            if seed.detected and result[0] > 0:
+                result = self._grow_seed(rule, tokens, offset, seed, result)
+        finally:
+            if seed.detected:
+                unpin(tokens, offset)
+            if self._active[offset] == 1:
+                del self._active[offset]
+            else:
+                self._active[offset] -= 1
+            # The offset could have been evicted and added again meanwhile
+            entries = self.table.get(offset)
+            if entries is not None and entries.get(rule) is seed:
+                del entries[rule]
+
+        if entries is None:
+            entries = self._add_offset(offset)
+        entries[rule] = result
+        return result
+
+    def _grow_seed(self, rule, tokens, offset, seed, result):
+        """
+        Grow the seed of a left-recursive rule
+
+        Internal method
+
+        Arguments:
+            rule   - the rule
+            tokens - token sequence
+            offset - offset in that sequence
+            seed   - _Seed object of the rule
+            result - the seed: result of the first matching
+
+        Returns:
+            the longest result
+        """
+        while True:
+            seed.result = result
+            # Results of the other rules at this offset may depend on the old seed
+            entries = self.table.get(offset)
+            if entries is not None:
+                for other in [other for other, value in entries.items() if type(value) is not _Seed]:
+                    del entries[other]
+            grown = rule.match(tokens, offset)
+            if grown[0] <= result[0]:
+                return result
+            result = grown
+
+    def _add_offset(self, offset):
+        """
+        Add an empty entry for the offset to the table, evicting the oldest offset if necessary
+
+        Internal method
+
+        Arguments:
+            offset - the offset
+
+        Returns:
+            the new entry
+        """
+        entries = self.table[offset] = {}
+        if self.window is not None:
+            heapq.heappush(self._offsets, offset)
+            if len(self.table) > self.window:
+                # Evict the oldest offset which has no rules being matched
+                for oldest in self.table:
+                    if oldest not in self._active and oldest != offset:
+                        del self.table[oldest]
+                        self.evictions += 1
+                        break
+                # The evicted offsets stay in the heap. Rebuild it once they dominate, so that it stays within
+                # twice the window (the rebuilds take amortized O(1) time per offset)
+                if len(self._offsets) > 2 * len(self.table):
+                    self._offsets = list(self.table)
+                    heapq.heapify(self._offsets)
+        return entries
+
+    def commit(self, offset):
+        """
+        Evict the results for the offsets before the specified one
+
+        Does nothing if the cache is unbounded. Offsets where some rules are still being matched are not evicted
+
+        Arguments:
+            offset - committed offset
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if self.window is None:
+            return
+        offsets = self._offsets
+        kept = []
+        while len(offsets) > 0 and offsets[0] < offset:
+            evicted = heapq.heappop(offsets)
+            if evicted in self._active:
+                kept.append(evicted)
+            elif self.table.pop(evicted, None) is not None:
+                self.evictions += 1
+        for evicted in kept:
+            heapq.heappush(offsets, evicted)
+
+    def hit_rate(self):
+        """
+        Return the fraction of matchings answered from the cache
+
+        Arguments:
+            None
+
+        Returns:
+            number between 0 and 1 (0 if nothing was matched yet)
+
+        Raises:
+            None
+        """
+        total = self.hits + self.misses
+        if total == 0:
+            return 0
+        return self.hits / total
+
+
+class _Seed(object):
+    """
+    Placeholder in the packrat cache for a rule which is being matched
+
+    Internal class
+    """
+    def __init__(self):
+        # Result of recursive matchings of the rule at the same offset
+        self.result = (0, None)
+        # Whether a recursive matching happened
+        self.detected = False
+
+
+class TokenList(list):
+    """
+    List of tokens carrying the packrat cache
+
+    Parser passes objects of this class to the rules when memoization is enabled. The views in the nodes
+    (see TokenRange) refer to self.base rather than to this list, so that the nodes do not keep the cache alive
+    """
+    def __init__(self, tokens, memo):
+        """
+        Constructor
+
+        Arguments:
+            tokens - list of tokens
+            memo   - Memo object
+        """
+        super().__init__(tokens)
+        self.base = tokens
+        self.memo = memo
+
+
+class TokenStream(object):
+    """
+    Token sequence read from an iterator on demand
+
+    Supports indexing and slicing like a list. Tokens are read from the iterator when they are accessed, and the
+    tokens before a committed offset (see commit()) are released, unless some rule pinned them (see pin()). So
+    the memory used is bounded by the tokens which may still be needed rather than by the length of the input
+
+    Rules which may be followed by matching at their start offset again keep the tokens from there on: OneOrMore
+    keeps the tokens of the current iteration, Sequence keeps all its tokens until it is matched, and AnyOf with
+    several alternatives keeps them until all the alternatives are matched. So the tokens are released as they
+    are read if the root rule is a OneOrMore, but not if it is a Sequence or an AnyOf
+    """
+    def __init__(self, tokens, memo=None):
+        """
+        Constructor
+
+        Arguments:
+            tokens - iterable of tokens
+            memo   - Memo object (see Parser.__init__) or None
+        """
+        super().__init__()
+        self.memo = memo
+        self._iterator = iter(tokens)
+        self._exhausted = False
+        # Tokens starting with the offset self.released, beginning at self._buffer[self._start]
+        self._buffer = []
+        self._start = 0
+        # Offset of the first token which was not released
+        self.released = 0
+        # offset -> number of pins
+        self._pins = {}
+
+    def _fill(self, end):
+        """
+        Read the tokens from the iterator until there are tokens at all offsets up to (not including) `end`
+
+        Internal method
+
+        Arguments:
+            end - offset
+
+        Returns:
+            None
+        """
+        buffer = self._buffer
+        needed = end - self.released + self._start - len(buffer)
+        while needed > 0 and not self._exhausted:
+            try:
+                buffer.append(next(self._iterator))
+            except StopIteration:
+                self._exhausted = True
+            needed -= 1
+
+    def __getitem__(self, index):
+        """
+        Get a token or a list of tokens
+
+        Arguments:
+            index - offset or slice of offsets. Negative offsets and steps are not supported
+
+        Returns:
+            the token or the list of tokens
+
+        Raises:
+            IndexError         if the offset is at (or after) the end of the sequence
+            ReleasedTokenError if the token (or the first token of the slice) was released
+        """
+        if type(index) is slice:
+            start = 0 if index.start is None else index.start
+            if start < self.released:
+                raise ReleasedTokenError(start)
+            if index.stop is None:
+                self._fill(float('inf'))
+                stop = self.released + len(self._buffer) - self._start
+            else:
+                stop = index.stop
+                self._fill(stop)
+            shift = self._start - self.released
+            return self._buffer[start + shift : stop + shift : index.step]
+        if index < self.released:
+            raise ReleasedTokenError(index)
+        self._fill(index + 1)
+        position = index - self.released + self._start
+        if position >= len(self._buffer):
+            raise IndexError('token index out of range')
+        return self._buffer[position]
+
+    def __len__(self):
+        """
+        Get the number of tokens
+
+        Reads the whole iterator, so rules should not use it (see token_at())
+        """
+        self._fill(float('inf'))
+        return self.released + len(self._buffer) - self._start
+
+    def pin(self, offset):
+        """
+        Prevent releasing the tokens starting with the offset, see parser.pin()
+        """
+        self._pins[offset] = self._pins.get(offset, 0) + 1
+
+    def unpin(self, offset):
+        """
+        Remove a pin added by pin()
+        """
+        if self._pins[offset] == 1:
+            del self._pins[offset]
+        else:
+            self._pins[offset] -= 1
+
+    def release(self, offset):
+        """
+        Release the tokens before the offset, except the pinned ones
+
+        Arguments:
+            offset - offset
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        if len(self._pins) > 0:
+            offset = min(offset, min(self._pins))
+        offset = min(offset, self.released + len(self._buffer) - self._start)
+        if offset <= self.released:
+            return
+        self._start += offset - self.released
+        self.released = offset
+        # Compact the buffer once the released part dominates it, so that releasing is amortized O(1)
+        if self._start * 2 > len(self._buffer):
+            del self._buffer[:self._start]
+            self._start = 0
+
+
+class TokenRange(object):
+    """
+    Read-only view of a range of a token list
+
+    Rules put views into the nodes instead of copying the tokens into new lists. Views support len(), iteration
+    and indexing, slicing and concatenating them returns lists, and they compare equal to lists (and tuples) of
+    the same tokens
+    """
+
+    __slots__ = ('tokens', 'start', 'stop')
+
+    def __init__(self, tokens, start, stop):
+        """
+        Constructor
+
+        Arguments:
+            tokens - token list. It must not be modified while the view is in use
+            start  - offset of the first token of the range
+            stop   - offset past the last token of the range
+
+        Raises:
+            None
+        """
+        self.tokens = tokens
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        tokens = self.tokens
+        for index in range(self.start, self.stop):
+            yield tokens[index]
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('token index out of range')
+        return self.tokens[self.start + index]
+
+    def __eq__(self, other):
+        if type(other) is TokenRange:
+            if other.tokens is self.tokens and other.start == self.start and other.stop == self.stop:
+                return True
+        elif not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if not isinstance(other, (list, tuple, TokenRange)):
+            return NotImplemented
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return list(other) + list(self)
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return repr(list(self))
+
 
 class Node(object):
     """
     AST node
+
+    Node declares __slots__, so its objects have no __dict__. Subclasses get a __dict__ as usual unless they
+    declare __slots__ too (e.g. `__slots__ = ()` if they add no attributes), which saves memory on large trees
     """
+
+    __slots__ = ('value', '_posinfo')
+
     def __init__(self, value=None, pi=None):
         self.value = value
         self._posinfo = pi
@@ -101,16 +827,29 @@ class Parser(object):
     """
     A class for creating ASTs (Abstract Syntax Trees) from the sequence of tokens
     """
-    def __init__(self):
+    def __init__(self, *, memoize=False, memo_window=None):
+        """
+        Constructor
+
+        Arguments:
+            memoize     - if true, enable packrat memoization: each rule is matched at most once at each offset
+                          (see Memo). This makes parsing time linear at the cost of memory. Statistics of the last
+                          parsing are available as self.memo. Memoization is required for left-recursive grammars
+            memo_window - maximum number of offsets to keep in the packrat cache, see Memo.__init__. None means
+                          unbounded
+        """
         super().__init__()
-        # TODO: insert initialization code if needed
-        pass
+        self.memoize = memoize
+        self.memo_window = memo_window
+        self.memo = None
+        self._prepared = False
 
     def set_root_rule(self, rule):
         """
         Set the rule used to produce the root AST token
 
-        Replaces the current rule, if any
+        Replaces the current rule, if any. The grammar is prepared for parsing (see Rule.prepare) before the first
+        parsing, so it must not be changed after that; call this method again if it was
 
         Arguments:
             rule - parsing rule (an instance of Rule)
@@ -122,16 +861,20 @@ class Parser(object):
             None
         """
         self.root_rule = rule
+        self._prepared = False
 
     def parse(self, tokens):
         """
         Create AST from the sequence of tokens
 
         Arguments:
-            tokens - sequence of tokens (list or an iterator)
+            tokens - sequence of tokens (list, lexer.TokenArray or an iterator). Iterators are read on demand (see
+                     TokenStream), so that lexing and parsing are interleaved
 
         Returns:
-            the root node of the resulting AST tree (an instance of Node class)
+            the root node of the resulting AST tree (an instance of Node class). Values of the nodes matched by
+            TokenSequence rules are views of a list or lexer.TokenArray passed as `tokens` (see TokenRange), so
+            it must not be modified while the tree is in use; copy it beforehand if needed
 
         Raises:
             UnexpectedTokenError if an unexpected token was encountered
@@ -139,12 +882,80 @@ class Parser(object):
         """
         
         # TODO: figure out the syntax error place better
-        if type(tokens) is not list:
-            tokens = list(tokens)
+        tokens = self._start(tokens)
 
         #import pudb; pudb.set_trace()
-        length, node = self.root_rule.match(tokens, offset=0)
-        if length < len(tokens):
-            raise IncompleteError(tokens[length])
+        length, node = match(self.root_rule, tokens, offset=0)
+        self._finish(tokens, length)
 
         return node
+
+    def iterparse(self, tokens):
+        """
+        Create AST from the sequence of tokens, yielding the nodes as soon as they are matched
+
+        If the root rule is OneOrMore, each child node is yielded when it is matched, so that the processing of the
+        nodes does not have to wait for the whole input and the nodes can be discarded afterwards. Other root rules
+        yield a single root node (see Rule.iter_match)
+
+        Arguments:
+            tokens - sequence of tokens, see parse()
+
+        Returns:
+            generator of the nodes
+
+        Raises:
+            see parse(). IncompleteError is raised after yielding the matched nodes
+        """
+        tokens = self._start(tokens)
+        length = 0
+        for item_length, node in self.root_rule.iter_match(tokens, 0):
+            length += item_length
+            yield node
+        self._finish(tokens, length)
+
+    def _start(self, tokens):
+        """
+        Prepare the grammar and the token sequence for parsing
+
+        Internal method
+
+        Arguments:
+            tokens - sequence of tokens, see parse()
+
+        Returns:
+            token sequence to pass to the rules
+        """
+        if not self._prepared:
+            prepare(self.root_rule)
+            self._prepared = True
+
+        self.memo = Memo(self.memo_window) if self.memoize else None
+        if type(tokens) is lexer.TokenArray:
+            if self.memoize:
+                tokens = tokens.with_memo(self.memo)
+        elif type(tokens) is not list:
+            tokens = TokenStream(tokens, self.memo)
+        elif self.memoize:
+            tokens = TokenList(tokens, self.memo)
+        return tokens
+
+    def _finish(self, tokens, length):
+        """
+        Check that the root rule matched the whole token sequence
+
+        Internal method
+
+        Arguments:
+            tokens - token sequence returned from _start()
+            length - number of tokens matched by the root rule
+
+        Returns:
+            None
+
+        Raises:
+            IncompleteError if the end of the token sequence wasn't reached
+        """
+        token = token_at(tokens, length)
+        if token is not None:
+            raise IncompleteError(token)
@@ -4,6 +4,58 @@
 
 from . import posinfo
 from . import parser
+from . import lexer
+from . import lexer_rules
+
+
+# Operator kinds, see Operator
+PREFIX  = 'prefix'
+INFIX   = 'infix'
+POSTFIX = 'postfix'
+
+# Associativity of infix operators, see Operator
+LEFT  = 'left'
+RIGHT = 'right'
+
+
+def _pattern_key(pattern):
+    """
+    Compute the key identifying the tokens a token pattern matches
+
+    Internal function
+
+    Arguments:
+        pattern - token pattern, such as the elements of the TokenSequence sequence
+
+    Returns:
+        (token class, content) tuple, where content is None if it does not matter  OR
+        None if the pattern uses a custom is_identical() method
+    """
+    is_identical = type(pattern).is_identical
+    if is_identical is lexer_rules.IgnoreValue.is_identical:
+        return type(pattern.token), None
+    if is_identical is lexer.SimpleToken.is_identical:
+        return type(pattern), pattern.content
+    if is_identical is lexer.Token.is_identical:
+        return type(pattern), None
+    return None
+
+
+def _token_key(token):
+    """
+    Compute the key of a token, as compared with the results of _pattern_key()
+
+    Internal function
+
+    Arguments:
+        token - the token
+
+    Returns:
+        (token class, content) tuple, where content is None if the token has no content
+    """
+    if isinstance(token, lexer.SimpleToken):
+        return type(token), token.content
+    return type(token), None
 
 
 class TokenSequence(parser.Rule):
@@ -25,18 +77,166 @@ class TokenSequence(parser.Rule):
             raise ValueError('The sequence is empty')
         self.sequence = sequence
         self.NodeType = NodeType
+        self._kinds = self._get_kinds()
+
+    def _get_kinds(self):
+        """
+        Describe the patterns by the kind codes of their token classes
+
+        Internal method
+
+        Returns:
+            list with an item for each pattern: (kind code, content) tuple, where content is None if it does not
+            matter  OR  None if the pattern has to be compared by its is_identical() method
+        """
+        kinds = []
+        for pattern in self.sequence:
+            key = _pattern_key(pattern)
+            kinds.append(None if key is None else (key[0]._kind_code, key[1]))
+        return kinds
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # Kind codes differ between processes (see lexer.Token._kind_code), they are computed again on unpickling
+        del state['_kinds']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._kinds = self._get_kinds()
 
     def match(self, tokens, offset):
         """
         see parser.Rule.match
         """
-        n = len(self.sequence)
-        if offset + n > len(tokens):
+        if type(tokens) is lexer.TokenArray:
+            return self._match_array(tokens, offset)
+        sequence = self.sequence
+        kinds = self._kinds
+        try:
+            for index in range(len(kinds)):
+                token = tokens[offset + index]
+                kind = kinds[index]
+                if kind is None:
+                    if not sequence[index].is_identical(token):
+                        return 0, None
+                elif token._kind_code != kind[0] or kind[1] is not None and token.content != kind[1]:
+                    return 0, None
+        except IndexError:
             return 0, None
-        if all([a.is_identical(b) for a, b in zip(self.sequence, tokens[offset : offset + n])]):
-            return n, self.NodeType(tokens[offset : offset + n], pi=tokens[offset]._posinfo)
+        stop = offset + len(sequence)
+        if type(tokens) is list:
+            value = parser.TokenRange(tokens, offset, stop)
+        elif type(tokens) is parser.TokenList:
+            value = parser.TokenRange(tokens.base, offset, stop)
         else:
+            # Token streams release tokens, and other sequences may change
+            value = tokens[offset : stop]
+        return len(sequence), self.NodeType(value, pi=tokens[offset]._posinfo)
+
+    def _match_array(self, tokens, offset):
+        """
+        Perform matching against a lexer.TokenArray, without creating the tokens
+
+        Internal method
+
+        see parser.Rule.match
+        """
+        kinds = self._kinds
+        stop = offset + len(kinds)
+        if stop > len(tokens):
+            return 0, None
+        array_kinds = tokens.kinds
+        for index in range(len(kinds)):
+            kind = kinds[index]
+            if kind is None:
+                if not self.sequence[index].is_identical(tokens[offset + index]):
+                    return 0, None
+            elif array_kinds[offset + index] != kind[0] or \
+                    kind[1] is not None and tokens.content(offset + index) != kind[1]:
+                return 0, None
+        if tokens.memo is not None:
+            # Refer to the array without the packrat cache, see parser.TokenList
+            tokens = tokens.base
+        return len(kinds), self.NodeType(parser.TokenRange(tokens, offset, stop), pi=tokens.span(offset))
+
+    def get_first_tokens(self, sets):
+        """
+        see parser.Rule.get_first_tokens
+        """
+        key = _pattern_key(self.sequence[0])
+        if key is None:
+            return None
+        return {key}, False
+
+
+class Sequence(parser.Rule):
+    """
+    A parser rule matching the specified sub-rules one after another
+    """
+    def __init__(self, rules, NodeType):
+        """
+        Constructor
+
+        Arguments:
+            rules - sub-rules described above
+            NodeType - class of the AST node which will be returned from match(). Its value is the list of the
+                       nodes returned from the sub-rules (None for skipped Optional sub-rules)
+
+        Raises:
+            ValueError if the list of sub-rules is empty
+        """
+        if len(rules) == 0:
+            raise ValueError('The sequence is empty')
+        self.rules = rules
+        self.NodeType = NodeType
+
+    def match(self, tokens, offset):
+        """
+        see parser.Rule.match
+        """
+        total_length = 0
+        nodes = []
+        # If a sub-rule fails, the calling rule continues at the start of the sequence
+        parser.pin(tokens, offset)
+        try:
+            for rule in self.rules:
+                try:
+                    length, node = parser.match(rule, tokens, offset + total_length)
+                except parser.SkipRule:
+                    nodes.append(None)
+                    continue
+                if length <= 0 or node is None:
+                    return 0, None
+                total_length += length
+                nodes.append(node)
+        finally:
+            parser.unpin(tokens, offset)
+        if total_length == 0:
             return 0, None
+        pi = next(node for node in nodes if node is not None)._posinfo
+        return total_length, self.NodeType(nodes, pi=pi)
+
+    def get_sub_rules(self):
+        """
+        see parser.Rule.get_sub_rules
+        """
+        return list(self.rules)
+
+    def get_first_tokens(self, sets):
+        """
+        see parser.Rule.get_first_tokens
+        """
+        # A sequence which consumed no tokens fails, so it is never nullable
+        keys = set()
+        for rule in self.rules:
+            first = sets[rule]
+            if first is None:
+                return None
+            keys |= first[0]
+            if not first[1]:
+                break
+        return keys, False
 
 
 class AnyOf(parser.Rule):
@@ -57,18 +257,42 @@ class AnyOf(parser.Rule):
         """
         self.rules = rules
         self.NodeType = NodeType
+        # Alternatives to try depending on the current token, see prepare()
+        self._dispatch = None
+        self._always = None
 
     def match(self, tokens, offset):
         """
         see parser.Rule.match
         """
+        rules = self.rules
+        if self._dispatch is not None:
+            token = parser.token_at(tokens, offset)
+            if token is not None:
+                key = _token_key(token)
+                rules = self._dispatch.get(key)
+                if rules is None and key[1] is not None:
+                    rules = self._dispatch.get((key[0], None))
+                if rules is None:
+                    rules = self._always
+            else:
+                rules = self._always
+
         # Basically, just match the longest rule, watching out for not having two matching rules of the same
-        # length
-        matches = []
-        for rule in self.rules:
-            # TODO: handle left recursion gracefully
-            length, node = rule.match(tokens, offset)
-            matches.append((length, node))
+        # length. The alternatives which were not tried would have failed, which counts as an empty match
+        matches = [] if len(rules) == len(self.rules) else [(0, None)]
+        if len(rules) == 1:
+            # Left recursion is handled by the packrat cache (see parser.Memo.match)
+            matches.append(parser.match(rules[0], tokens, offset))
+        else:
+            # The next alternatives start at the same offset, and the result of any alternative may be dropped
+            # (by a longer or an ambiguous match), so the tokens are kept until all of them are matched
+            parser.pin(tokens, offset)
+            try:
+                for rule in rules:
+                    matches.append(parser.match(rule, tokens, offset))
+            finally:
+                parser.unpin(tokens, offset)
 
         matches.sort(key = lambda match: match[0])
         if len(matches) == 0:
@@ -86,6 +310,48 @@ class AnyOf(parser.Rule):
             else:
                 return first[0], self.NodeType(first[1])
 
+    def get_sub_rules(self):
+        """
+        see parser.Rule.get_sub_rules
+        """
+        return list(self.rules)
+
+    def get_first_tokens(self, sets):
+        """
+        see parser.Rule.get_first_tokens
+        """
+        keys = set()
+        nullable = False
+        for rule in self.rules:
+            first = sets[rule]
+            if first is None:
+                return None
+            keys |= first[0]
+            nullable = nullable or first[1]
+        return keys, nullable
+
+    def prepare(self, sets):
+        """
+        Build the table of the alternatives which may match each token, so that the others are not tried
+
+        see parser.Rule.prepare
+        """
+        # Alternatives with unknown FIRST sets and nullable ones have to be tried for any token
+        always = [rule for rule in self.rules if sets.get(rule) is None or sets[rule][1]]
+        keys = set()
+        for rule in self.rules:
+            if rule not in always:
+                keys |= sets[rule][0]
+        dispatch = {}
+        for key in keys:
+            general = (key[0], None)
+            dispatch[key] = [
+                rule for rule in self.rules
+                if rule in always or key in sets[rule][0] or general in sets[rule][0]
+            ]
+        self._dispatch = dispatch
+        self._always = always
+
 
 class Optional(parser.Rule):
     """
@@ -110,7 +376,12 @@ class Optional(parser.Rule):
         """
         see parser.Rule.match
         """
-        length, node = self.rule.match(tokens, offset)
+        # If the sub-rule fails, the calling rule continues at the same offset
+        parser.pin(tokens, offset)
+        try:
+            length, node = parser.match(self.rule, tokens, offset)
+        finally:
+            parser.unpin(tokens, offset)
         if length <= 0 or node is None:
             raise parser.SkipRule()
         else:
@@ -119,6 +390,21 @@ class Optional(parser.Rule):
             else:
                 return length, self.NodeType(node)
 
+    def get_sub_rules(self):
+        """
+        see parser.Rule.get_sub_rules
+        """
+        return [self.rule]
+
+    def get_first_tokens(self, sets):
+        """
+        see parser.Rule.get_first_tokens
+        """
+        first = sets[self.rule]
+        if first is None:
+            return None
+        return first[0], True
+
 
 class OneOrMore(parser.Rule):
     """
@@ -142,17 +428,243 @@ class OneOrMore(parser.Rule):
         """
         see parser.Rule.match
         """
-        matches = []
+        # The same as iter_match(), without the intermediate tuples
+        start = offset
+        nodes = []
         while True:
-            length, node = self.rule.match(tokens, offset)
+            # If the iteration fails, the matching continues at its start
+            parser.pin(tokens, offset)
+            try:
+                length, node = parser.match(self.rule, tokens, offset)
+            finally:
+                parser.unpin(tokens, offset)
             if length <= 0 or node is None:
                 break
-            matches.append((length, node))
+            nodes.append(node)
             offset += length
-        if len(matches) == 0:
-            return 0, None
-        total_length = sum([match[0] for match in matches])
-        nodes = [match[1] for match in matches]
+            parser.commit(tokens, offset)
         if len(nodes) == 0:
             return 0, None
-        return total_length, self.NodeType(nodes, pi=nodes[0]._posinfo)
+        return offset - start, self.NodeType(nodes, pi=nodes[0]._posinfo)
+
+    def iter_match(self, tokens, offset):
+        """
+        Yield the matches of the sub-rule one by one
+
+        see parser.Rule.iter_match
+        """
+        while True:
+            parser.pin(tokens, offset)
+            try:
+                length, node = parser.match(self.rule, tokens, offset)
+            finally:
+                parser.unpin(tokens, offset)
+            if length <= 0 or node is None:
+                break
+            offset += length
+            parser.commit(tokens, offset)
+            yield length, node
+
+    def get_sub_rules(self):
+        """
+        see parser.Rule.get_sub_rules
+        """
+        return [self.rule]
+
+    def get_first_tokens(self, sets):
+        """
+        see parser.Rule.get_first_tokens
+        """
+        return sets[self.rule]
+
+
+class Operator(object):
+    """
+    Description of an operator for the Precedence parser rule
+    """
+    def __init__(self, token, precedence, NodeType, *, kind=INFIX, associativity=LEFT):
+        """
+        Constructor
+
+        Arguments:
+            token         - token pattern matching the operator (compared like the elements of the TokenSequence
+                            sequence)
+            precedence    - number. Operators with higher precedence bind tighter
+            NodeType      - class of the AST node created for the operator. Its value is the list of the operand
+                            nodes and the operator token, in the order of appearance: [operator, operand] for
+                            prefix, [left, operator, right] for infix and [operand, operator] for postfix operators
+            kind          - PREFIX, INFIX or POSTFIX
+            associativity - LEFT or RIGHT, only matters for infix operators
+
+        Raises:
+            ValueError if `kind` or `associativity` is invalid
+        """
+        if kind not in (PREFIX, INFIX, POSTFIX):
+            raise ValueError('Invalid operator kind: {!r}'.format(kind))
+        if associativity not in (LEFT, RIGHT):
+            raise ValueError('Invalid associativity: {!r}'.format(associativity))
+        self.token = token
+        self.precedence = precedence
+        self.NodeType = NodeType
+        self.kind = kind
+        self.associativity = associativity
+
+
+class _OperatorTable(object):
+    """
+    Operators indexed by the tokens they match
+
+    Internal class
+    """
+    def __init__(self, operators):
+        # (token class, content) -> list of operators
+        self.index = {}
+        # Operators with custom token patterns, which have to be checked one by one
+        self.other = []
+        for operator in operators:
+            key = _pattern_key(operator.token)
+            if key is None:
+                self.other.append(operator)
+            else:
+                self.index.setdefault(key, []).append(operator)
+
+    def find(self, token):
+        """
+        Find the operator matching the token
+
+        Arguments:
+            token - the token
+
+        Returns:
+            Operator object  OR  None if no operator matches
+        """
+        token_type = type(token)
+        candidates = None
+        if isinstance(token, lexer.SimpleToken):
+            candidates = self.index.get((token_type, token.content))
+        if candidates is None:
+            candidates = self.index.get((token_type, None), self.other)
+        for operator in candidates:
+            if operator.token.is_identical(token):
+                return operator
+        if candidates is not self.other:
+            for operator in self.other:
+                if operator.token.is_identical(token):
+                    return operator
+        return None
+
+
+class Precedence(parser.Rule):
+    """
+    A parser rule matching expressions with prefix, infix and postfix operators using operator precedence
+    (Pratt parsing)
+
+    The whole expression is parsed in one pass: each token is examined once, and only the operands are matched
+    by a sub-rule, no matter how many precedence levels there are
+    """
+    def __init__(self, operand, operators):
+        """
+        Constructor
+
+        Arguments:
+            operand   - sub-rule matching the operands (numbers, variables, parenthesized expressions, etc.)
+            operators - list of Operator objects. If a token is both a prefix and an infix (or postfix) operator,
+                        it is treated as a prefix one where an operand is expected
+
+        Raises:
+            None
+        """
+        self.operand = operand
+        self.operators = operators
+        self._prefix = _OperatorTable([operator for operator in operators if operator.kind == PREFIX])
+        self._non_prefix = _OperatorTable([operator for operator in operators if operator.kind != PREFIX])
+
+    def match(self, tokens, offset):
+        """
+        see parser.Rule.match
+        """
+        return self._match_expression(tokens, offset, None, True)
+
+    def get_sub_rules(self):
+        """
+        see parser.Rule.get_sub_rules
+        """
+        return [self.operand]
+
+    def get_first_tokens(self, sets):
+        """
+        see parser.Rule.get_first_tokens
+        """
+        first = sets[self.operand]
+        if first is None:
+            return None
+        keys = set(first[0])
+        for operator in self.operators:
+            if operator.kind == PREFIX:
+                key = _pattern_key(operator.token)
+                if key is None:
+                    return None
+                keys.add(key)
+        return keys, first[1]
+
+    def _match_expression(self, tokens, offset, limit, inclusive):
+        """
+        Match an expression containing only the operators with precedence above the limit
+
+        Internal method
+
+        Arguments:
+            tokens    - token sequence
+            offset    - offset in that sequence
+            limit     - minimal precedence of the operators to consume. None means no limit
+            inclusive - whether operators with precedence equal to the limit may be consumed
+
+        Returns:
+            see parser.Rule.match
+        """
+        position = offset
+        token = parser.token_at(tokens, position)
+        operator = self._prefix.find(token) if token is not None else None
+        if operator is not None:
+            length, operand = self._match_expression(tokens, position + 1, operator.precedence, True)
+            if length <= 0 or operand is None:
+                return 0, None
+            node = operator.NodeType([token, operand], pi=token._posinfo)
+            position += 1 + length
+        else:
+            length, node = parser.match(self.operand, tokens, position)
+            if length <= 0 or node is None:
+                return 0, None
+            position += length
+
+        while True:
+            token = parser.token_at(tokens, position)
+            if token is None:
+                break
+            operator = self._non_prefix.find(token)
+            if operator is None:
+                break
+            if limit is not None and not (operator.precedence > limit or inclusive and operator.precedence == limit):
+                break
+            if operator.kind == POSTFIX:
+                node = operator.NodeType([node, token], pi=node._posinfo)
+                position += 1
+                continue
+            # If the right operand fails, the expression ends before the operator
+            parser.pin(tokens, position)
+            try:
+                length, right = self._match_expression(
+                    tokens,
+                    position + 1,
+                    operator.precedence,
+                    operator.associativity == RIGHT,
+                )
+            finally:
+                parser.unpin(tokens, position)
+            if length <= 0 or right is None:
+                # The operator is not a part of this expression
+                break
+            node = operator.NodeType([node, token, right], pi=node._posinfo)
+            position += 1 + length
+
+        return position - offset, node
@@ -2,11 +2,17 @@
 # This file is licensed under the MIT license. See LICENSE file
 
 
+import bisect
+import codecs
+import re
+
 class Posinfo(object):
     """
     Represents a position in the source code (column and row)
     """
 
+    __slots__ = ('row', 'col')
+
     def __init__(self, row, col):
         """
         Constructor
@@ -68,20 +74,29 @@ class Posinfo(object):
             IndexError if end < start or start < 0 or end > len(data)
 
         Complexity:
-            O(end - start)
+            O(end - start), but the characters are scanned by str.count() and str.rfind(), not by Python code
         """
         if end is None:
             end = len(data)
         if end < start or start < 0 or end > len(data):
             raise IndexError((start, end))
 
-        for i in range(start, end):
-            if data[i] == '\n':
-                self.row += 1
-                self.col = 1
-            else:
-                self.col += 1
-        
+        self.row, self.col = advance(self.row, self.col, data, start, end)
+
+    def freeze(self):
+        """
+        Return an immutable copy of this object
+
+        Arguments:
+            None
+
+        Returns:
+            Position object pointing to the same position
+
+        Raises:
+            None
+        """
+        return Position(self.row, self.col)
 
     def __str__(self):
         return '{}:{}'.format(self.row, self.col)
@@ -90,19 +105,304 @@ class Posinfo(object):
         return 'Posinfo({})'.format(str(self))
 
     def __eq__(self, other):
+        if not hasattr(other, 'row') or not hasattr(other, 'col'):
+            return NotImplemented
         return (self.row, self.col) == (other.row, other.col)
 
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+
+class Position(tuple):
+    """
+    Immutable position in the source code (row and column)
+
+    Unlike Posinfo, objects of this class can be safely shared between tokens and nodes without copying.
+    They compare equal to Posinfo objects pointing to the same position, and to (row, col) tuples, with which
+    they share the hash
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, row, col):
+        """
+        Constructor
+
+        Arguments:
+            row - row, indexed from 1
+            col - column, indexed from 1
+
+        Raises:
+            None
+        """
+        return tuple.__new__(cls, (row, col))
+
+    @property
+    def row(self):
+        return self[0]
+
+    @property
+    def col(self):
+        return self[1]
+
+    def __str__(self):
+        return '{}:{}'.format(self[0], self[1])
+
+    def __repr__(self):
+        return 'Position({})'.format(str(self))
+
+    def __eq__(self, other):
+        if isinstance(other, tuple):
+            return tuple.__eq__(self, other)
+        if not hasattr(other, 'row') or not hasattr(other, 'col'):
+            return NotImplemented
+        return (self[0], self[1]) == (other.row, other.col)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return tuple.__hash__(self)
+
+    def __getnewargs__(self):
+        return (self[0], self[1])
+
+    def advanced(self, data, start=0, end=None):
+        """
+        Return the position obtained by moving this one over a piece of the source code
+
+        Works like Posinfo.feed, but returns a new object
+
+        Arguments:
+            data  - source code
+            start - current position
+            end   - next position. None means len(data)
+
+        Returns:
+            Position object pointing to data[end]
+
+        Raises:
+            None
+        """
+        if end is None:
+            end = len(data)
+        return Position(*advance(self[0], self[1], data, start, end))
+
+
+class LineIndex(object):
+    """
+    Table of offsets at which the lines of some text start
+
+    Allows to convert an offset in the text into a position in O(log n), where n is the number of lines.
+    The table is built on the first conversion, in a single pass over the text made by str.find() (or re.finditer()
+    for encoded text)
+    """
+
+    # Encodings in which every character takes exactly one byte, so columns can be computed without decoding
+    SINGLE_BYTE_ENCODINGS = ('ascii', 'iso8859-1')
+
+    def __init__(self, data, encoding=None):
+        """
+        Constructor
+
+        Arguments:
+            data     - source code: a string or encoded text (bytes, mmap.mmap object, etc.)
+            encoding - encoding of `data` if it is encoded. It is used to count columns in characters rather than
+                       in bytes. None means that columns are counted in elements of `data`
+
+        Raises:
+            LookupError if the encoding is unknown
+        """
+        self.data = data
+        self._starts = None
+        self._decode = None
+        if encoding is not None and codecs.lookup(encoding).name not in self.SINGLE_BYTE_ENCODINGS:
+            self._decode = codecs.getdecoder(encoding)
+
+    def position(self, offset):
+        """
+        Convert an offset into a position
+
+        Arguments:
+            offset - offset in the source code, indexed from 0. Offsets past the end of the source code are
+                     allowed and are treated as if they were on the last line
+
+        Returns:
+            Position object
+
+        Raises:
+            None
+
+        Complexity:
+            O(log n), where n is the number of lines. The first call takes O(len(data))
+        """
+        if self._starts is None:
+            self._starts = self._find_starts()
+        row = bisect.bisect_right(self._starts, offset)
+        line_start = self._starts[row - 1]
+        if self._decode is None:
+            return Position(row, offset - line_start + 1)
+        return Position(row, len(self._decode(self.data[line_start : offset])[0]) + 1)
+
+    def edit(self, data, offset, removed, inserted):
+        """
+        Update the table after a piece of the source code was replaced
+
+        Only the line starts after the edit are shifted, the table is not rebuilt
+
+        Arguments:
+            data     - the new source code
+            offset   - offset of the replaced piece
+            removed  - length of the replaced piece
+            inserted - the text which replaced it
+
+        Returns:
+            None
+
+        Raises:
+            None
+        """
+        self.data = data
+        if self._starts is None:
+            return
+        starts = self._starts
+        delta = len(inserted) - removed
+        first = bisect.bisect_right(starts, offset)
+        last = bisect.bisect_right(starts, offset + removed)
+        newline = '\n' if isinstance(inserted, str) else b'\n'
+        added = []
+        index = inserted.find(newline)
+        while index != -1:
+            added.append(offset + index + 1)
+            index = inserted.find(newline, index + 1)
+        if delta == 0 and first == last and len(added) == 0:
+            return
+        # map() with a bound method shifts the starts at C speed
+        starts[first:] = added + list(map(delta.__add__, starts[last:]))
+
+    def _find_starts(self):
+        """
+        Build the table of line starts
+
+        Internal method
+        """
+        if not isinstance(self.data, str):
+            return [0] + [match.end() for match in re.finditer(b'\n', self.data)]
+        starts = [0]
+        find = self.data.find
+        index = find('\n')
+        while index != -1:
+            starts.append(index + 1)
+            index = find('\n', index + 1)
+        return starts
+
+
+class Span(object):
+    """
+    Position of a piece of the source code given by its start and end offsets
+
+    Row and column of the start are not stored, they are computed from the line index when requested for the
+    first time. Spans compare equal to Posinfo and Position objects pointing to the same position
+    """
+
+    __slots__ = ('lines', 'start', 'end', '_position')
+
+    def __init__(self, lines, start, end, position=None):
+        """
+        Constructor
+
+        Arguments:
+            lines    - LineIndex object for the source code. May be None if `position` is specified
+            start    - offset of the first character
+            end      - offset past the last character
+            position - Position of the first character, if already known
+
+        Raises:
+            None
+        """
+        self.lines = lines
+        self.start = start
+        self.end = end
+        self._position = position
+
+    def position(self):
+        """
+        Return the position of the start of the span
+
+        Arguments:
+            None
+
+        Returns:
+            Position object
+
+        Raises:
+            None
+        """
+        if self._position is None:
+            self._position = self.lines.position(self.start)
+        return self._position
+
+    @property
+    def row(self):
+        return self.position()[0]
+
+    @property
+    def col(self):
+        return self.position()[1]
+
+    def __str__(self):
+        return str(self.position())
+
+    def __repr__(self):
+        return 'Span({} [{}:{}])'.format(str(self), self.start, self.end)
+
+    def __eq__(self, other):
+        return self.position() == other
+
     def __ne__(self, other):
         return not (self == other)
 
 
+def advance(row, col, data, start, end):
+    """
+    Move the position over a piece of the source code
+
+    Assuming (row, col) is the position of data[start], compute the position of data[end]. Newlines are counted
+    by str.count() and the column is found by str.rfind(), so the whole piece is processed at C speed
+
+    Arguments:
+        row   - current row, indexed from 1
+        col   - current column, indexed from 1
+        data  - source code
+        start - current offset
+        end   - next offset
+
+    Returns:
+        (row, col) tuple
+
+    Raises:
+        None
+
+    Complexity:
+        O(end - start)
+    """
+    newline = '\n' if isinstance(data, str) else b'\n'
+    newlines = data.count(newline, start, end)
+    if newlines == 0:
+        return row, col + end - start
+    return row + newlines, end - data.rfind(newline, start, end)
+
+
 def from_data(data, offset):
     """
     Construct a Posinfo object given the input string and offset in it
 
-    Warning: this function is quite slow, as it has to iterate over all
-    characters in data[:offset] (see Complexity section). If misused,
-    it may make tokenization run in O(n²), where n is the length of input
+    Warning: this function has to scan all characters in data[:offset]
+    (see Complexity section). If misused, it may make tokenization run
+    in O(n²), where n is the length of input. Use LineIndex to convert
+    many offsets in the same input
 
     Arguments:
         data - input string
@@ -120,11 +420,4 @@ def from_data(data, offset):
     if offset < 0 or offset >= len(data):
         raise IndexError(offset)
 
-    row, col = 1, 1
-    for index in range(offset):
-        if data[index] == '\n':
-            row += 1
-            col = 1
-        else:
-            col += 1
-    return Posinfo(row, col)
+    return Posinfo(*advance(1, 1, data, 0, offset))
@@ -0,0 +1,351 @@
+# (c) 2019 Alexander Korzun
+# This file is licensed under the MIT license. See LICENSE file
+
+
+from . import parser
+from . import parser_rules
+
+
+# Kinds of the compiled rules
+_TOKENS   = 'tokens'
+_SEQUENCE = 'sequence'
+_CHOICE   = 'choice'
+_OPTIONAL = 'optional'
+_REPEAT   = 'repeat'
+_LEAF     = 'leaf'
+
+# Kinds of the rules which are compiled into the tables, by the class whose match() method they use
+_KINDS = {
+    parser_rules.TokenSequence.match: _TOKENS,
+    parser_rules.Sequence.match:      _SEQUENCE,
+    parser_rules.AnyOf.match:         _CHOICE,
+    parser_rules.Optional.match:      _OPTIONAL,
+    parser_rules.OneOrMore.match:     _REPEAT,
+}
+
+
+class _Fallback(Exception):
+    """
+    Exception indicating that the table-driven engine cannot decide how to proceed
+
+    Internal class
+    """
+    pass
+
+
+# Value of a skipped rule, see parser.SkipRule
+_SKIPPED = object()
+
+
+def _predict(table, token):
+    """
+    Look up the token in a prediction table
+
+    Internal function
+
+    Arguments:
+        table - dict mapping token pattern keys (see parser.Rule.get_first_tokens) to values
+        token - the token
+
+    Returns:
+        the value for the token  OR  None if the table contains no matching key
+    """
+    key = parser_rules._token_key(token)
+    value = table.get(key)
+    if value is None and key[1] is not None:
+        value = table.get((key[0], None))
+    return value
+
+
+def _overlaps(key, keys):
+    """
+    Check if a token pattern key may match the same tokens as any of the keys
+
+    Internal function
+
+    Arguments:
+        key  - token pattern key
+        keys - set of token pattern keys
+
+    Returns:
+        True or False
+    """
+    if key in keys:
+        return True
+    if key[1] is None:
+        return any(other[0] is key[0] for other in keys)
+    return (key[0], None) in keys
+
+
+class TableParser(parser.Parser):
+    """
+    Parser driving the built-in rules (TokenSequence, Sequence, AnyOf, Optional and OneOrMore) with LL(1) parse
+    tables and an explicit stack instead of recursive calls of the match() methods
+
+    This avoids the cost of a method call per rule and the recursion limit on deeply nested input. The result is
+    always the same as the one of Parser:
+
+    - Other rules are leaves: they are matched by their match() methods
+    - If the grammar cannot be compiled (see compile()), Parser is used instead
+    - If the input needs backtracking (a predicted rule fails to match), it is parsed again with Parser
+
+    Since the input may be parsed twice, token iterators are read into a list rather than streamed
+    """
+    def __init__(self, **kwargs):
+        """
+        Constructor
+
+        Arguments:
+            see parser.Parser.__init__. The options only affect the parsing with Parser
+        """
+        super().__init__(**kwargs)
+        self._entries = None
+        self.blocking_rules = None
+        # Whether the last parsing was performed by the table-driven engine
+        self.used_tables = False
+
+    def set_root_rule(self, rule):
+        """
+        see parser.Parser.set_root_rule
+        """
+        super().set_root_rule(rule)
+        self._entries = None
+        self.blocking_rules = None
+
+    def compile(self):
+        """
+        Compile the grammar into the parse tables
+
+        Called automatically before the first parsing. A rule blocks the compilation if it needs backtracking:
+
+        - AnyOf with alternatives which may start with the same token (LL(1) conflict), with nullable alternatives
+          or with alternatives whose FIRST sets are unknown (see parser.Rule.get_first_tokens)
+        - Optional and OneOrMore with nullable sub-rules or sub-rules whose FIRST sets are unknown
+        - Left-recursive rules
+
+        Arguments:
+            None
+
+        Returns:
+            dict mapping the blocking rules to the descriptions of the reasons (empty if the grammar was compiled).
+            Also available as self.blocking_rules
+
+        Raises:
+            None
+        """
+        sets = parser.first_sets(self.root_rule)
+        for rule in sets:
+            rule.prepare(sets)
+        self._prepared = True
+
+        entries = {}
+        blocking = {}
+        # Rules which may be matched at the same offset before consuming a token, for left recursion detection
+        heads = {}
+        stack = [self.root_rule]
+        while len(stack) > 0:
+            rule = stack.pop()
+            if rule in entries:
+                continue
+            kind = _KINDS.get(type(rule).match, _LEAF)
+            if kind == _TOKENS:
+                entries[rule] = (kind, rule)
+            elif kind == _SEQUENCE:
+                entries[rule] = (kind, rule)
+                stack.extend(rule.rules)
+                heads[rule] = []
+                for sub_rule in rule.rules:
+                    heads[rule].append(sub_rule)
+                    if sets[sub_rule] is None or not sets[sub_rule][1]:
+                        break
+            elif kind == _CHOICE:
+                table = {}
+                for sub_rule in rule.rules:
+                    first = sets[sub_rule]
+                    if first is None:
+                        blocking[rule] = 'alternative with unknown FIRST set: {!r}'.format(sub_rule)
+                        break
+                    if first[1]:
+                        blocking[rule] = 'nullable alternative: {!r}'.format(sub_rule)
+                        break
+                    conflicts = [key for key in first[0] if _overlaps(key, table.keys())]
+                    if len(conflicts) > 0:
+                        blocking[rule] = 'LL(1) conflict on {!r}'.format(conflicts[0])
+                        break
+                    for key in first[0]:
+                        table[key] = sub_rule
+                entries[rule] = (kind, rule, table)
+                stack.extend(rule.rules)
+                heads[rule] = list(rule.rules)
+            elif kind == _OPTIONAL or kind == _REPEAT:
+                first = sets[rule.rule]
+                if first is None:
+                    blocking[rule] = 'sub-rule with unknown FIRST set: {!r}'.format(rule.rule)
+                    table = {}
+                elif first[1]:
+                    blocking[rule] = 'nullable sub-rule: {!r}'.format(rule.rule)
+                    table = {}
+                else:
+                    table = {key: rule.rule for key in first[0]}
+                entries[rule] = (kind, rule, table)
+                stack.append(rule.rule)
+                heads[rule] = [rule.rule]
+            else:
+                entries[rule] = (kind, rule)
+
+        for rule in heads:
+            if rule not in blocking and self._is_left_recursive(rule, heads):
+                blocking[rule] = 'left recursion'
+
+        self._entries = entries
+        self.blocking_rules = blocking
+        return blocking
+
+    @staticmethod
+    def _is_left_recursive(rule, heads):
+        """
+        Check if a rule may be matched again at the same offset before consuming a token
+
+        Internal method
+
+        Arguments:
+            rule  - the rule
+            heads - dict mapping the compiled rules to the sub-rules matched at the same offset as them
+
+        Returns:
+            True or False
+        """
+        seen = set()
+        stack = list(heads[rule])
+        while len(stack) > 0:
+            current = stack.pop()
+            if current is rule:
+                return True
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend(heads.get(current, []))
+        return False
+
+    def parse(self, tokens):
+        """
+        see parser.Parser.parse
+        """
+        if self._entries is None:
+            self.compile()
+        if len(self.blocking_rules) > 0:
+            self.used_tables = False
+            return super().parse(tokens)
+
+        if type(tokens) is not list:
+            tokens = list(tokens)
+        try:
+            length, node = self._run(tokens)
+        except _Fallback:
+            self.used_tables = False
+            return super().parse(tokens)
+        self.used_tables = True
+        if length < len(tokens):
+            raise parser.IncompleteError(tokens[length])
+        return node
+
+    def _run(self, tokens):
+        """
+        Match the root rule with the table-driven engine
+
+        Internal method
+
+        Arguments:
+            tokens - list of tokens
+
+        Returns:
+            (length, node) tuple, see parser.Rule.match
+
+        Raises:
+            _Fallback if the input has to be parsed by Parser
+        """
+        entries = self._entries
+        count = len(tokens)
+        offset = 0
+        # Frames of the rules being matched: [entry, start offset, nodes]
+        stack = []
+        entry = entries[self.root_rule]
+        while True:
+            # Start matching the rule `entry`: either compute its value or push a frame and go to the sub-rule
+            kind = entry[0]
+            rule = entry[1]
+            if kind == _TOKENS:
+                sequence = rule.sequence
+                end = offset + len(sequence)
+                if end > count:
+                    raise _Fallback()
+                for index in range(len(sequence)):
+                    if not sequence[index].is_identical(tokens[offset + index]):
+                        raise _Fallback()
+                value = rule.NodeType(parser.TokenRange(tokens, offset, end), pi=tokens[offset]._posinfo)
+                offset = end
+            elif kind == _SEQUENCE:
+                stack.append([entry, offset, []])
+                entry = entries[rule.rules[0]]
+                continue
+            elif kind == _CHOICE or kind == _REPEAT:
+                sub_rule = _predict(entry[2], tokens[offset]) if offset < count else None
+                if sub_rule is None:
+                    raise _Fallback()
+                stack.append([entry, offset, []])
+                entry = entries[sub_rule]
+                continue
+            elif kind == _OPTIONAL:
+                if offset < count and _predict(entry[2], tokens[offset]) is not None:
+                    stack.append([entry, offset, None])
+                    entry = entries[rule.rule]
+                    continue
+                value = _SKIPPED
+            else:
+                try:
+                    length, node = parser.match(rule, tokens, offset)
+                except parser.SkipRule:
+                    value = _SKIPPED
+                else:
+                    if length <= 0 or node is None:
+                        raise _Fallback()
+                    value = node
+                    offset += length
+
+            # Pass the value to the rules on the stack, until one of them needs to match another sub-rule
+            while True:
+                if len(stack) == 0:
+                    if value is _SKIPPED:
+                        raise _Fallback()
+                    return offset, value
+                frame = stack[-1]
+                kind = frame[0][0]
+                rule = frame[0][1]
+                if kind == _SEQUENCE:
+                    nodes = frame[2]
+                    nodes.append(None if value is _SKIPPED else value)
+                    if len(nodes) < len(rule.rules):
+                        entry = entries[rule.rules[len(nodes)]]
+                        break
+                    stack.pop()
+                    if offset == frame[1]:
+                        raise _Fallback()
+                    pi = next(node for node in nodes if node is not None)._posinfo
+                    value = rule.NodeType(nodes, pi=pi)
+                    continue
+                if value is _SKIPPED:
+                    raise _Fallback()
+                if kind == _REPEAT:
+                    nodes = frame[2]
+                    nodes.append(value)
+                    sub_rule = _predict(frame[0][2], tokens[offset]) if offset < count else None
+                    if sub_rule is not None:
+                        entry = entries[sub_rule]
+                        break
+                    stack.pop()
+                    value = rule.NodeType(nodes, pi=nodes[0]._posinfo)
+                    continue
+                # AnyOf and Optional. AnyOf with a single alternative returns its node as is (see AnyOf.match)
+                stack.pop()
+                if rule.NodeType is not None and (kind == _OPTIONAL or len(rule.rules) > 1):
+                    value = rule.NodeType(value)
@@ -1,4 +1,4 @@
-from parx.posinfo import Posinfo
+from parx.posinfo import Posinfo, Position, LineIndex, Span, from_data
 from parx.lexer import *
 from parx.lexer_rules import *
 
@@ -40,3 +40,56 @@ def test2():
         SimpleToken ('\n', P(2, 3)),
         SimpleToken ('b',  P(3, 1)),
     ]
+
+
+def test3():
+    output3 = list(lexer.tokenize('ab\ncd'))
+    positions = [token._posinfo for token in output3]
+    assert positions == [P(1, 1), P(1, 3), P(2, 1)]
+    assert [(pi.start, pi.end) for pi in positions] == [(0, 2), (2, 3), (3, 5)]
+    assert all(isinstance(pi.position(), Position) for pi in positions)
+    with pytest.raises(AttributeError):
+        positions[0].position().row = 5
+    assert P(2, 1) == Position(2, 1)
+    assert Position(2, 1) != P(2, 2)
+    assert str(Position(3, 4)) == '3:4'
+
+
+def test4():
+    lines = LineIndex('ab\n\ncde\n')
+    assert lines.position(0) == P(1, 1)
+    assert lines.position(2) == P(1, 3)
+    assert lines.position(3) == P(2, 1)
+    assert lines.position(6) == P(3, 3)
+    assert lines.position(8) == P(4, 1)
+    assert LineIndex('').position(0) == P(1, 1)
+
+
+def test5():
+    data = 'ab\ncd\n\nefg'
+    for start in range(len(data) + 1):
+        for end in range(start, len(data) + 1):
+            expected = from_data(data + 'x', start)
+            for index in range(start, end):
+                expected = P(expected.row + 1, 1) if data[index] == '\n' else P(expected.row, expected.col + 1)
+            pi = from_data(data + 'x', start)
+            pi.feed(data, start, end)
+            assert pi == expected
+            assert from_data(data + 'x', start).freeze().advanced(data, start, end) == expected
+    with pytest.raises(IndexError):
+        P(1, 1).feed(data, 3, 2)
+
+
+def test6():
+    # Comparison with objects which are not positions
+    assert Position(1, 2) == (1, 2)
+    assert (1, 2) == Position(1, 2)
+    assert Position(1, 2) != (1, 3)
+    assert hash(Position(1, 2)) == hash((1, 2))
+    assert {(1, 2): 'x'}[Position(1, 2)] == 'x'
+    for other in (None, '1:2', 12, [1, 2]):
+        assert Position(1, 2) != other
+        assert not (Position(1, 2) == other)
+        assert P(1, 2) != other
+        assert not (P(1, 2) == other)
+        assert Span(LineIndex('ab'), 1, 2) != other
@@ -0,0 +1,84 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import pytest
+import re
+
+
+class LToken(SimpleToken):
+    pass
+
+
+class MToken(SimpleToken):
+    pass
+
+
+class RToken(SimpleToken):
+    pass
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class CustomRule(Rule):
+    # A rule without a regular expression equivalent, matching any run of '#' characters
+    def get_length(self, data, offset):
+        length = 0
+        while offset + length < len(data) and data[offset + length] == '#':
+            length += 1
+        return length
+
+
+lexer = Lexer(compiled=True)
+
+lexer.add(Attach(LToken, Regex(r'[qwert]+')))
+lexer.add(Attach(MToken, Regex(r'[rtyu]+')), priority=1)
+lexer.add(Attach(RToken, Regex(r'[yuiop]+')), priority=1)
+lexer.add(Attach(KeywordToken, String('if')), priority=2)
+lexer.add(Attach(KeywordToken, Regex(r'(?i)ELSE')), priority=2)
+lexer.add(CustomRule())
+lexer.add(Regex(re.compile(r'[ \n]+  # whitespace', re.VERBOSE)), ignore=True)
+
+P = Posinfo
+
+
+def test1():
+    input1 = 'qwert yui\nopoi uytrewq'
+    output1 = list(lexer.tokenize(input1))
+    assert output1 == [
+        LToken ('qwert', P(1, 1)),
+        RToken ('yui',   P(1, 7)),
+        RToken ('opoi',  P(2, 1)),
+        MToken ('uytr',  P(2, 6)),
+        LToken ('ewq',   P(2, 10)),
+    ]
+
+
+def test2():
+    input2 = 'if ## else ElSe\n#'
+    output2 = list(lexer.tokenize(input2))
+    assert output2 == [
+        KeywordToken ('if',   P(1, 1)),
+        SimpleToken  ('##',   P(1, 4)),
+        KeywordToken ('else', P(1, 7)),
+        KeywordToken ('ElSe', P(1, 12)),
+        SimpleToken  ('#',    P(2, 1)),
+    ]
+
+
+def test3():
+    with pytest.raises(AmbiguousTokenError):
+        list(lexer.tokenize('yuyuyu'))
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize('qwe $'))
+
+
+def test4():
+    # Rules added after the first tokenization must be taken into account
+    extra = Lexer(compiled=True)
+    extra.add(Attach(LToken, Regex(r'[a-z]+')))
+    assert list(extra.tokenize('abc')) == [LToken('abc', P(1, 1))]
+    extra.add(Attach(MToken, String('abcd')), priority=1)
+    assert list(extra.tokenize('abcd')) == [MToken('abcd', P(1, 1))]
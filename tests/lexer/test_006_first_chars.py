@@ -0,0 +1,77 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import pytest
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class SpaceToken(SimpleToken):
+    pass
+
+
+P = Posinfo
+
+
+def make_lexer(compiled):
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Attach(SpaceToken,   Regex(r'\s+')), ignore=True)
+    lexer.add(Attach(NumberToken,  Regex(r'-?[0-9]+')))
+    lexer.add(Attach(NameToken,    Regex(r'[a-z_][a-z0-9_]*')))
+    lexer.add(Attach(KeywordToken, String('for')), priority=1)
+    lexer.add(Attach(KeywordToken, String('-')))
+    return lexer
+
+
+def test1():
+    assert String('for').get_first_chars() == {'f'}
+    assert String('').get_first_chars() == set()
+    assert Regex(r'(?:ab|cd)*e').get_first_chars() == {'a', 'c', 'e'}
+    assert Regex(r'[+-]?x').get_first_chars() == {'+', '-', 'x'}
+    assert Regex(r'\s+').get_first_chars() is None
+    assert Regex(r'[^a]').get_first_chars() is None
+    assert Regex(r'(?i)a').get_first_chars() is None
+    assert Attach(NameToken, String('q')).get_first_chars() == {'q'}
+
+
+def test2():
+    lexer = make_lexer(False)
+    candidates = lambda char: [spec['rule'] for spec in lexer._table.first_char_index[char]]
+    assert len(candidates('-')) == 3
+    assert len(candidates('f')) == 3
+    assert len(candidates('7')) == 2
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test3(compiled):
+    lexer = make_lexer(compiled)
+    output = list(lexer.tokenize('for fort -12 - x\n 7'))
+    assert output == [
+        KeywordToken ('for',  P(1, 1)),
+        NameToken    ('fort', P(1, 5)),
+        NumberToken  ('-12',  P(1, 10)),
+        KeywordToken ('-',    P(1, 14)),
+        NameToken    ('x',    P(1, 16)),
+        NumberToken  ('7',    P(2, 2)),
+    ]
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize('x ?'))
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test4(compiled):
+    lexer = make_lexer(compiled)
+    lexer.add(Attach(NameToken, Regex(r'fo+r')), priority=1)
+    with pytest.raises(AmbiguousTokenError):
+        list(lexer.tokenize('for'))
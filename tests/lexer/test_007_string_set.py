@@ -0,0 +1,60 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import pytest
+
+
+class OperatorToken(SimpleToken):
+    pass
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+operators = StringSet(['+', '++', '+=', '-', '--', '-=', '=', '==', '===', '<', '<<', '<<='])
+keywords  = StringSet({'if': KeywordToken, 'else': KeywordToken, 'elif': KeywordToken, 'null': None})
+
+P = Posinfo
+
+
+def make_lexer(compiled):
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Regex(r'[ \n]+'), ignore=True)
+    lexer.add(Attach(OperatorToken, operators))
+    lexer.add(keywords, priority=1)
+    lexer.add(Attach(NameToken, Regex(r'[a-z]+')))
+    return lexer
+
+
+def test1():
+    assert operators.get_length('<<=1', 0) == 3
+    assert operators.get_length('<<1', 0) == 2
+    assert operators.get_length('=====', 1) == 3
+    assert operators.get_length('x+', 0) == 0
+    assert operators.get_length('+', 1) == 0
+    assert StringSet([]).get_length('abc', 0) == 0
+    assert keywords.get_first_chars() == {'i', 'e', 'n'}
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test2(compiled):
+    lexer = make_lexer(compiled)
+    output = list(lexer.tokenize('if x ++= y\nelse null <<== elsewhere'))
+    assert output == [
+        KeywordToken  ('if',        P(1, 1)),
+        NameToken     ('x',         P(1, 4)),
+        OperatorToken ('++',        P(1, 6)),
+        OperatorToken ('=',         P(1, 8)),
+        NameToken     ('y',         P(1, 10)),
+        KeywordToken  ('else',      P(2, 1)),
+        SimpleToken   ('null',      P(2, 6)),
+        OperatorToken ('<<=',       P(2, 11)),
+        OperatorToken ('=',         P(2, 14)),
+        NameToken     ('elsewhere', P(2, 16)),
+    ]
@@ -0,0 +1,82 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import io
+import pytest
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class StringToken(SimpleToken):
+    pass
+
+
+class OperatorToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+
+lexer.add(Regex(r'[ \n]+'), ignore=True)
+lexer.add(Attach(NumberToken,   Regex(r'[0-9]+')))
+lexer.add(Attach(StringToken,   Regex(r'"[^"]*"')))
+lexer.add(Attach(OperatorToken, StringSet(['+', '++', '+++'])))
+
+P = Posinfo
+
+
+def spans(tokens):
+    return [(token._posinfo.start, token._posinfo.end) for token in tokens]
+
+
+# The string token only matches when complete, so it has to fit in a chunk
+@pytest.mark.parametrize('chunk_size', [15, 16, 17, 20, 64])
+def test1(chunk_size):
+    data = '12 + 345\n"a long\nstring" +++ 6 ++\n\n7'
+    expected = list(lexer.tokenize(data))
+    output = list(lexer.tokenize_stream(io.StringIO(data), chunk_size=chunk_size))
+    assert output == expected
+    assert spans(output) == spans(expected)
+    assert output[3] == StringToken('"a long\nstring"', P(2, 1))
+    assert output[7] == NumberToken('7', P(5, 1))
+
+
+def test2():
+    assert list(lexer.tokenize_stream(io.StringIO(''), chunk_size=4)) == []
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize_stream(io.StringIO('1 + "unterminated'), chunk_size=4))
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize_stream(io.StringIO('1 + 2 @ 3 + 4'), chunk_size=4))
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test3():
+    # The error is raised without reading the rest of the input
+    reader = CountingReader('1 @ ' + '2 ' * 10000)
+    with pytest.raises(NoMatchingTokenError) as info:
+        list(lexer.tokenize_stream(reader, chunk_size=16))
+    assert reader.reads <= 2
+    assert len(info.value.data) <= 32
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5])
+def test4(chunk_size):
+    # Numbers and operators straddling chunk boundaries are matched again when the rest is read
+    data = '12 + 345\n+++ 6 ++\n\n7'
+    expected = list(lexer.tokenize(data))
+    output = list(lexer.tokenize_stream(io.StringIO(data), chunk_size=chunk_size))
+    assert output == expected
+    assert spans(output) == spans(expected)
+
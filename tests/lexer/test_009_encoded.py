@@ -0,0 +1,130 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import mmap
+import pytest
+
+
+class WordToken(SimpleToken):
+    pass
+
+
+class ArrowToken(SimpleToken):
+    pass
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+P = Posinfo
+
+
+def make_lexer(compiled):
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Regex(r'[ \n]+'), ignore=True)
+    lexer.add(Attach(WordToken, Regex(r'[^ \n→]+')))
+    lexer.add(Attach(ArrowToken, String('→')))
+    lexer.add(StringSet({'let': KeywordToken, 'λ': KeywordToken}), priority=1)
+    lexer.add(Attach(WordToken, Regex(r'[a-z]+')))
+    return lexer
+
+
+def ascii_lexer(compiled):
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Regex(r'[ \n]+'), ignore=True)
+    lexer.add(Attach(WordToken, Regex(r'\w+')))
+    lexer.add(Attach(ArrowToken, String('→')))
+    lexer.add(StringSet({'let': KeywordToken, 'λ': KeywordToken}), priority=1)
+    return lexer
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test1(compiled):
+    text = 'let x → λ\nlet yy→ z'
+    lexer = ascii_lexer(compiled)
+    expected = [
+        KeywordToken ('let', P(1, 1)),
+        WordToken    ('x',   P(1, 5)),
+        ArrowToken   ('→',   P(1, 7)),
+        KeywordToken ('λ',   P(1, 9)),
+        KeywordToken ('let', P(2, 1)),
+        WordToken    ('yy',  P(2, 5)),
+        ArrowToken   ('→',   P(2, 7)),
+        WordToken    ('z',   P(2, 9)),
+    ]
+    assert list(lexer.tokenize(text)) == expected
+    output = list(lexer.tokenize(text.encode('utf-8'), encoding='utf-8'))
+    assert output == expected
+    assert (output[3]._posinfo.start, output[3]._posinfo.end) == (10, 12)
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test2(compiled, tmp_path):
+    path = tmp_path / 'input.txt'
+    path.write_bytes('let a\n→ b'.encode('utf-8'))
+    lexer = ascii_lexer(compiled)
+    assert list(lexer.tokenize_file(path)) == [
+        KeywordToken ('let', P(1, 1)),
+        WordToken    ('a',   P(1, 5)),
+        ArrowToken   ('→',   P(2, 1)),
+        WordToken    ('b',   P(2, 3)),
+    ]
+    empty = tmp_path / 'empty.txt'
+    empty.write_bytes(b'')
+    assert list(lexer.tokenize_file(empty)) == []
+
+
+def test3():
+    lexer = ascii_lexer(False)
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize('let ö'.encode('utf-8'), encoding='utf-8'))
+    # A non-ASCII regular expression cannot be converted
+    with pytest.raises(LexerError):
+        list(make_lexer(False).tokenize(b'let', encoding='utf-8'))
+
+
+class ByteRule(Rule):
+    # Matches any non-ASCII character, but any non-ASCII byte of encoded input
+    def get_pattern(self):
+        return r'[^\x00-\x7f]'
+
+    def get_encoded_pattern(self, encoding):
+        return rb'[\x80-\xff]'
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test4(compiled):
+    # Expressions which may match a part of a multibyte character are rejected
+    for regex in [r'.', r'[^ ]+', r'\W', r'a|(?:b?[^a])+', r'\S']:
+        lexer = Lexer(compiled=compiled)
+        lexer.add(Regex(regex))
+        with pytest.raises(LexerError):
+            list(lexer.tokenize('é'.encode('utf-8'), encoding='utf-8'))
+        # Single-byte encodings are still supported
+        assert len(list(lexer.tokenize('é'.encode('latin-1'), encoding='latin-1'))) > 0
+    # A match ending in the middle of a character is no match
+    lexer = Lexer(compiled=compiled)
+    lexer.add(ByteRule())
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize('é'.encode('utf-8'), encoding='utf-8'))
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test5(compiled, tmp_path):
+    # Bytes rules match encoded input as is and make the same tokens as without the encoding
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Regex(r'[ \n]+'), ignore=True)
+    lexer.add(Attach(KeywordToken, String(b'GET')))
+    lexer.add(Attach(ArrowToken, String('→')))
+    data = 'GET →\nGET'.encode('utf-8')
+    expected = [KeywordToken(b'GET', P(1, 1)), ArrowToken('→', P(1, 5)), KeywordToken(b'GET', P(2, 1))]
+    output = list(lexer.tokenize(data, encoding='utf-8'))
+    assert output == expected
+    assert [type(token.content) for token in output] == [bytes, str, bytes]
+    assert list(lexer.tokenize(b'GET', encoding='ascii')) == list(lexer.tokenize(b'GET'))
+    path = tmp_path / 'input.txt'
+    path.write_bytes(data)
+    assert list(lexer.tokenize_file(path)) == expected
+    assert list(lexer.tokenize_parallel(data, rb'\n', encoding='utf-8', workers=2, segment_size=4)) == expected
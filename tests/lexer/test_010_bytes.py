@@ -0,0 +1,66 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import io
+import pytest
+
+
+class MethodToken(SimpleToken):
+    pass
+
+
+class PathToken(SimpleToken):
+    pass
+
+
+class VersionToken(SimpleToken):
+    pass
+
+
+class NewlineToken(SimpleToken):
+    pass
+
+
+P = Posinfo
+
+
+def make_lexer(compiled):
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Regex(rb' +'), ignore=True)
+    lexer.add(StringSet({b'GET': MethodToken, b'POST': MethodToken}))
+    lexer.add(Attach(PathToken,    Regex(rb'/[^ \r\n]*')))
+    lexer.add(Attach(VersionToken, Regex(rb'HTTP/[0-9]\.[0-9]')))
+    lexer.add(Attach(NewlineToken, String(b'\r\n')))
+    return lexer
+
+
+expected = [
+    MethodToken  (b'GET',      P(1, 1)),
+    PathToken    (b'/a?b=1',   P(1, 5)),
+    VersionToken (b'HTTP/1.1', P(1, 12)),
+    NewlineToken (b'\r\n',     P(1, 20)),
+    MethodToken  (b'POST',     P(2, 1)),
+    PathToken    (b'/\xff',    P(2, 6)),
+]
+
+
+def test1():
+    assert Regex(rb'[ab]c|d').get_first_chars() == {ord('a'), ord('b'), ord('d')}
+    assert String(b'xy').get_first_chars() == {ord('x')}
+    assert StringSet([b'ab', b'cd']).get_first_chars() == {ord('a'), ord('c')}
+    assert str(SimpleToken(b'GET')) == 'GET'
+    assert SimpleToken(b'GET').content == b'GET'
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test2(compiled):
+    data = b'GET /a?b=1 HTTP/1.1\r\nPOST /\xff'
+    lexer = make_lexer(compiled)
+    output = list(lexer.tokenize(data))
+    assert output == expected
+    assert (output[5]._posinfo.start, output[5]._posinfo.end) == (26, 28)
+    assert list(lexer.tokenize(bytearray(data))) == expected
+    assert list(lexer.tokenize_stream(io.BytesIO(data), chunk_size=8)) == expected
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize(b'PUT /'))
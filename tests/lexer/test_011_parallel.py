@@ -0,0 +1,59 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import pytest
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+class CommentToken(SimpleToken):
+    pass
+
+
+P = Posinfo
+
+
+lexer = Lexer(compiled=True)
+lexer.add(Regex(r'[ \n]+'), ignore=True)
+lexer.add(Attach(NumberToken,  Regex(r'[0-9]+')))
+lexer.add(Attach(NameToken,    Regex(r'[a-z]+')))
+lexer.add(Attach(CommentToken, Regex(r'(?s)/\*.*?\*/')))
+
+
+def split(data, offset):
+    # The first newline at or after the offset which is not inside a comment
+    end = data.find('\n', offset)
+    while end != -1 and data.rfind('/*', 0, end) > data.rfind('*/', 0, end):
+        end = data.find('\n', end + 1)
+    return None if end == -1 else end + 1
+
+
+def test1():
+    data = ''.join('abc 12 /* multi\nline */ x\n' if i % 7 == 0 else 'name %d\n' % i for i in range(2000))
+    output = list(lexer.tokenize_parallel(data, split, workers=3, segment_size=1000))
+    assert output == list(lexer.tokenize(data))
+    assert output[-1] == NumberToken('1999', P(2286, 6))
+
+
+def test2():
+    data = b'ab 1\ncd 2\n' * 500
+    output = list(lexer.tokenize_parallel(data, rb'\n', encoding='ascii', workers=2, segment_size=100))
+    assert output == list(lexer.tokenize(data, encoding='ascii'))
+    assert output[3] == NumberToken('2', P(2, 4))
+
+
+def test3():
+    data = 'ab 1\n' * 300 + '?\n' + 'ab 1\n' * 300
+    output = []
+    with pytest.raises(NoMatchingTokenError) as error:
+        for token in lexer.tokenize_parallel(data, r'\n', workers=2, segment_size=100):
+            output.append(token)
+    assert len(output) == 600
+    assert error.value.offset == 1500
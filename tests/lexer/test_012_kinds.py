@@ -0,0 +1,83 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import gc
+import pytest
+import sys
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class OperatorToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+P = Posinfo
+
+
+lexer = Lexer()
+lexer.add(Regex(r'\s+'), ignore=True)
+lexer.add(Attach(KeywordToken,  String('while')), priority=1)
+lexer.add(Attach(OperatorToken, StringSet(['+', '+=', '-'])))
+lexer.add(Attach(NameToken,     Regex(r'[a-z]+')))
+
+
+def test1():
+    kinds = [Token._kind_code, SimpleToken._kind_code, KeywordToken._kind_code, OperatorToken._kind_code,
+             NameToken._kind_code]
+    assert Token._kind_code == 0
+    assert len(set(kinds)) == len(kinds)
+    assert all(token_kinds[kind] is cls for kind, cls in zip(kinds, [Token, SimpleToken, KeywordToken,
+                                                                      OperatorToken, NameToken]))
+    assert KeywordToken('while')._kind_code == KeywordToken._kind_code
+
+
+def test2():
+    data = ''.join(['whi', 'le x += y while z'])
+    output = list(lexer.tokenize(data))
+    assert output == [
+        KeywordToken  ('while', P(1, 1)),
+        NameToken     ('x',     P(1, 7)),
+        OperatorToken ('+=',    P(1, 9)),
+        NameToken     ('y',     P(1, 12)),
+        KeywordToken  ('while', P(1, 14)),
+        NameToken     ('z',     P(1, 20)),
+    ]
+    # Keyword-like tokens share interned content strings
+    assert output[0].content is output[4].content is sys.intern('while')
+    assert output[2].content is list(lexer.tokenize(''.join(['+', '='])))[0].content
+
+
+def test3():
+    # Classes created dynamically are not kept alive by the registry, and their codes are reused
+    gc.collect()
+    count = len(token_kinds)
+    classes = [type('Dynamic{}'.format(index), (SimpleToken,), {}) for index in range(1000)]
+    assert len(token_kinds) == count + 1000
+    largest = max(cls._kind_code for cls in classes)
+    del classes
+    gc.collect()
+    assert len(token_kinds) == count
+    classes = [type('Dynamic{}'.format(index), (SimpleToken,), {}) for index in range(1000)]
+    assert max(cls._kind_code for cls in classes) == largest
+
+
+def test4():
+    # Token arrays keep the classes of their tokens alive, so their kind codes stay valid
+    dynamic = type('Dynamic', (SimpleToken,), {})
+    lexer_ = Lexer()
+    lexer_.add(Attach(dynamic, Regex(r'[a-z]+')))
+    tokens = lexer_.tokenize_array('abc')
+    del dynamic, lexer_
+    gc.collect()
+    type('Other', (SimpleToken,), {})
+    assert type(tokens[0]).__name__ == 'Dynamic'
+    with pytest.raises(OverflowError):
+        tokens.append(0x10000, 0, 1)
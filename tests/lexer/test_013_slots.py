@@ -0,0 +1,71 @@
+from parx.posinfo import Posinfo, Position
+from parx.lexer import *
+from parx.lexer_rules import *
+from parx.parser import Node
+
+import abc
+import pickle
+import pytest
+
+
+class NameToken(SimpleToken):
+    __slots__ = ()
+
+
+class HexToken(Token):
+    def __init__(self, content, pi=None):
+        super().__init__(pi)
+        self.value = int(content, 16)
+
+
+class PairToken(Token):
+    __slots__ = ('first', 'second')
+
+    def __init__(self, first, second, pi=None):
+        super().__init__(pi)
+        self.first = first
+        self.second = second
+
+
+class NameNode(Node):
+    pass
+
+
+class AbstractNode(Node, abc.ABC):
+    pass
+
+
+P = Posinfo
+
+
+def test1():
+    # Library classes and subclasses declaring __slots__ are slotted
+    for obj in [SimpleToken('x'), NameToken('x'), Posinfo(1, 1), Node(1)]:
+        assert not hasattr(obj, '__dict__')
+        with pytest.raises(AttributeError):
+            obj.extra = 1
+    # Other subclasses work as usual
+    node = NameNode(1)
+    node.parent = Node(2)
+    assert node.parent == Node(2)
+    assert AbstractNode(1).value == 1
+
+
+def test2():
+    # Subclasses defining __init__ may still add attributes
+    token = HexToken('ff', P(1, 1))
+    assert token.value == 255
+    token = PairToken('a', 'b', P(1, 1))
+    assert (token.first, token.second) == ('a', 'b')
+    assert not hasattr(token, '__dict__')
+
+
+def test3():
+    lexer = Lexer()
+    lexer.add(Regex(r'\s+'), ignore=True)
+    lexer.add(Attach(NameToken, Regex(r'[a-z]+')))
+    tokens = list(lexer.tokenize('ab\n cd'))
+    assert pickle.loads(pickle.dumps(tokens)) == [NameToken('ab', P(1, 1)), NameToken('cd', P(2, 2))]
+    node = NameNode(tokens, pi=Position(1, 1))
+    assert pickle.loads(pickle.dumps(node)) == node
+    assert pickle.loads(pickle.dumps(P(3, 4))) == P(3, 4)
@@ -0,0 +1,69 @@
+from parx.posinfo import Posinfo
+from parx.lexer import *
+from parx.lexer_rules import *
+
+import pytest
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+P = Posinfo
+
+
+def make_lexer(compiled):
+    lexer = Lexer(compiled=compiled)
+    lexer.add(Regex(r'\s+'), ignore=True)
+    lexer.add(Attach(KeywordToken, String('if')), priority=1)
+    lexer.add(Attach(NameToken,    Regex(r'[a-z]+')))
+    return lexer
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test1(compiled):
+    lexer = make_lexer(compiled)
+    profile = lexer.enable_profiling()
+    assert lexer.profile is profile
+    output = list(lexer.tokenize('if iffy x'))
+    assert output == [KeywordToken('if', P(1, 1)), NameToken('iffy', P(1, 4)), NameToken('x', P(1, 9))]
+
+    space, keyword, name = profile
+    assert profile.tokens == 5
+    # Rules with unknown first characters are tried everywhere
+    assert (space.attempts, space.matches, space.wins) == (5, 2, 2)
+    # 'if' and 'iffy' start with 'i', 'x' does not
+    assert (keyword.attempts, keyword.matches, keyword.wins) == (2, 2, 1)
+    assert keyword.lost_to_length == 1
+    assert (name.attempts, name.matches, name.wins) == (3, 3, 2)
+    assert name.lost_to_priority == 1
+    assert name.get_length_time > 0
+    assert profile.sorted('attempts')[0] is space
+    assert 'attempts' in str(profile)
+
+
+def test2():
+    lexer = make_lexer(False)
+    profile = lexer.enable_profiling()
+    with pytest.raises(NoMatchingTokenError):
+        list(lexer.tokenize('a ?'))
+    assert profile.errors == 1
+    # Rules added while profiling are taken into account
+    lexer.add(Attach(NameToken, String('?')))
+    assert len(list(lexer.tokenize('a ?'))) == 2
+    assert len(profile) == 4 and profile[3].wins == 1 and profile[3].index == 3
+    assert lexer.disable_profiling() is profile
+    list(lexer.tokenize('a ?'))
+    assert profile[3].wins == 1
+
+
+def test3():
+    # Encoded input is profiled against the same statistics
+    lexer = make_lexer(True)
+    profile = lexer.enable_profiling()
+    assert len(list(lexer.tokenize('if x'.encode('utf-8'), encoding='utf-8'))) == 2
+    assert profile[1].wins == 1 and profile[2].wins == 1
@@ -0,0 +1,105 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, Rule, match
+from parx import parser_rules as pr
+
+import pytest
+
+
+class WordToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(WordToken, lr.Regex(r'[a-z]+')))
+
+
+class WordNode(Node):
+    pass
+
+
+class ListNode(Node):
+    pass
+
+
+class CountingSequence(pr.TokenSequence):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def match(self, tokens, offset):
+        self.calls += 1
+        return super().match(tokens, offset)
+
+
+class Twice(Rule):
+    # Tries the sub-rule twice at the same offset, like two alternatives sharing a prefix would
+    def __init__(self, rule):
+        self.rule = rule
+
+    def match(self, tokens, offset):
+        match(self.rule, tokens, offset)
+        return match(self.rule, tokens, offset)
+
+
+def make_grammar(depth):
+    # Without memoization the number of matchings grows exponentially with the depth
+    leaf = CountingSequence([lr.IgnoreValue(WordToken())], NodeType=WordNode)
+    rule = leaf
+    for i in range(depth):
+        rule = Twice(rule)
+    return leaf, pr.OneOrMore(pr.AnyOf([rule, pr.OneOrMore(leaf, NodeType=ListNode)]), NodeType=ListNode)
+
+
+def test1():
+    tokens = list(lexer.tokenize('foo bar baz'))
+
+    leaf, rule = make_grammar(10)
+    parser = Parser()
+    parser.set_root_rule(rule)
+    expected = parser.parse(tokens)
+    assert parser.memo is None
+    plain_calls = leaf.calls
+
+    leaf, rule = make_grammar(10)
+    parser = Parser(memoize=True)
+    parser.set_root_rule(rule)
+    assert parser.parse(tokens) == expected
+    # Once at each offset, including the end of the input
+    assert leaf.calls == len(tokens) + 1
+    assert plain_calls > 100 * leaf.calls
+    assert parser.memo.hits > 0
+    assert 0 < parser.memo.hit_rate() < 1
+
+
+def test2():
+    tokens = list(lexer.tokenize(' '.join(['word'] * 1000)))
+
+    leaf, rule = make_grammar(3)
+    parser = Parser(memoize=True)
+    parser.set_root_rule(rule)
+    expected = parser.parse(tokens)
+    assert parser.memo.evictions == 0
+    assert len(parser.memo.table) > 1000
+
+    leaf, rule = make_grammar(3)
+    parser = Parser(memoize=True, memo_window=16)
+    parser.set_root_rule(rule)
+    assert parser.parse(tokens) == expected
+    assert parser.memo.evictions > 0
+    assert len(parser.memo.table) <= 16
+
+
+def test3():
+    # The heap of the offsets does not grow with the input when the offsets are evicted through the window.
+    # Precedence does not commit, so only the window bounds the cache
+    operand = pr.TokenSequence([lr.IgnoreValue(WordToken())], NodeType=WordNode)
+    rule = pr.Precedence(operand, [pr.Operator(WordToken('plus'), 10, ListNode)])
+    tokens = list(lexer.tokenize(' plus '.join(['word'] * 3000)))
+    parser = Parser(memoize=True, memo_window=4)
+    parser.set_root_rule(rule)
+    parser.parse(tokens)
+    assert parser.memo.evictions > 1000
+    assert len(parser.memo._offsets) <= 2 * len(parser.memo.table) + 1
@@ -0,0 +1,80 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, IncompleteError
+from parx import parser_rules as pr
+
+import pytest
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class OperatorToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NumberToken,   lr.Regex(r'[0-9]+')))
+lexer.add(lr.Attach(OperatorToken, lr.Regex(r'[-+*]')))
+
+P = Posinfo
+
+
+class NumberNode(Node):
+    pass
+
+
+class OperatorNode(Node):
+    pass
+
+
+class BinaryNode(Node):
+    pass
+
+
+number = pr.TokenSequence([lr.IgnoreValue(NumberToken())], NodeType=NumberNode)
+plus   = pr.TokenSequence([OperatorToken('+')], NodeType=OperatorNode)
+minus  = pr.TokenSequence([OperatorToken('-')], NodeType=OperatorNode)
+times  = pr.TokenSequence([OperatorToken('*')], NodeType=OperatorNode)
+
+# sum     := sum ('+' | '-') product | product
+# product := product '*' number | number
+product = pr.AnyOf([])
+product.rules += [pr.Sequence([product, times, number], NodeType=BinaryNode), number]
+expression = pr.AnyOf([])
+expression.rules += [
+    pr.Sequence([expression, pr.AnyOf([plus, minus]), product], NodeType=BinaryNode),
+    product,
+]
+
+parser = Parser(memoize=True)
+parser.set_root_rule(expression)
+
+
+def shape(node):
+    if isinstance(node, BinaryNode):
+        return [shape(child) for child in node.value]
+    return str(node.value[0])
+
+
+def test1():
+    output = parser.parse(lexer.tokenize('1 - 2 - 3 * 4 * 5 + 6'))
+    assert shape(output) == [[['1', '-', '2'], '-', [['3', '*', '4'], '*', '5']], '+', '6']
+    assert output._posinfo == P(1, 1)
+    assert output.value[2]._posinfo == P(1, 21)
+
+
+def test2():
+    assert shape(parser.parse(lexer.tokenize('7'))) == '7'
+    with pytest.raises(IncompleteError):
+        parser.parse(lexer.tokenize('1 + 2 +'))
+
+
+def test3():
+    windowed = Parser(memoize=True, memo_window=4)
+    windowed.set_root_rule(expression)
+    tokens = list(lexer.tokenize(' + '.join(['1 * 2'] * 50)))
+    assert windowed.parse(tokens) == parser.parse(tokens)
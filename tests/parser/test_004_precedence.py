@@ -0,0 +1,81 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, IncompleteError
+from parx import parser_rules as pr
+
+import pytest
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class OperatorToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NumberToken,   lr.Regex(r'[0-9]+')))
+lexer.add(lr.Attach(OperatorToken, lr.Regex(r'[-+*/^!]')))
+
+P = Posinfo
+
+
+class NumberNode(Node):
+    pass
+
+
+class UnaryNode(Node):
+    pass
+
+
+class BinaryNode(Node):
+    pass
+
+
+number = pr.TokenSequence([lr.IgnoreValue(NumberToken())], NodeType=NumberNode)
+expression = pr.Precedence(number, [
+    pr.Operator(OperatorToken('+'), 10, BinaryNode),
+    pr.Operator(OperatorToken('-'), 10, BinaryNode),
+    pr.Operator(OperatorToken('*'), 20, BinaryNode),
+    pr.Operator(OperatorToken('/'), 20, BinaryNode),
+    pr.Operator(OperatorToken('-'), 30, UnaryNode, kind=pr.PREFIX),
+    pr.Operator(OperatorToken('^'), 40, BinaryNode, associativity=pr.RIGHT),
+    pr.Operator(OperatorToken('!'), 50, UnaryNode, kind=pr.POSTFIX),
+])
+
+parser = Parser()
+parser.set_root_rule(expression)
+
+
+def shape(node):
+    if isinstance(node, NumberNode):
+        return str(node.value[0])
+    return [str(child) if isinstance(child, SimpleToken) else shape(child) for child in node.value]
+
+
+def parse(string):
+    return shape(parser.parse(lexer.tokenize(string)))
+
+
+def test1():
+    assert parse('1') == '1'
+    assert parse('1 - 2 - 3') == [['1', '-', '2'], '-', '3']
+    assert parse('1 + 2 * 3 - 4') == [['1', '+', ['2', '*', '3']], '-', '4']
+    assert parse('2 ^ 3 ^ 4') == ['2', '^', ['3', '^', '4']]
+    assert parse('- 2 ^ 2') == ['-', ['2', '^', '2']]
+    assert parse('- 2 * 3') == [['-', '2'], '*', '3']
+    assert parse('1 - - 3 !') == ['1', '-', ['-', ['3', '!']]]
+    assert parse('2 * 3 ! ^ 2') == ['2', '*', [['3', '!'], '^', '2']]
+
+
+def test2():
+    output = parser.parse(lexer.tokenize('1 +\n2 * 3'))
+    assert output._posinfo == P(1, 1)
+    assert output.value[2]._posinfo == P(2, 1)
+    with pytest.raises(IncompleteError):
+        parser.parse(lexer.tokenize('1 + 2 *'))
+    with pytest.raises(IncompleteError):
+        parser.parse(lexer.tokenize('1 2'))
@@ -0,0 +1,109 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, Rule, first_sets
+from parx import parser_rules as pr
+
+import pytest
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+class SemicolonToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NameToken,      lr.Regex(r'[a-z]+')))
+lexer.add(lr.Attach(KeywordToken,   lr.Regex(r'kw[0-9]+')), priority=1)
+lexer.add(lr.Attach(SemicolonToken, lr.String(';')))
+
+
+class StatementNode(Node):
+    pass
+
+
+class ProgramNode(Node):
+    pass
+
+
+class CountingSequence(pr.TokenSequence):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def match(self, tokens, offset):
+        self.calls += 1
+        return super().match(tokens, offset)
+
+
+class Custom(Rule):
+    # A rule with an unknown FIRST set, matching a single ';'
+    def match(self, tokens, offset):
+        if offset < len(tokens) and tokens[offset].content == ';':
+            return 1, StatementNode([tokens[offset]], pi=tokens[offset]._posinfo)
+        return 0, None
+
+
+def make_grammar(kinds):
+    statements = [
+        CountingSequence([KeywordToken('kw%d' % i), lr.IgnoreValue(NameToken())], NodeType=StatementNode)
+        for i in range(kinds)
+    ]
+    assignment = CountingSequence([lr.IgnoreValue(NameToken()), lr.IgnoreValue(NameToken())], NodeType=StatementNode)
+    statement = pr.AnyOf(statements + [assignment, Custom()])
+    return statements, pr.OneOrMore(statement, NodeType=ProgramNode)
+
+
+def test1():
+    statements, program = make_grammar(3)
+    sets = first_sets(program)
+    assert sets[statements[1]] == (frozenset({(KeywordToken, 'kw1')}), False)
+    assert sets[program.rule.rules[-2]] == (frozenset({(NameToken, None)}), False)
+    assert sets[program.rule] is None
+    optional = pr.Optional(statements[0])
+    sequence = pr.Sequence([optional, statements[2]], NodeType=StatementNode)
+    assert first_sets(sequence)[sequence] == (frozenset({(KeywordToken, 'kw0'), (KeywordToken, 'kw2')}), False)
+    assert first_sets(optional)[optional] == (frozenset({(KeywordToken, 'kw0')}), True)
+
+
+def test2():
+    statements, program = make_grammar(30)
+    source = 'kw7 foo ; kw29 bar a b kw0 baz'
+    tokens = list(lexer.tokenize(source))
+
+    parser = Parser()
+    parser.set_root_rule(program)
+    output = parser.parse(tokens)
+    assert len(output.value) == 5
+    # Each statement tried only the alternatives which may start with its first token
+    assert sum(statement.calls for statement in statements) == 3
+
+    # The result is the same as when every alternative is tried
+    reference_statements, reference_program = make_grammar(30)
+    assert reference_program.match(tokens, 0) == (len(tokens), output)
+    assert sum(statement.calls for statement in reference_statements) == 30 * 6
+
+
+def test3():
+    # Left-recursive grammar: list := list ',' name | name
+    class CommaToken(SimpleToken):
+        pass
+
+    class ListNode(Node):
+        pass
+
+    name = pr.TokenSequence([lr.IgnoreValue(NameToken())], NodeType=StatementNode)
+    comma = pr.TokenSequence([CommaToken(',')], NodeType=StatementNode)
+    names = pr.AnyOf([])
+    names.rules += [pr.Sequence([names, comma, name], NodeType=ListNode), name]
+    sets = first_sets(names)
+    assert sets[names] == (frozenset({(NameToken, None)}), False)
+    assert sets[names.rules[0]] == sets[names]
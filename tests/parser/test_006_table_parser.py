@@ -0,0 +1,148 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, IncompleteError, ParserError, SkipRule
+from parx.table_parser import TableParser
+from parx import parser_rules as pr
+
+import pytest
+import random
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class PunctuationToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NumberToken,      lr.Regex(r'[0-9]+')))
+lexer.add(lr.Attach(PunctuationToken, lr.Regex(r'[][,+]')))
+
+P = Posinfo
+
+
+class NumberNode(Node):
+    pass
+
+
+class ListNode(Node):
+    pass
+
+
+class ItemsNode(Node):
+    pass
+
+
+class ValueNode(Node):
+    pass
+
+
+# value := number | '[' [value (',' value)*] ']'
+number = pr.TokenSequence([lr.IgnoreValue(NumberToken())], NodeType=NumberNode)
+opening = pr.TokenSequence([PunctuationToken('[')], NodeType=Node)
+closing = pr.TokenSequence([PunctuationToken(']')], NodeType=Node)
+comma = pr.TokenSequence([PunctuationToken(',')], NodeType=Node)
+value = pr.AnyOf([], NodeType=ValueNode)
+rest = pr.OneOrMore(pr.Sequence([comma, value], NodeType=ItemsNode), NodeType=ItemsNode)
+items = pr.Sequence([value, pr.Optional(rest)], NodeType=ItemsNode)
+value.rules += [number, pr.Sequence([opening, pr.Optional(items), closing], NodeType=ListNode)]
+
+
+def make_parsers(rule):
+    reference = Parser()
+    reference.set_root_rule(rule)
+    table = TableParser()
+    table.set_root_rule(rule)
+    return reference, table
+
+
+def test1():
+    reference, table = make_parsers(value)
+    assert table.compile() == {}
+    for string in ['1', '[]', '[1, [2, 3], [[]], 4]', '[[1], [2, [3, [4]]]]']:
+        tokens = list(lexer.tokenize(string))
+        assert table.parse(tokens) == reference.parse(tokens)
+        assert table.used_tables
+    with pytest.raises(IncompleteError):
+        table.parse(lexer.tokenize('[1] 2'))
+
+
+def test2():
+    # Deep nesting does not hit the recursion limit
+    reference, table = make_parsers(value)
+    output = table.parse(lexer.tokenize('[' * 5000 + ']' * 5000))
+    depth = 1
+    while output.value.value[1] is not None:
+        output = output.value.value[1].value[0]
+        depth += 1
+    assert depth == 5000
+
+
+def test3():
+    # Backtracking falls back to the combinator engine
+    pair = pr.TokenSequence([lr.IgnoreValue(NumberToken()), PunctuationToken('+')], NodeType=Node)
+    rule = pr.Sequence([pr.Optional(pair), number], NodeType=ListNode)
+    reference, table = make_parsers(rule)
+    assert table.compile() == {}
+
+    tokens = list(lexer.tokenize('1 + 2'))
+    assert table.parse(tokens) == reference.parse(tokens)
+    assert table.used_tables
+
+    tokens = list(lexer.tokenize('2'))
+    assert table.parse(tokens) == reference.parse(tokens) == ListNode([None, NumberNode(tokens, pi=P(1, 1))], pi=P(1, 1))
+    assert not table.used_tables
+
+
+def test4():
+    # LL(1) conflicts and left recursion block the compilation
+    conflict = pr.AnyOf([number, pr.Sequence([number, comma], NodeType=ListNode)])
+    reference, table = make_parsers(conflict)
+    assert list(table.compile()) == [conflict]
+    tokens = list(lexer.tokenize('1 ,'))
+    assert table.parse(tokens) == reference.parse(tokens)
+    assert not table.used_tables
+
+    recursive = pr.Sequence([comma], NodeType=ListNode)
+    recursive.rules = [pr.Optional(comma), recursive]
+    reference, table = make_parsers(recursive)
+    assert table.compile() == {recursive: 'left recursion'}
+
+
+def random_rule(rng, depth):
+    # A random tree-shaped grammar over the number and punctuation tokens
+    NodeType = rng.choice([ListNode, ItemsNode])
+    kind = rng.random() if depth > 0 else 0
+    if kind < 0.3:
+        patterns = [NumberToken('1'), NumberToken('2'), lr.IgnoreValue(NumberToken()), PunctuationToken(',')]
+        return pr.TokenSequence([rng.choice(patterns) for _ in range(rng.randint(1, 2))], NodeType=NodeType)
+    if kind < 0.5:
+        return pr.Sequence([random_rule(rng, depth - 1) for _ in range(rng.randint(1, 3))], NodeType=NodeType)
+    if kind < 0.7:
+        return pr.AnyOf([random_rule(rng, depth - 1) for _ in range(rng.randint(1, 3))],
+                        NodeType=rng.choice([None, NodeType]))
+    if kind < 0.85:
+        return pr.Optional(random_rule(rng, depth - 1), NodeType=rng.choice([None, NodeType]))
+    return pr.OneOrMore(random_rule(rng, depth - 1), NodeType=NodeType)
+
+
+def outcome(parser, tokens):
+    try:
+        return parser.parse(tokens)
+    except (ParserError, SkipRule) as error:
+        # A skipped root Optional raises SkipRule
+        return type(error)
+
+
+def test5():
+    # The result is always the same as the one of Parser
+    rng = random.Random(1)
+    for _ in range(500):
+        reference, table = make_parsers(random_rule(rng, rng.randint(1, 4)))
+        for _ in range(4):
+            tokens = list(lexer.tokenize(' '.join(rng.choice(['1', '2', ',']) for _ in range(rng.randint(0, 6)))))
+            assert outcome(table, tokens) == outcome(reference, tokens)
@@ -0,0 +1,146 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, TokenStream, ReleasedTokenError, IncompleteError
+from parx import parser_rules as pr
+
+import pytest
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+class PunctuationToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NameToken,        lr.Regex(r'[a-z]+')))
+lexer.add(lr.Attach(PunctuationToken, lr.Regex(r'[;=+]')))
+
+P = Posinfo
+
+
+class StatementNode(Node):
+    pass
+
+
+class ProgramNode(Node):
+    pass
+
+
+class BufferTracking(pr.TokenSequence):
+    # Records the largest number of tokens buffered by the stream
+    largest = 0
+
+    def match(self, tokens, offset):
+        if type(tokens) is TokenStream:
+            BufferTracking.largest = max(BufferTracking.largest, len(tokens._buffer) - tokens._start)
+        return super().match(tokens, offset)
+
+
+name = lr.IgnoreValue(NameToken())
+semicolon = PunctuationToken(';')
+statement = pr.AnyOf([
+    BufferTracking([name, PunctuationToken('='), name, semicolon], NodeType=StatementNode),
+    BufferTracking([name, PunctuationToken('='), name, PunctuationToken('+'), name, semicolon], NodeType=StatementNode),
+    BufferTracking([name, semicolon], NodeType=StatementNode),
+])
+program = pr.OneOrMore(statement, NodeType=ProgramNode)
+
+parser = Parser()
+parser.set_root_rule(program)
+
+
+def test1():
+    stream = TokenStream(iter(range(10)))
+    assert stream[3] == 3
+    assert stream[2:5] == [2, 3, 4]
+    assert stream[8:20] == [8, 9]
+    with pytest.raises(IndexError):
+        stream[10]
+    stream.pin(4)
+    stream.release(6)
+    assert stream.released == 4
+    assert stream[4] == 4
+    stream.unpin(4)
+    stream.release(6)
+    assert stream.released == 6
+    with pytest.raises(ReleasedTokenError):
+        stream[5]
+    assert len(stream) == 10
+
+
+def test2():
+    source = 'a = b; c; d = e + f; ' * 1000
+    BufferTracking.largest = 0
+    output = parser.parse(lexer.tokenize(source))
+    assert output == parser.parse(list(lexer.tokenize(source)))
+    assert len(output.value) == 3000
+    assert BufferTracking.largest <= 6
+
+
+def test3():
+    with pytest.raises(IncompleteError) as error:
+        parser.parse(lexer.tokenize('a = b; c; d = ;'))
+    assert error.value.token == NameToken('d', P(1, 11))
+
+    # The root rule fails after the statements were committed: the sequence keeps its tokens, so the error is
+    # the same as for a list
+    terminated = Parser()
+    terminated.set_root_rule(pr.Sequence(
+        [program, pr.TokenSequence([NameToken('end')], NodeType=StatementNode)],
+        NodeType=ProgramNode,
+    ))
+    assert len(terminated.parse(lexer.tokenize('a; b; end')).value) == 2
+    with pytest.raises(IncompleteError) as error:
+        terminated.parse(lexer.tokenize('a; b;'))
+    assert error.value.token == NameToken('a', P(1, 1))
+
+
+def test4():
+    memoized = Parser(memoize=True, memo_window=16)
+    memoized.set_root_rule(program)
+    source = 'a = b + c; d; ' * 100
+    assert memoized.parse(lexer.tokenize(source)) == parser.parse(list(lexer.tokenize(source)))
+
+
+def test5():
+    # A nested OneOrMore must not release the tokens of an outer iteration which fails later
+    a = pr.TokenSequence([NameToken('a')], NodeType=StatementNode)
+    b = pr.TokenSequence([NameToken('b')], NodeType=StatementNode)
+    nested = Parser()
+    nested.set_root_rule(pr.Sequence([
+        pr.OneOrMore(pr.Sequence([pr.OneOrMore(a, NodeType=ProgramNode), b], NodeType=StatementNode),
+                     NodeType=ProgramNode),
+        a,
+    ], NodeType=ProgramNode))
+    source = 'a a b a'
+    assert nested.parse(lexer.tokenize(source)) == nested.parse(list(lexer.tokenize(source)))
+
+
+def test6():
+    # Errors are the same for lists and streams, also when AnyOf drops the results of the alternatives which
+    # committed tokens (because of an ambiguous or a longer match)
+    a = pr.TokenSequence([NameToken('a')], NodeType=StatementNode)
+    b = pr.TokenSequence([NameToken('b')], NodeType=StatementNode)
+    many = pr.OneOrMore(a, NodeType=ProgramNode)
+    grammars = [
+        (pr.AnyOf([many, pr.OneOrMore(a, NodeType=StatementNode)]), 'a a'),
+        (pr.AnyOf([many, pr.Sequence([a, a, a], NodeType=ProgramNode)]), 'a a a b'),
+        (pr.AnyOf([pr.Sequence([a, a, a, b], NodeType=ProgramNode), many]), 'a a a b'),
+        (pr.AnyOf([pr.Sequence([many, b], NodeType=ProgramNode), b]), 'a a a'),
+        (pr.AnyOf([pr.OneOrMore(b, NodeType=ProgramNode), many, pr.OneOrMore(a, NodeType=StatementNode)]), 'a a a'),
+    ]
+    for rule, source in grammars:
+        checked = Parser()
+        checked.set_root_rule(rule)
+        errors = []
+        for tokens in [list(lexer.tokenize(source)), lexer.tokenize(source)]:
+            try:
+                errors.append(checked.parse(tokens))
+            except IncompleteError as error:
+                errors.append(error.token)
+        assert errors[0] == errors[1], source
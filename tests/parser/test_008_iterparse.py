@@ -0,0 +1,66 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, IncompleteError
+from parx import parser_rules as pr
+
+import pytest
+
+
+class WordToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(WordToken, lr.Regex(r'[a-z]+')))
+
+P = Posinfo
+
+
+class RecordNode(Node):
+    pass
+
+
+class FileNode(Node):
+    pass
+
+
+record = pr.TokenSequence([WordToken('record'), lr.IgnoreValue(WordToken())], NodeType=RecordNode)
+records = pr.OneOrMore(record, NodeType=FileNode)
+
+parser = Parser()
+parser.set_root_rule(records)
+
+
+def counting(tokens, counter):
+    for token in tokens:
+        counter[0] += 1
+        yield token
+
+
+def test1():
+    source = 'record foo\nrecord bar\n' * 500
+    counter = [0]
+    nodes = parser.iterparse(counting(lexer.tokenize(source), counter))
+    first = next(nodes)
+    assert first == RecordNode([WordToken('record', P(1, 1)), WordToken('foo', P(1, 8))], pi=P(1, 1))
+    assert counter[0] <= 4
+    rest = list(nodes)
+    assert len(rest) == 999
+    assert [first] + rest == parser.parse(lexer.tokenize(source)).value
+
+
+def test2():
+    nodes = parser.iterparse(lexer.tokenize('record a record b oops'))
+    assert len([next(nodes), next(nodes)]) == 2
+    with pytest.raises(IncompleteError):
+        next(nodes)
+    assert list(parser.iterparse([])) == []
+
+
+def test3():
+    # Other root rules yield the root node
+    single = Parser()
+    single.set_root_rule(record)
+    assert list(single.iterparse(lexer.tokenize('record a'))) == [single.parse(lexer.tokenize('record a'))]
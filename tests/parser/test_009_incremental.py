@@ -0,0 +1,159 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken, NoMatchingTokenError
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, IncompleteError
+from parx.incremental import Document
+from parx import parser_rules as pr
+
+import pytest
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+class PunctuationToken(SimpleToken):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NameToken,        lr.Regex(r'[a-z]+')))
+lexer.add(lr.Attach(PunctuationToken, lr.Regex(r'[;=+]')))
+
+P = Posinfo
+
+
+class StatementNode(Node):
+    pass
+
+
+class ProgramNode(Node):
+    pass
+
+
+name = lr.IgnoreValue(NameToken())
+statement = pr.AnyOf([
+    pr.TokenSequence([name, PunctuationToken('='), name, PunctuationToken(';')], NodeType=StatementNode),
+    pr.TokenSequence([name, PunctuationToken('='), name, PunctuationToken('+'), name, PunctuationToken(';')],
+                     NodeType=StatementNode),
+])
+program = pr.OneOrMore(statement, NodeType=ProgramNode)
+
+parser = Parser()
+parser.set_root_rule(program)
+
+
+def check(document):
+    assert document.tokens == list(lexer.tokenize(document.text))
+    assert document.tree == parser.parse(lexer.tokenize(document.text))
+
+
+def test1():
+    text = ''.join('v%s = a + b;\n' % ('x' * (i % 5)) for i in range(200)).replace('v', 'var')
+    document = Document(lexer, parser, text)
+    check(document)
+
+    # Extend a name in the middle
+    offset = text.index('\n', 1000)
+    document.edit(offset - 2, 0, 'c')
+    check(document)
+    assert document.relexed == 1
+    assert document.memo.misses < 20
+
+    # Replace a statement with a shorter one
+    start = document.text.index('var', 500)
+    end = document.text.index(';', start) + 1
+    document.edit(start, end - start, 'q = r;')
+    check(document)
+    assert document.relexed == 4
+    assert document.memo.misses < 20
+
+    # Insert a new statement at the start and append one at the end
+    document.edit(0, 0, 'first = x;\n')
+    check(document)
+    document.edit(len(document.text), 0, 'last = y;')
+    check(document)
+    assert document.tree.value[-1].value[0] == NameToken('last', P(202, 1))
+
+
+def test2():
+    document = Document(lexer, parser, 'a = b;\nc = d;')
+    with pytest.raises(IncompleteError):
+        document.edit(12, 0, ' + ')
+    assert document.tree is None
+    document.edit(15, 0, 'e')
+    check(document)
+
+    with pytest.raises(NoMatchingTokenError):
+        document.edit(0, 0, '?')
+    document.edit(0, 1, '')
+    check(document)
+
+
+def test3():
+    text = ''.join('v%s = a + b;\n' % ('x' * (i % 5)) for i in range(2000))
+    document = Document(lexer, parser, text)
+    tree = document.tree
+
+    # Only the edited statement is matched again, the other ones are shared with the previous tree
+    offset = document.text.index('a + b', len(text) // 2)
+    document.edit(offset, 5, 'c')
+    check(document)
+    assert document.relexed == 1
+    assert document.memo.misses < 20
+    changed = [i for i, node in enumerate(document.tree.value) if node is not tree.value[i]]
+    assert changed == [1000]
+
+    # The tokens after an edit move with it, including the ones of the old tree
+    last = tree.value[-1].value[0]
+    document.edit(0, 0, 'a = b;\n\n')
+    check(document)
+    assert last._posinfo == P(2002, 1)
+    assert last._posinfo.start == len(document.text) - len('vxxxx = a + b;\n')
+
+    # Edits far from each other
+    for offset in (len(document.text) - 2, 3, len(document.text) // 3):
+        document.edit(offset, 0, ' ')
+        check(document)
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class ExpressionNode(Node):
+    pass
+
+
+def test4():
+    # Items which are matched with left recursion, and a root rule which is not repeated
+    lexer = Lexer()
+    lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+    lexer.add(lr.Attach(NumberToken,      lr.Regex(r'[0-9]+')))
+    lexer.add(lr.Attach(PunctuationToken, lr.Regex(r'[;+]')))
+
+    number = pr.TokenSequence([lr.IgnoreValue(NumberToken())], NodeType=ExpressionNode)
+    expression = pr.AnyOf([])
+    expression.rules += [
+        pr.Sequence([expression, pr.TokenSequence([PunctuationToken('+')], NodeType=Node), number],
+                    NodeType=ExpressionNode),
+        number,
+    ]
+    statement = pr.Sequence([expression, pr.Optional(pr.TokenSequence([PunctuationToken(';')], NodeType=Node))],
+                            NodeType=StatementNode)
+    edits = [(5, 0, ' + 4'), (9, 0, ';'), (10, 2, ''), (0, 1, '7'), (9, 1, ' +'), (2, 4, ''), (1, 0, ';')]
+    for root in (pr.OneOrMore(statement, NodeType=ProgramNode), statement):
+        parser = Parser(memoize=True)
+        parser.set_root_rule(root)
+        document = Document(lexer, parser, '1 + 2 + 3')
+        for offset, removed, inserted in edits:
+            text = document.text[:offset] + inserted + document.text[offset + removed:]
+            try:
+                expected = parser.parse(list(lexer.tokenize(text)))
+            except IncompleteError:
+                with pytest.raises(IncompleteError):
+                    document.edit(offset, removed, inserted)
+            else:
+                assert document.edit(offset, removed, inserted) == expected
+            assert document.tokens == list(lexer.tokenize(text))
@@ -0,0 +1,54 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken, NoMatchingTokenError
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, IncompleteError
+from parx.batch import Grammar, parse_many
+from parx import parser_rules as pr
+
+import pickle
+import pytest
+
+
+class WordToken(SimpleToken):
+    pass
+
+
+class HelloNode(Node):
+    pass
+
+
+class GreetingListNode(Node):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \t\n\r]+'), ignore=True)
+lexer.add(lr.Attach(WordToken, lr.Regex(r'[a-zA-Z]+')))
+
+hello = pr.TokenSequence([WordToken('Hello'), lr.IgnoreValue(WordToken())], NodeType=HelloNode)
+grammar = Grammar(lexer, pr.OneOrMore(hello, NodeType=GreetingListNode))
+
+P = Posinfo
+
+
+def test1():
+    error = pickle.loads(pickle.dumps(NoMatchingTokenError(data='abc', offset=1)))
+    assert (error.data, error.offset) == ('abc', 1)
+    error = pickle.loads(pickle.dumps(IncompleteError(WordToken('x', P(1, 2)))))
+    assert error.token == WordToken('x', P(1, 2))
+    assert str(error) == 'x'
+
+
+def test2(tmp_path):
+    path = tmp_path / 'greetings.txt'
+    path.write_text('Hello file\nHello again')
+    sources = ['Hello world'] * 40 + [path, 'Hello 42', 'Hello world world']
+    results = parse_many(grammar, sources, workers=2, chunksize=8)
+    assert [result.source for result in results] == sources
+    assert all(result.node == grammar.parse('Hello world') for result in results[:40])
+    assert results[40].node.value[1].value[1] == WordToken('again', P(2, 7))
+    assert isinstance(results[41].error, NoMatchingTokenError)
+    assert results[41].error.offset == 6
+    assert isinstance(results[42].error, IncompleteError)
+    assert results[42].error.token == WordToken('world', P(1, 13))
+    assert results[42].node is None
@@ -0,0 +1,75 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, SimpleToken, TokenArray
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, TokenRange
+from parx import parser_rules as pr
+
+import pickle
+import pytest
+
+
+class WordToken(SimpleToken):
+    pass
+
+
+class PairNode(Node):
+    pass
+
+
+class ListNode(Node):
+    pass
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(WordToken, lr.Regex(r'[a-z]+')))
+
+pair = pr.TokenSequence([lr.IgnoreValue(WordToken()), lr.IgnoreValue(WordToken())], NodeType=PairNode)
+pairs = pr.OneOrMore(pair, NodeType=ListNode)
+
+P = Posinfo
+
+
+def test1():
+    tokens = list('abcdef')
+    view = TokenRange(tokens, 1, 4)
+    assert len(view) == 3
+    assert list(view) == ['b', 'c', 'd']
+    assert view[0] == 'b' and view[-1] == 'd'
+    assert view[1:] == ['c', 'd']
+    assert view == ['b', 'c', 'd'] and ['b', 'c', 'd'] == view
+    assert view != ['b', 'c'] and view == ('b', 'c', 'd')
+    assert view == TokenRange(list('xbcd'), 1, 4)
+    with pytest.raises(IndexError):
+        view[3]
+    # Concatenation returns lists
+    assert view + ['e'] == ['b', 'c', 'd', 'e'] and type(view + ['e']) is list
+    assert ('a',) + view == ['a', 'b', 'c', 'd'] and ['a'] + view == ['a', 'b', 'c', 'd']
+    assert view + view == list('bcdbcd')
+
+
+def test2():
+    parser = Parser()
+    parser.set_root_rule(pairs)
+    tokens = list(lexer.tokenize('a b c d'))
+    output = parser.parse(tokens)
+    # The nodes refer to the token list instead of copies
+    assert type(output.value[1].value) is TokenRange
+    assert output.value[1].value.tokens is tokens
+    assert output.value[1] == PairNode([WordToken('c', P(1, 5)), WordToken('d', P(1, 7))], pi=P(1, 5))
+    # Streams release the tokens, so the nodes hold lists
+    assert type(parser.parse(lexer.tokenize('a b c d')).value[0].value) is list
+
+
+def test3():
+    # With memoization the nodes refer to the tokens passed in, not to the lists carrying the packrat cache
+    parser = Parser(memoize=True)
+    parser.set_root_rule(pairs)
+    tokens = list(lexer.tokenize('a b c d'))
+    output = parser.parse(tokens)
+    assert output.value[1].value.tokens is tokens
+    array = lexer.tokenize_array('a b c d')
+    output = parser.parse(array)
+    assert output.value[1].value.tokens is array
+    copy = pickle.loads(pickle.dumps(output))
+    assert copy == output and copy.value[1].value.tokens.memo is None
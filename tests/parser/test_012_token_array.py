@@ -0,0 +1,156 @@
+from parx.posinfo import Posinfo
+from parx.lexer import Lexer, Rule, SimpleToken, Token, TokenArray, NoMatchingTokenError
+from parx import lexer_rules as lr
+from parx.parser import Parser, Node, TokenRange, IncompleteError
+from parx import parser_rules as pr
+
+import pickle
+import pytest
+
+
+class NumberToken(SimpleToken):
+    pass
+
+
+class NameToken(SimpleToken):
+    pass
+
+
+class KeywordToken(SimpleToken):
+    pass
+
+
+class OperatorToken(SimpleToken):
+    pass
+
+
+class HexToken(Token):
+    def __init__(self, value, pi=None):
+        super().__init__(pi)
+        self.value = value
+
+    def __eq__(self, other):
+        return super().__eq__(other) and self.value == other.value
+
+
+class HexRule(Rule):
+    # A rule with a custom make_token(), whose tokens are stored as objects
+    def get_length(self, data, offset):
+        return 4 if data.startswith('0x', offset) else 0
+
+    def make_token(self, data, offset, length, pi):
+        return HexToken(int(data[offset : offset + length], 16), pi=pi)
+
+
+lexer = Lexer()
+lexer.add(lr.Regex(r'[ \n]+'), ignore=True)
+lexer.add(lr.Attach(NumberToken,   lr.Regex(r'[0-9]+')))
+lexer.add(lr.Attach(NameToken,     lr.Regex(r'[a-z]+')))
+lexer.add(lr.Attach(KeywordToken,  lr.String('let')), priority=1)
+lexer.add(lr.Attach(OperatorToken, lr.StringSet(['=', '+', ';'])))
+lexer.add(HexRule(), priority=2)
+
+P = Posinfo
+
+
+class LetNode(Node):
+    pass
+
+
+class ProgramNode(Node):
+    pass
+
+
+let = pr.TokenSequence([
+    KeywordToken('let'), lr.IgnoreValue(NameToken()), OperatorToken('='), lr.IgnoreValue(NumberToken()),
+    OperatorToken(';'),
+], NodeType=LetNode)
+hex_let = pr.TokenSequence([
+    KeywordToken('let'), lr.IgnoreValue(NameToken()), OperatorToken('='), lr.IgnoreValue(HexToken(0)),
+    OperatorToken(';'),
+], NodeType=LetNode)
+program = pr.OneOrMore(pr.AnyOf([let, hex_let]), NodeType=ProgramNode)
+
+
+def test1():
+    source = 'let x = 1;\nlet yy = 0x1f; let z = 22;'
+    tokens = lexer.tokenize_array(source)
+    assert type(tokens) is TokenArray
+    assert list(tokens) == list(lexer.tokenize(source))
+    assert tokens[-2] == NumberToken('22', P(2, 24))
+    assert tokens[8] == HexToken(31, P(2, 10))
+    assert list(tokens.objects) == [8]
+    assert tokens.content(1) == 'x'
+    assert tokens.kinds[0] == KeywordToken._kind_code
+    assert tokens.kinds.itemsize + tokens.starts.itemsize + tokens.ends.itemsize == 18
+    with pytest.raises(NoMatchingTokenError):
+        lexer.tokenize_array('let ?')
+
+
+@pytest.mark.parametrize('memoize', [False, True])
+def test2(memoize):
+    parser = Parser(memoize=memoize)
+    parser.set_root_rule(program)
+    source = 'let x = 1;\nlet yy = 0x1f; let z = 22;'
+    output = parser.parse(lexer.tokenize_array(source))
+    assert output == parser.parse(list(lexer.tokenize(source)))
+    assert type(output.value[1].value) is TokenRange
+    assert output.value[1]._posinfo == P(2, 1)
+    with pytest.raises(IncompleteError):
+        parser.parse(lexer.tokenize_array('let x = 1; let'))
+
+
+class TaggedToken(SimpleToken):
+    # A user token class with its own `kind` attribute
+    def __init__(self, content=None, pi=None):
+        super().__init__(content, pi)
+        self.kind = 'tag'
+
+
+def test3():
+    rule = pr.TokenSequence([TaggedToken('a')], NodeType=LetNode)
+    assert rule.match([TaggedToken('a', P(1, 1))], 0)[0] == 1
+
+    # Kind codes are not pickled, they may differ in another process
+    sequence = pr.TokenSequence([KeywordToken('let'), lr.IgnoreValue(NameToken())], NodeType=LetNode)
+    expected = sequence._kinds
+    sequence._kinds = [(12345, None), (12346, None)]
+    clone = pickle.loads(pickle.dumps(sequence))
+    assert clone._kinds == expected
+
+    tokens = lexer.tokenize_array('let x = 0x1f;')
+    state = tokens.__getstate__()
+    classes, indices = state['kinds']
+    assert [classes[index] for index in indices] == [KeywordToken, NameToken, OperatorToken, HexToken, OperatorToken]
+    assert list(pickle.loads(pickle.dumps(tokens))) == list(tokens)
+
+
+class Kw(SimpleToken):
+    pass
+
+
+class KwString(lr.String):
+    def make_token(self, data, offset, length, pi):
+        return Kw(data[offset : offset + length], pi=pi)
+
+
+class KwStringSet(lr.StringSet):
+    def make_token(self, data, offset, length, pi):
+        return Kw(data[offset : offset + length], pi=pi)
+
+
+class KwAttach(lr.Attach):
+    def make_token(self, data, offset, length, pi):
+        return Kw(data[offset : offset + length], pi=pi)
+
+
+def test4():
+    # Tokens of rules overriding make_token() are stored as objects, the same as tokenize() returns them
+    for rule in [KwString('if'), KwStringSet(['if', 'else']), KwAttach(KeywordToken, lr.String('if'))]:
+        lexer_ = Lexer()
+        lexer_.add(lr.Regex(r' +'), ignore=True)
+        lexer_.add(rule)
+        source = 'if if'
+        tokens = lexer_.tokenize_array(source)
+        assert list(tokens) == list(lexer_.tokenize(source)) == [Kw('if', P(1, 1)), Kw('if', P(1, 4))]
+        assert [type(token) for token in tokens] == [Kw, Kw]
@@ -0,0 +1,33 @@
+import pytest
+
+# The benchmarks are not installed with the package, they are only available from a checkout
+grammars = pytest.importorskip('benchmarks.grammars')
+run = pytest.importorskip('benchmarks.run')
+
+
+@pytest.mark.parametrize('name', sorted(grammars.GRAMMARS))
+def test1(name):
+    # The inputs are reproducible and accepted by the grammars, with each engine
+    grammar = grammars.GRAMMARS[name]
+    text = grammar.generate(200, seed=1)
+    assert text == grammar.generate(200, seed=1)
+    tokens = list(grammar.lexer.tokenize(text))
+    assert 150 <= len(tokens) <= 300
+    expected = None
+    for engine in sorted(run.ENGINES):
+        parser = run.ENGINES[engine]()
+        parser.set_root_rule(grammar.root_rule)
+        node = parser.parse(tokens)
+        assert run.count_nodes(node) > 0
+        assert expected is None or node == expected
+        expected = node
+
+
+def test2():
+    results = [
+        {'tokens': 100,  'lex_seconds': 0.01, 'parse_seconds': 0.02},
+        {'tokens': 1000, 'lex_seconds': 0.1,  'parse_seconds': 2.0},
+    ]
+    assert run.scaling_exponent(results, 'lex_seconds') == pytest.approx(1)
+    assert run.scaling_exponent(results, 'parse_seconds') == pytest.approx(2)
+    assert run.scaling_exponent(results[:1], 'lex_seconds') is None